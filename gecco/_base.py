@@ -83,7 +83,7 @@ class Table(Dumpable, Loadable):
         if data is not None:
             for column in columns:
                 if column.name not in data.columns:
-                    data = data.with_columns(polars.lit(column.default).alias(column.name))
+                    data = data.with_columns(polars.lit(column.default, dtype=column.dtype).alias(column.name))
             self.data = data
         else:
             self.data = polars.DataFrame([
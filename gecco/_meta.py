@@ -7,6 +7,7 @@ import functools
 import importlib
 import locale
 import operator
+import os
 import typing
 from multiprocessing.pool import Pool
 from typing import Any, Callable, Iterable, Iterator, List, Tuple, Union, Optional, Type
@@ -111,3 +112,33 @@ def patch_locale(name: str) -> Iterator[None]:
         yield
     finally:
         locale.setlocale(locale.LC_TIME, lc)
+
+
+def umask() -> int:
+    """Get the file mode creation mask of the current process.
+    """
+    # read the mask from `/proc` when possible, since `os.umask` can only
+    # read the mask by changing it, which is not safe with several threads
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    mask = os.umask(0o022)
+    os.umask(mask)
+    return mask
+
+
+def make_shareable(path: str) -> None:
+    """Give a file or folder the permissions of a newly created one.
+
+    Files created with `tempfile` are only accessible to their owner,
+    which prevents sharing cache files between users once they are
+    moved into place. This sets the mode of ``path`` to the default mode
+    of a new file or folder, as restricted by the `umask` of the process.
+
+    """
+    mode = 0o777 if os.path.isdir(path) else 0o666
+    os.chmod(path, mode & ~umask())
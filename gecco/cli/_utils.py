@@ -5,6 +5,8 @@ import contextlib
 import functools
 import io
 import logging
+import multiprocessing
+import multiprocessing.pool
 import typing
 import warnings
 from types import ModuleType, TracebackType
@@ -159,6 +161,23 @@ def guess_sequences_format(path: str) -> Optional[str]:
         return None
 
 
+def process_pool(
+    processes: Optional[int] = None,
+    *args: Any,
+    **kwargs: Any,
+) -> multiprocessing.pool.Pool:
+    """Create a process pool that is safe to start from a threaded program.
+
+    Forking copies the locks held by the other threads of the process
+    (such as the thread refreshing the progress bars), so the workers
+    are started from a fresh server process when the platform allows it.
+
+    """
+    methods = multiprocessing.get_all_start_methods()
+    method = "forkserver" if "forkserver" in methods else "spawn"
+    return multiprocessing.get_context(method).Pool(processes, *args, **kwargs)
+
+
 def in_context(func: "_F") -> "_F":
 
     @functools.wraps(func)
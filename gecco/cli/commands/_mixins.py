@@ -14,19 +14,22 @@ from typing import (
     Collection,
     Iterator,
     Iterable,
+    Mapping,
     Optional,
     List,
     Union
 )
 
-from .._utils import ProgressReader, guess_sequences_format
+from .._utils import ProgressReader, guess_sequences_format, process_pool
 from ._base import Command, CommandExit, InvalidArgument
 
 if typing.TYPE_CHECKING:
     from Bio.SeqRecord import SeqRecord
+    from ..._base import Table
     from ...model import Cluster, Gene, FeatureTable, GeneTable, ClusterTable
     from ...hmmer import HMM
     from ...types import TypeClassifier
+    from ...crf import ClusterCRF
 
 
 class SequenceLoaderMixin(Command):
@@ -34,8 +37,13 @@ class SequenceLoaderMixin(Command):
     format: Optional[str]
     genome: str
 
-    def _load_sequences(self) -> Iterator["SeqRecord"]:
+    def _load_sequences(
+        self,
+        cds_feature: Optional[str] = None,
+        locus_tag: str = "locus_tag",
+    ) -> Iterator["SeqRecord"]:
         from Bio import SeqIO
+        from ...orf import CDSFinder
 
         try:
             # guess format or use the one given in CLI
@@ -56,7 +64,15 @@ class SequenceLoaderMixin(Command):
             n = 0
             self.info("Loading", "sequences from genomic file", repr(self.genome), level=1)
             with ProgressReader(open(self.genome, "rb"), self.progress, task, scale) as f:
-                for record in SeqIO.parse(io.TextIOWrapper(f), format):  # type: ignore
+                # only read the features needed to extract genes from
+                # annotated records, which is much faster than SeqIO
+                if cds_feature is not None and format in ("genbank", "gb", "embl"):
+                    self.info("Using", f"fast reader for record features named {cds_feature!r}", level=2)
+                    finder = CDSFinder(feature=cds_feature, locus_tag=locus_tag)
+                    records = finder.parse(io.TextIOWrapper(f), format)  # type: ignore
+                else:
+                    records = SeqIO.parse(io.TextIOWrapper(f), format)  # type: ignore
+                for record in records:
                     yield record
                     n += 1
         except FileNotFoundError as err:
@@ -68,6 +84,64 @@ class SequenceLoaderMixin(Command):
         else:
             self.success("Found", n, "sequences", level=1)
 
+    def _load_sequence_index(self) -> Mapping[str, "SeqRecord"]:
+        from Bio import SeqIO
+
+        try:
+            # random access to records is only supported for FASTA files
+            if self.format is not None:
+                format: Optional[str] = self.format.lower()
+            else:
+                self.info("Detecting", "sequence format from file contents", level=2)
+                format = guess_sequences_format(self.genome)
+            if format != "fasta":
+                raise ValueError(f"Indexed sequences must be in FASTA format, found {format!r}")
+            # index the sequences without loading them
+            self.info("Indexing", "sequences from genomic file", repr(self.genome), level=1)
+            index = SeqIO.index(self.genome, "fasta")
+        except FileNotFoundError as err:
+            self.error("Could not find input file:", repr(self.genome))
+            raise CommandExit(err.errno) from err
+        except ValueError as err:
+            self.error("Failed to index sequences:", err)
+            raise CommandExit(getattr(err, "errno", 1)) from err
+        else:
+            self.success("Indexed", len(index), "sequences", level=1)
+            return index
+
+    def _load_sequence_chunks(
+        self,
+        chunk_size: int,
+        cds_feature: Optional[str] = None,
+        locus_tag: str = "locus_tag",
+        sequence_ids: Optional[List[str]] = None,
+    ) -> Iterator[List["SeqRecord"]]:
+        # only read the requested sequences from an index of the input if
+        # given identifiers, checking they all exist before the first chunk
+        if sequence_ids is None:
+            records: Iterable["SeqRecord"] = self._load_sequences(cds_feature, locus_tag)
+        else:
+            index = self._load_sequence_index()
+            missing = next((seq_id for seq_id in sequence_ids if seq_id not in index), None)
+            if missing is not None:
+                self.error("Failed to extract genes:", f"Sequence {missing!r} not found in records")
+                raise CommandExit(1)
+            records = map(index.__getitem__, sequence_ids)
+        # group consecutive records until they span at least `chunk_size`
+        # nucleotides, so that chunks are bounded by sequence length rather
+        # than by number of contigs
+        chunk: List["SeqRecord"] = []
+        length = 0
+        for record in records:
+            chunk.append(record)
+            length += len(record.seq)
+            if length >= chunk_size:
+                yield chunk
+                chunk = []
+                length = 0
+        if chunk:
+            yield chunk
+
 
 class TableLoaderMixin(Command):
 
@@ -180,29 +254,24 @@ class OutputWriterMixin(Command):
     def _write_feature_table(self, genes: List["Gene"]) -> None:
         from ...model import FeatureTable
 
-        base, _ = os.path.splitext(os.path.basename(self.genome))
-        pred_out = os.path.join(self.output_dir, f"{base}.features.tsv")
-        self.info("Writing", "feature table to", repr(pred_out), level=1)
-        with open(pred_out, "wb") as f:
-            FeatureTable.from_genes(genes).dump(f)
+        self._write_table(FeatureTable.from_genes(genes), "features", "feature table")
 
     def _write_genes_table(self, genes: List["Gene"]) -> None:
         from ...model import GeneTable
 
-        base, _ = os.path.splitext(os.path.basename(self.genome))
-        pred_out = os.path.join(self.output_dir, f"{base}.genes.tsv")
-        self.info("Writing", "gene table to", repr(pred_out), level=1)
-        with open(pred_out, "wb") as f:
-            GeneTable.from_genes(genes).dump(f)
+        self._write_table(GeneTable.from_genes(genes), "genes", "gene table")
 
     def _write_cluster_table(self, clusters: List["Cluster"]) -> None:
         from ...model import ClusterTable
 
+        self._write_table(ClusterTable.from_clusters(clusters), "clusters", "cluster table")
+
+    def _write_table(self, table: "Table", suffix: str, description: str) -> None:
         base, _ = os.path.splitext(os.path.basename(self.genome))
-        cluster_out = os.path.join(self.output_dir, f"{base}.clusters.tsv")
-        self.info("Writing", "cluster table to", repr(cluster_out), level=1)
-        with open(cluster_out, "wb") as out:
-            ClusterTable.from_clusters(clusters).dump(out)
+        table_out = os.path.join(self.output_dir, f"{base}.{suffix}.tsv")
+        self.info("Writing", description, "to", repr(table_out), level=1)
+        with open(table_out, "wb") as out:
+            table.dump(out)
 
     def _write_clusters(self, clusters: List["Cluster"], merge: bool = False) -> None:
         from Bio import SeqIO
@@ -229,19 +298,21 @@ class DomainFilterMixin(Command):
         # Filter i-evalue and p-value if required
         if self.e_filter is not None:
             self.info("Excluding", "domains with e-value over", self.e_filter, level=1)
-            key = lambda d: d.i_evalue < self.e_filter
-            genes = [
-                gene.with_protein(gene.protein.with_domains(filter(key, gene.protein.domains)))
-                for gene in genes
-            ]
         if self.p_filter is not None:
             self.info("Excluding", "domains with p-value over", self.p_filter, level=1)
-            key = lambda d: d.pvalue < self.p_filter
+        if self.p_filter is not None or self.e_filter is not None:
+            e_filter, p_filter = self.e_filter, self.p_filter
+            key = lambda d: (
+                (e_filter is None or d.i_evalue < e_filter)
+                and (p_filter is None or d.pvalue < p_filter)
+            )
+            # only copy the genes with domains to remove
             genes = [
-                gene.with_protein(gene.protein.with_domains(filter(key, gene.protein.domains)))
+                gene
+                if all(map(key, gene.protein.domains))
+                else gene.with_protein(gene.protein.with_domains(filter(key, gene.protein.domains)))
                 for gene in genes
             ]
-        if self.p_filter is not None or self.e_filter is not None:
             count = sum(1 for gene in genes for domain in gene.protein.domains)
             self.info("Using", "remaining", count, "domains", level=1)
         return genes
@@ -277,6 +348,10 @@ class AnnotatorMixin(DomainFilterMixin):
     hmm: Optional[List[str]]
     jobs: int
     bit_cutoffs: Optional[str]
+    cache_dir: Optional[str]
+    hmm_strategy: str
+    hmm_block_size: Optional[int]
+    hmm_workers: str
 
     def _custom_hmms(self) -> Iterable["HMM"]:
         from ...hmmer import HMM
@@ -298,21 +373,75 @@ class AnnotatorMixin(DomainFilterMixin):
             )
 
     def _annotate_domains(self, genes: List["Gene"], whitelist: Optional[Collection[str]] = None) -> List["Gene"]:
-        from ...hmmer import PyHMMER, embedded_hmms
+        from ...hmmer import PyHMMER, digitize_proteins, embedded_hmms
 
         self.info("Running", "HMMER domain annotation", level=1)
 
+        # Convert proteins once for all the HMM libraries
+        genes = digitize_proteins(genes)
+
         # Run all HMMs over ORFs to annotate with protein domains
         hmms = list(self._custom_hmms() if self.hmm else embedded_hmms())
-        total = None if whitelist is None else len(whitelist)
+        # The number of HMMs searched in each library depends on the whitelist
+        # and on the proteins already cached, so it is not known beforehand
         task_hmms = self.progress.add_task(description=f"Annotating domains", unit="HMMs", total=len(hmms), precision="")
-        task_domains = self.progress.add_task(description="", total=total, unit="domains", precision="")
-        for hmm in self.progress.track(hmms, task_id=task_hmms, total=len(hmms)):
-            self.progress.update(task_domains, description=f" {hmm.id} v{hmm.version}")
-            callback = lambda h, t: self.progress.update(task_domains, advance=1)
+        task_domains = self.progress.add_task(description="", total=None, unit="domains", precision="")
+        callback = lambda h, t: self.progress.update(task_domains, advance=1)
+
+        # Share the CPUs between the libraries annotated concurrently
+        cpus = self.jobs or os.cpu_count() or 1
+        workers = max(1, min(len(hmms), cpus))
+        annotators = []
+        for hmm in hmms:
+            # custom libraries may contain many more HMMs than needed
+            index = bool(self.hmm) and whitelist is not None
+            # scanning gives the same E-values only with a known library size
+            strategy = self.hmm_strategy
+            if strategy == "scan" and hmm.size is None:
+                self.warn(f"Cannot scan with [bold blue]{hmm.id}[/] HMMs of unknown library size, searching instead")
+                strategy = "search"
+            annotators.append(PyHMMER(
+                hmm,
+                max(1, cpus // workers),
+                whitelist,
+                cache_dir=self.cache_dir,
+                index=index,
+                strategy=strategy,
+                block_size=self.hmm_block_size,
+            ))
+
+        # Skip domains failing the filters while transcribing hits, except
+        # for the E-value filter when disentangling, since overlapping
+        # domains are compared by p-value, which may not order them like
+        # E-values do when they were found with different libraries
+        e_filter = None if self.disentangle else self.e_filter
+
+        # Shard the HMMs across worker processes if requested
+        pool_factory = process_pool if self.hmm_workers == "processes" else None
+
+        def annotate(annotator: PyHMMER) -> List["Gene"]:
+            hmm = annotator.hmm
             self.info("Starting", f"annotation with [bold blue]{hmm.id} v{hmm.version}[/]", level=2)
-            genes = PyHMMER(hmm, self.jobs, whitelist).run(genes, progress=callback, bit_cutoffs=self.bit_cutoffs)
+            # annotate copies of the genes, so that the domains of each
+            # library can be added in a consistent order once all are done
+            targets = [gene.with_protein(gene.protein.with_domains([])) for gene in genes]
+            annotated = annotator.run(
+                targets,
+                progress=callback,
+                bit_cutoffs=self.bit_cutoffs,
+                e_filter=e_filter,
+                p_filter=self.p_filter,
+                pool_factory=pool_factory,
+            )
             self.success("Finished", f"annotation with [bold blue]{hmm.id} v{hmm.version}[/]", level=2)
+            self.progress.update(task_hmms, advance=1)
+            return annotated
+
+        self.progress.update(task_domains, description=" " + ", ".join(f"{hmm.id} v{hmm.version}" for hmm in hmms))
+        with multiprocessing.pool.ThreadPool(workers) as pool:
+            for annotated in pool.map(annotate, annotators):
+                for gene, annotated_gene in zip(genes, annotated):
+                    gene.protein.domains.extend(annotated_gene.protein.domains)
         self.progress.update(task_id=task_domains, visible=False)
 
         # Count number of annotated domains
@@ -342,18 +471,22 @@ class PredictorMixin(Command):
     model: Optional[str]
     no_pad: bool
     threshold: float
+    jobs: int
     postproc: str
     cds: int
     edge_distance: int
 
-    def _predict_probabilities(self, genes: List["Gene"]) -> List["Gene"]:
+    def _load_crf(self) -> "ClusterCRF":
         from ...crf import ClusterCRF
 
         if self.model is None:
             self.info("Loading", "embedded CRF pre-trained model", level=1)
         else:
             self.info("Loading", "CRF pre-trained model from", repr(self.model), level=1)
-        model = ClusterCRF.trained(self.model)
+        return ClusterCRF.trained(self.model)
+
+    def _predict_probabilities(self, genes: List["Gene"], crf: Optional["ClusterCRF"] = None) -> List["Gene"]:
+        model = self._load_crf() if crf is None else crf
 
         self.info("Predicting", "cluster probabilitites with the model", level=1)
         unit = "batches" if len(genes) > 1 else "batch"
@@ -366,6 +499,8 @@ class PredictorMixin(Command):
             genes,
             pad=not self.no_pad,
             progress=progress_callback,
+            cpus=self.jobs,
+            pool_factory=process_pool,
         )
 
     def _extract_clusters(self, genes: List["Gene"]) -> List["Cluster"]:
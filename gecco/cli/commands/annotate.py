@@ -23,6 +23,7 @@ from .._utils import (
     guess_sequences_format,
     in_context,
     patch_showwarnings,
+    process_pool,
     ProgressReader,
 )
 
@@ -30,7 +31,7 @@ if typing.TYPE_CHECKING:
     from Bio.SeqRecord import SeqRecord
     from ...hmmer import HMM
     from ...model import Gene
-    from ...orf import ORFFinder
+    from ...orf import ORFFinder, GFFFinder
 
 
 class Annotate(SequenceLoaderMixin, OutputWriterMixin, AnnotatorMixin):  # noqa: D101
@@ -79,6 +80,30 @@ class Annotate(SequenceLoaderMixin, OutputWriterMixin, AnnotatorMixin):  # noqa:
                                           to use for naming extracted genes
                                           when using the ``--cds-feature``
                                           flag. [default: locus_tag]
+            --gff <gff>                   Extract genes from the coordinates
+                                          in a GFF3 file rather than calling
+                                          genes from scratch, using the
+                                          features of the type given with
+                                          ``--cds-feature`` (CDS by default).
+                                          The genome must then be an
+                                          uncompressed FASTA file, from which
+                                          only the sequences with genes are
+                                          loaded.
+            --window-size <N>             call genes of contigs longer than N
+                                          nucleotides in overlapping windows,
+                                          so that they can be processed in
+                                          parallel. Use 0 to always call the
+                                          genes of a contig at once.
+                                          [default: 0]
+            --window-overlap <N>          the length of the overlap between
+                                          consecutive windows, which should
+                                          be longer than most genes.
+                                          [default: 50000]
+            --orf-workers <kind>          the kind of workers calling genes
+                                          (one of *threads*, or *processes*,
+                                          to share the contigs with worker
+                                          processes, which scales better
+                                          with many CPUs). [default: threads]
 
         Parameters - Domain Annotation:
             --hmm <hmm>                   the path to one or more alternative
@@ -96,6 +121,28 @@ class Annotate(SequenceLoaderMixin, OutputWriterMixin, AnnotatorMixin):  # noqa:
                                           each gene by keeping only the domains
                                           with the lowest E-value over a given
                                           position.
+            --cache-dir <dir>             the path to a directory where to
+                                          cache the HMM profiles selected for
+                                          annotation, and the domains found
+                                          in each protein, so that they can
+                                          be reused in later runs.
+            --hmm-strategy <name>         the direction of the domain search
+                                          (one of *search*, to search the HMMs
+                                          in the proteins, *scan*, to scan the
+                                          proteins with the HMMs, or *auto*,
+                                          to select the fastest one from the
+                                          number of proteins). [default: auto]
+            --hmm-block-size <N>          search proteins in blocks of at most
+                                          N residues, to bound the memory used
+                                          by domain annotation. Use 0 to search
+                                          all proteins at once. [default: 0]
+            --hmm-workers <kind>          the kind of workers running the
+                                          domain search (one of *threads*, or
+                                          *processes*, to split the HMMs
+                                          between worker processes, which
+                                          scales better with many HMMs and
+                                          CPUs but cannot use the profiles
+                                          of --cache-dir). [default: threads]
 
         """
 
@@ -126,7 +173,45 @@ class Annotate(SequenceLoaderMixin, OutputWriterMixin, AnnotatorMixin):  # noqa:
             self.force_tsv = self._check_flag("--force-tsv", bool)
             self.cds_feature: Optional[str] = self._check_flag("--cds-feature", optional=True)
             self.locus_tag: str = self._check_flag("--locus-tag")
+            self.gff: Optional[str] = self._check_flag("--gff", optional=True)
+            self.window_size: Optional[int] = self._check_flag(
+                "--window-size",
+                int,
+                lambda x: x >= 0,
+                hint="positive or null integer",
+            ) or None
+            self.window_overlap: int = self._check_flag(
+                "--window-overlap",
+                int,
+                lambda x: 0 <= x and (self.window_size is None or x < self.window_size),
+                hint="positive integer smaller than the window size",
+            )
+            self.orf_workers: str = self._check_flag(
+                "--orf-workers",
+                str,
+                {"threads", "processes"}.__contains__,
+                hint="one of processes, threads",
+            )
             self.disentangle = self._check_flag("--disentangle", bool)
+            self.cache_dir: Optional[str] = self._check_flag("--cache-dir", optional=True)
+            self.hmm_strategy: str = self._check_flag(
+                "--hmm-strategy",
+                str,
+                {"auto", "search", "scan"}.__contains__,
+                hint="one of auto, scan, search",
+            )
+            self.hmm_block_size: Optional[int] = self._check_flag(
+                "--hmm-block-size",
+                int,
+                lambda x: x >= 0,
+                hint="positive or null integer",
+            ) or None
+            self.hmm_workers: str = self._check_flag(
+                "--hmm-workers",
+                str,
+                {"threads", "processes"}.__contains__,
+                hint="one of processes, threads",
+            )
             self.bit_cutoffs: str = self._check_flag(
                 "--bit-cutoffs",
                 str,
@@ -140,26 +225,65 @@ class Annotate(SequenceLoaderMixin, OutputWriterMixin, AnnotatorMixin):  # noqa:
     # ---
 
     _OUTPUT_FILES = ["features.tsv", "genes.tsv"]
+    _gff_finder: Optional["GFFFinder"] = None
+
+    def _load_gff_finder(self, gff: str) -> "GFFFinder":
+        from ...orf import GFFFinder
+
+        # reuse the coordinates loaded for a previous chunk, if any
+        if self._gff_finder is None:
+            self.info("Loading", "gene coordinates from", repr(gff), level=2)
+            try:
+                self._gff_finder = GFFFinder(gff, feature=self.cds_feature or "CDS", locus_tag=self.locus_tag)
+            except FileNotFoundError as err:
+                self.error("Could not find GFF file:", repr(gff))
+                raise CommandExit(err.errno) from err
+            except ValueError as err:
+                self.error("Failed to load gene coordinates:", err)
+                raise CommandExit(1) from err
+        return self._gff_finder
 
-    def _extract_genes(self, sequences: List["SeqRecord"]) -> List["Gene"]:
+    def _extract_genes(self, sequences: Union[List["SeqRecord"], Mapping[str, "SeqRecord"]]) -> List["Gene"]:
         from ...orf import PyrodigalFinder, CDSFinder
 
         self.info("Extracting", "genes from input sequences", level=1)
-        if self.cds_feature is None:
+        total = len(sequences)
+        if self.gff is not None:
+            gff_finder = self._load_gff_finder(self.gff)
+            orf_finder: ORFFinder = gff_finder
+            if isinstance(sequences, Mapping):
+                total = len(gff_finder.sequence_ids)
+        elif self.cds_feature is None:
             self.info("Using", "Pyrodigal in metagenomic mode", level=2)
-            orf_finder: ORFFinder = PyrodigalFinder(metagenome=True, mask=self.mask, cpus=self.jobs)
+            # no training happens in metagenomic mode, so there is no
+            # training info to cache in `--cache-dir`
+            orf_finder = PyrodigalFinder(
+                metagenome=True,
+                mask=self.mask,
+                cpus=self.jobs,
+                window_size=self.window_size,
+                window_overlap=self.window_overlap,
+                digitize=True,
+            )
         else:
             self.info("Using", f"record features named {self.cds_feature!r}", level=2)
             orf_finder = CDSFinder(feature=self.cds_feature, locus_tag=self.locus_tag)
 
-        unit = "contigs" if len(sequences) > 1 else "contig"
-        task = self.progress.add_task(description="Finding ORFs", total=len(sequences), unit=unit, precision="")
+        unit = "contigs" if total > 1 else "contig"
+        task = self.progress.add_task(description="Finding ORFs", total=total, unit=unit, precision="")
 
         def callback(record: "SeqRecord", found: int) -> None:
             self.success("Found", found, "genes in record", repr(record.id), level=2)
             self.progress.update(task, advance=1)
 
-        return list(orf_finder.find_genes(sequences, progress=callback))
+        try:
+            # share the contigs with worker processes if requested
+            if isinstance(orf_finder, PyrodigalFinder) and self.orf_workers == "processes":
+                return list(orf_finder.find_genes(sequences, progress=callback, pool_factory=process_pool))
+            return list(orf_finder.find_genes(sequences, progress=callback))
+        except ValueError as err:
+            self.error("Failed to extract genes:", err)
+            raise CommandExit(1) from err
 
     # ---
 
@@ -175,7 +299,10 @@ class Annotate(SequenceLoaderMixin, OutputWriterMixin, AnnotatorMixin):  # noqa:
             outputs = [f"{base}.features.tsv", f"{base}.genes.tsv"]
             self._make_output_directory(outputs)
             # load sequences and extract genes
-            sequences = list(self._load_sequences())
+            if self.gff is not None:
+                sequences = self._load_sequence_index()
+            else:
+                sequences = list(self._load_sequences(self.cds_feature, self.locus_tag))
             genes = self._extract_genes(sequences)
             self._write_genes_table(genes)
             if genes:
@@ -3,18 +3,21 @@
 
 import contextlib
 import errno
+import functools
 import glob
+import io
 import itertools
 import json
 import logging
 import multiprocessing
+import multiprocessing.pool
 import operator
 import os
 import pickle
 import tempfile
 import typing
 import signal
-from typing import Any, Dict, Union, Optional, List, TextIO, Mapping
+from typing import Any, Callable, Dict, Union, Optional, List, TextIO, Mapping, Set, Tuple
 
 import rich.emoji
 import rich.progress
@@ -31,8 +34,25 @@ except ImportError:
     import importlib_resources  # type: ignore
 
 if typing.TYPE_CHECKING:
+    from ...crf import ClusterCRF
     from ...types import TypeClassifier
+    from ..._base import Table
     from ...model import Cluster, Gene
+    _TABLE = typing.TypeVar("_TABLE", bound=Table)
+
+
+def _extend_table(table: Optional["_TABLE"], rows: "_TABLE") -> "_TABLE":
+    if table is None:
+        return rows
+    table += rows
+    return table
+
+
+def _sort_table(table: "_TABLE") -> "_TABLE":
+    # sort rows by sequence identifier, keeping the order of the rows
+    # of each sequence, like the genes are sorted before annotation
+    data = table.data.with_row_count("_row").sort(["sequence_id", "_row"]).drop("_row")
+    return type(table)(data)
 
 
 class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  # noqa: D101
@@ -61,6 +81,11 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
             -j <jobs>, --jobs <jobs>      the number of CPUs to use for
                                           multithreading. Use 0 to use all of the
                                           available CPUs. [default: 0]
+            --chunk-size <N>              process the input in chunks of at
+                                          least N nucleotides, keeping only
+                                          the genes of one chunk in memory.
+                                          Use 0 to process the whole input at
+                                          once. [default: 0]
 
         Parameters - Output:
             -o <out>, --output-dir <out>  the directory in which to write the
@@ -80,11 +105,38 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
                                           unknown nucleotides.
             --cds-feature <cds_feature>   Extract genes from annotated records
                                           using a feature rather than calling
-                                          genes from scratch.
+                                          genes from scratch. Other features
+                                          of GenBank or EMBL records are not
+                                          loaded, and are therefore not copied
+                                          to the output cluster files.
             --locus-tag <locus_tag>       The name of the feature qualifier
                                           to use for naming extracted genes
                                           when using the ``--cds-feature``
                                           flag. [default: locus_tag]
+            --gff <gff>                   Extract genes from the coordinates
+                                          in a GFF3 file rather than calling
+                                          genes from scratch, using the
+                                          features of the type given with
+                                          ``--cds-feature`` (CDS by default).
+                                          The genome must then be an
+                                          uncompressed FASTA file, from which
+                                          only the sequences with genes are
+                                          loaded.
+            --window-size <N>             call genes of contigs longer than N
+                                          nucleotides in overlapping windows,
+                                          so that they can be processed in
+                                          parallel. Use 0 to always call the
+                                          genes of a contig at once.
+                                          [default: 0]
+            --window-overlap <N>          the length of the overlap between
+                                          consecutive windows, which should
+                                          be longer than most genes.
+                                          [default: 50000]
+            --orf-workers <kind>          the kind of workers calling genes
+                                          (one of *threads*, or *processes*,
+                                          to share the contigs with worker
+                                          processes, which scales better
+                                          with many CPUs). [default: threads]
 
         Parameters - Domain Annotation:
             --hmm <hmm>                   the path to one or more alternative
@@ -102,6 +154,42 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
                                           each gene by keeping only the domains
                                           with the lowest E-value over a given
                                           position.
+            --cache-dir <dir>             the path to a directory where to
+                                          cache the HMM profiles selected for
+                                          annotation, and the domains found
+                                          in each protein, so that they can
+                                          be reused in later runs.
+            --hmm-strategy <name>         the direction of the domain search
+                                          (one of *search*, to search the HMMs
+                                          in the proteins, *scan*, to scan the
+                                          proteins with the HMMs, or *auto*,
+                                          to select the fastest one from the
+                                          number of proteins). [default: auto]
+            --hmm-block-size <N>          search proteins in blocks of at most
+                                          N residues, to bound the memory used
+                                          by domain annotation. Use 0 to search
+                                          all proteins at once. [default: 0]
+            --hmm-workers <kind>          the kind of workers running the
+                                          domain search (one of *threads*, or
+                                          *processes*, to split the HMMs
+                                          between worker processes, which
+                                          scales better with many HMMs and
+                                          CPUs but cannot use the profiles
+                                          of --cache-dir). [default: threads]
+            --screen <N>                  annotate all genes with only the N
+                                          features of the CRF model with the
+                                          highest weights, and annotate with
+                                          every feature only the genes close
+                                          to the candidate regions found with
+                                          these. Use 0 to annotate all genes
+                                          with every feature. [default: 0]
+            --screen-threshold <m>        the probability threshold for the
+                                          genes of candidate regions when
+                                          screening. [default: 0.3]
+            --screen-distance <N>         the number of genes to annotate with
+                                          every feature on each side of the
+                                          candidate regions when screening.
+                                          [default: 20]
 
         Parameters - Cluster Detection:
             --model <directory>           the path to an alternative CRF model
@@ -152,6 +240,7 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
             else:
                 self.threshold = self._check_flag("--threshold", float, lambda x: 0 <= x <= 1, hint="number between 0 and 1")
             self.jobs = self._check_flag("--jobs", int, lambda x: x >= 0, hint="positive or null integer")
+            self.chunk_size = self._check_flag("--chunk-size", int, lambda x: x >= 0, hint="positive or null integer")
             self.postproc = self._check_flag("--postproc", str, lambda x: x in ("gecco", "antismash"), hint="'gecco' or 'antismash'")
             self.edge_distance = self._check_flag("--edge-distance", int, lambda x: x >= 0, hint="positive or null integer")
             self.format = self._check_flag("--format", optional=True)
@@ -164,9 +253,60 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
             self.mask = self._check_flag("--mask", bool)
             self.cds_feature = self._check_flag("--cds-feature", optional=True)
             self.locus_tag = self._check_flag("--locus-tag")
+            self.gff = self._check_flag("--gff", optional=True)
+            self.window_size: Optional[int] = self._check_flag(
+                "--window-size",
+                int,
+                lambda x: x >= 0,
+                hint="positive or null integer",
+            ) or None
+            self.window_overlap: int = self._check_flag(
+                "--window-overlap",
+                int,
+                lambda x: 0 <= x and (self.window_size is None or x < self.window_size),
+                hint="positive integer smaller than the window size",
+            )
+            self.orf_workers: str = self._check_flag(
+                "--orf-workers",
+                str,
+                {"threads", "processes"}.__contains__,
+                hint="one of processes, threads",
+            )
             self.no_pad = self._check_flag("--no-pad", bool)
             self.merge_gbk = self._check_flag("--merge-gbk", bool)
             self.disentangle = self._check_flag("--disentangle", bool)
+            self.cache_dir: Optional[str] = self._check_flag("--cache-dir", optional=True)
+            self.hmm_strategy: str = self._check_flag(
+                "--hmm-strategy",
+                str,
+                {"auto", "search", "scan"}.__contains__,
+                hint="one of auto, scan, search",
+            )
+            self.hmm_block_size: Optional[int] = self._check_flag(
+                "--hmm-block-size",
+                int,
+                lambda x: x >= 0,
+                hint="positive or null integer",
+            ) or None
+            self.hmm_workers: str = self._check_flag(
+                "--hmm-workers",
+                str,
+                {"threads", "processes"}.__contains__,
+                hint="one of processes, threads",
+            )
+            self.screen: int = self._check_flag("--screen", int, lambda x: x >= 0, hint="positive or null integer")
+            self.screen_threshold: float = self._check_flag(
+                "--screen-threshold",
+                float,
+                lambda x: 0 <= x <= 1,
+                hint="number between 0 and 1",
+            )
+            self.screen_distance: int = self._check_flag(
+                "--screen-distance",
+                int,
+                lambda x: x >= 0,
+                hint="positive or null integer",
+            )
             self.bit_cutoffs: str = self._check_flag(
                 "--bit-cutoffs",
                 str,
@@ -197,10 +337,107 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
             self.success("Found", len(domains), "selected features", level=2)
             return domains
 
-    def _write_sideload_json(self, clusters: List["Cluster"]) -> None:
+    def _prepare_annotation(self, load_crf: Callable[[], "ClusterCRF"]) -> Set[str]:
+        from ...hmmer import PyHMMER, embedded_hmms
+        from ...interpro import InterPro
+
+        whitelist = self._load_model_domains()
+        # load the InterPro metadata and press or index the HMM libraries
+        # like the annotators will use them, only with the screening
+        # features when screening, since the genes annotated with every
+        # feature are not known yet
+        InterPro.load_index()
+        features = self._screening_features(load_crf(), whitelist) if self.screen else whitelist
+        # optimized profiles are not used by worker processes, so only
+        # index the libraries if the HMMs are sharded
+        cache_dir = self.cache_dir if self.hmm_workers == "threads" else None
+        for hmm in (self._custom_hmms() if self.hmm else embedded_hmms()):
+            PyHMMER(hmm, whitelist=features, cache_dir=cache_dir, index=bool(self.hmm)).prepare()
+        return whitelist
+
+    def _prefetch_resources(
+        self,
+        ctx: contextlib.ExitStack,
+    ) -> Tuple[Callable[[], Set[str]], Callable[[], "ClusterCRF"], Callable[[], "TypeClassifier"]]:
+        # without a spare CPU, loading resources in the background would
+        # only slow down gene calling, so load them once when needed instead
+        if (self.jobs or os.cpu_count() or 1) == 1:
+            return (
+                functools.lru_cache(maxsize=None)(self._load_model_domains),
+                functools.lru_cache(maxsize=None)(self._load_crf),
+                functools.lru_cache(maxsize=None)(self._load_type_classifier),
+            )
+        # load the models and prepare the HMMs in background threads, so
+        # that their latency is hidden behind gene calling; the threads
+        # are joined on exit so that none outlives the command
+        pool = multiprocessing.pool.ThreadPool(3)
+        ctx.callback(pool.join)
+        ctx.callback(pool.close)
+        load_crf = pool.apply_async(self._load_crf).get
+        return (
+            pool.apply_async(self._prepare_annotation, (load_crf,)).get,
+            load_crf,
+            pool.apply_async(self._load_type_classifier).get,
+        )
+
+    def _screening_features(self, crf: "ClusterCRF", whitelist: typing.Set[str]) -> List[str]:
+        return [name for name in crf.screening_features(self.screen) if name in whitelist]
+
+    def _annotate_screened(
+        self,
+        genes: List["Gene"],
+        whitelist: typing.Set[str],
+        crf: "ClusterCRF",
+    ) -> List["Gene"]:
+        from ...refine import select_neighbourhoods
+
+        # annotate all genes with the features most predictive of clusters
+        features = self._screening_features(crf, whitelist)
+        self.info("Screening", "genes with", len(features), "high-weight features", level=1)
+        screened = self._annotate_domains(genes, whitelist=features)
+        screened = self._predict_probabilities(screened, crf)
+        # select the genes close to candidate regions
+        mask = select_neighbourhoods(screened, self.screen_threshold, self.screen_distance)
+        positions = [i for i, selected in enumerate(mask) if selected]
+        self.success("Selected", len(positions), "of", len(screened), "genes close to candidate regions", level=1)
+        if not positions:
+            return screened
+        # annotate the selected genes with every feature, keeping the
+        # screening domains of the other genes; the selected genes are
+        # already sorted like `_annotate_domains` sorts them, so they can
+        # be replaced by position even if gene identifiers are not unique
+        candidates = [screened[i].with_protein(screened[i].protein.with_domains([])) for i in positions]
+        genes = screened.copy()
+        for i, gene in zip(positions, self._annotate_domains(candidates, whitelist=whitelist)):
+            genes[i] = gene
+        return genes
+
+    def _sideload_records(self, clusters: List["Cluster"]) -> List[Dict[str, Any]]:
+        # create a record per sequence
+        records: List[Dict[str, Any]] = []
+        for seq_id, seq_clusters in itertools.groupby(clusters, key=operator.attrgetter("source.id")):
+            records.append({"name": seq_id, "subregions": []})
+            for cluster in seq_clusters:
+                probabilities = {
+                    f"{key.lower()}_probability":f"{value:.3f}"
+                    for key, value in cluster.type_probabilities.items()
+                }
+                records[-1]["subregions"].append({
+                    "start": cluster.start,
+                    "end": cluster.end,
+                    "label": ";".join(sorted(cluster.type.names)) or "Unknown",
+                    "details": {
+                        "average_p": f"{cluster.average_probability:.3f}",
+                        "max_p": f"{cluster.maximum_probability:.3f}",
+                        **probabilities,
+                    }
+                })
+        return records
+
+    def _write_sideload_json(self, records: List[Dict[str, Any]]) -> None:
         # record version and important parameters
         data: Dict[str, Any] = {
-            "records": [],
+            "records": records,
             "tool": {
                 "name": "GECCO",
                 "version": __version__,
@@ -215,6 +452,7 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
                     "mask": repr(self.mask),
                     "edge-distance": repr(self.edge_distance),
                     "no-pad": repr(self.no_pad),
+                    "screen": repr(self.screen),
                 }
             }
         }
@@ -223,24 +461,6 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
             data["tool"]["configuration"]["hmm"] = list(self.hmm)
         if self.model:
             data["tool"]["configuration"]["model"] = self.model
-        # create a record per sequence
-        for seq_id, seq_clusters in itertools.groupby(clusters, key=operator.attrgetter("source.id")):
-            data["records"].append({"name": seq_id, "subregions": []})
-            for cluster in seq_clusters:
-                probabilities = {
-                    f"{key.lower()}_probability":f"{value:.3f}"
-                    for key, value in cluster.type_probabilities.items()
-                }
-                data["records"][-1]["subregions"].append({
-                    "start": cluster.start,
-                    "end": cluster.end,
-                    "label": ";".join(sorted(cluster.type.names)) or "Unknown",
-                    "details": {
-                        "average_p": f"{cluster.average_probability:.3f}",
-                        "max_p": f"{cluster.maximum_probability:.3f}",
-                        **probabilities,
-                    }
-                })
         # write the JSON file to the output folder
         base, _ = os.path.splitext(os.path.basename(self.genome))
         sideload_out = os.path.join(self.output_dir, f"{base}.sideload.json")
@@ -248,6 +468,100 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
         with open(sideload_out, "w") as out:
             json.dump(data, out, sort_keys=True, indent=4)
 
+    def _execute_chunked(self, ctx: contextlib.ExitStack) -> int:
+        from Bio import SeqIO
+        from ...model import ClusterTable, FeatureTable, GeneTable
+
+        # load the models once in the background and reuse them for every chunk
+        load_whitelist, load_crf, load_classifier = self._prefetch_resources(ctx)
+        # only read the sequences with genes from an index when using a GFF
+        if self.gff is not None:
+            sequence_ids: Optional[List[str]] = self._load_gff_finder(self.gff).sequence_ids
+        else:
+            sequence_ids = None
+        # process the input chunk by chunk, so that only the genes of the
+        # current chunk are kept in memory; rows of the tables and records
+        # of the merged GenBank file are collected across chunks, and sorted
+        # by sequence in the end like when processing the whole input at once
+        genes_table: Optional[GeneTable] = None
+        features_table: Optional[FeatureTable] = None
+        clusters_table: Optional[ClusterTable] = None
+        gbk_records: List[Tuple[str, int, int]] = []
+        gbk_spool = ctx.enter_context(tempfile.TemporaryFile())
+        sideload_records: List[Dict[str, Any]] = []
+        chunks = self._load_sequence_chunks(self.chunk_size, self.cds_feature, self.locus_tag, sequence_ids)
+        for chunk in chunks:
+            # remember the progress bars of the previous chunks
+            task_ids = set(self.progress.task_ids)
+            # extract genes, annotate domains and predict probabilities
+            genes = self._extract_genes(chunk)
+            if genes:
+                whitelist = load_whitelist()
+                crf = load_crf()
+                if self.screen:
+                    genes = self._annotate_screened(genes, whitelist, crf)
+                else:
+                    genes = self._annotate_domains(genes, whitelist=whitelist)
+                genes = self._predict_probabilities(genes, crf)
+                genes_table = _extend_table(genes_table, GeneTable.from_genes(genes))
+                if any(gene.protein.domains for gene in genes):
+                    features_table = _extend_table(features_table, FeatureTable.from_genes(genes))
+                # extract clusters and predict their types
+                clusters = self._extract_clusters(genes)
+                if clusters:
+                    classifier = load_classifier()
+                    if len(classifier.classes_) > 1:
+                        clusters = self._predict_types(clusters, classifier)
+                    clusters_table = _extend_table(clusters_table, ClusterTable.from_clusters(clusters))
+                    if self.merge_gbk:
+                        for cluster in clusters:
+                            text = io.StringIO()
+                            SeqIO.write(cluster.to_seq_record(), text, "genbank")
+                            data = text.getvalue().encode()
+                            gbk_records.append((cluster.source.id, gbk_spool.tell(), len(data)))
+                            gbk_spool.write(data)
+                    else:
+                        self._write_clusters(clusters)
+                    if self.antismash_sideload:
+                        sideload_records.extend(self._sideload_records(clusters))
+            # remove the progress bars of the current chunk
+            for task_id in set(self.progress.task_ids).difference(task_ids):
+                self.progress.remove_task(task_id)
+        # write the tables like `execute` would
+        if genes_table is None:
+            if self.force_tsv:
+                self._write_genes_table([])
+                self._write_feature_table([])
+                self._write_cluster_table([])
+            self.warn("No genes were found")
+            return 0
+        self.success("Found", "a total of", len(genes_table), "genes", level=1)
+        self._write_table(_sort_table(genes_table), "genes", "gene table")
+        if features_table is None:
+            self._write_feature_table([])
+        else:
+            self._write_table(_sort_table(features_table), "features", "feature table")
+        if clusters_table is None:
+            self.warn("No gene clusters were found")
+            if self.force_tsv:
+                self._write_cluster_table([])
+            return 0
+        self.info("Writing", "result files to folder", repr(self.output_dir), level=1)
+        self._write_table(_sort_table(clusters_table), "clusters", "cluster table")
+        if self.merge_gbk:
+            base, _ = os.path.splitext(os.path.basename(self.genome))
+            gbk_out = os.path.join(self.output_dir, f"{base}.clusters.gbk")
+            with open(gbk_out, "wb") as out:
+                for _, offset, length in sorted(gbk_records, key=operator.itemgetter(0)):
+                    gbk_spool.seek(offset)
+                    out.write(gbk_spool.read(length))
+        if self.antismash_sideload:
+            sideload_records.sort(key=operator.itemgetter("name"))
+            self._write_sideload_json(sideload_records)
+        unit = "cluster" if len(clusters_table) == 1 else "clusters"
+        self.success("Found", len(clusters_table), "biosynthetic gene", unit, level=0)
+        return 0
+
     # ---
 
     def execute(self, ctx: contextlib.ExitStack) -> int:  # noqa: D102
@@ -263,8 +577,16 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
             if self.antismash_sideload:
                 outputs.append(f"{base}.sideload.json")
             self._make_output_directory(outputs)
+            # process the input in chunks if requested
+            if self.chunk_size > 0:
+                return self._execute_chunked(ctx)
+            # load the models in the background while extracting genes
+            load_whitelist, load_crf, load_classifier = self._prefetch_resources(ctx)
             # load sequences and extract genes
-            sequences = list(self._load_sequences())
+            if self.gff is not None:
+                sequences = self._load_sequence_index()
+            else:
+                sequences = list(self._load_sequences(self.cds_feature, self.locus_tag))
             genes = self._extract_genes(sequences)
             if genes:
                 self.success("Found", "a total of", len(genes), "genes", level=1)
@@ -277,10 +599,15 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
                 return 0
             # use a whitelist for domain annotation, so that we only annotate
             # with features that are useful for the CRF
-            whitelist = self._load_model_domains()
-            # annotate domains and predict probabilities
-            genes = self._annotate_domains(genes, whitelist=whitelist)
-            genes = self._predict_probabilities(genes)
+            whitelist = load_whitelist()
+            # annotate domains and predict probabilities, screening the
+            # genes with a subset of the features first if requested
+            crf = load_crf()
+            if self.screen:
+                genes = self._annotate_screened(genes, whitelist, crf)
+            else:
+                genes = self._annotate_domains(genes, whitelist=whitelist)
+            genes = self._predict_probabilities(genes, crf)
             self._write_genes_table(genes)
             self._write_feature_table(genes)
             # extract clusters from probability vector
@@ -293,7 +620,7 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
                     self._write_cluster_table(clusters)
                 return 0
             # predict types for putative clusters
-            classifier = self._load_type_classifier()
+            classifier = load_classifier()
             if len(classifier.classes_) > 1:
                 clusters = self._predict_types(clusters, classifier)
             # write results
@@ -301,7 +628,7 @@ class Run(Annotate, SequenceLoaderMixin, OutputWriterMixin, PredictorMixin):  #
             self._write_cluster_table(clusters)
             self._write_clusters(clusters, merge=self.merge_gbk)
             if self.antismash_sideload:
-                self._write_sideload_json(clusters)
+                self._write_sideload_json(self._sideload_records(clusters))
             unit = "cluster" if len(clusters) == 1 else "clusters"
             self.success("Found", len(clusters), "biosynthetic gene", unit, level=0)
         except CommandExit as cexit:
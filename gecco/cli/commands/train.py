@@ -242,6 +242,8 @@ class Train(TableLoaderMixin, DomainFilterMixin, OutputWriterMixin, ClusterLoade
             outputs = [
                 "model.pkl",
                 "model.pkl.md5",
+                "model.npz",
+                "model.npz.md5",
                 "domains.tsv",
                 "types.tsv",
                 "compositions.npz"
@@ -16,6 +16,7 @@ import random
 import textwrap
 import typing
 import warnings
+from multiprocessing.pool import Pool
 from typing import (
     Any,
     BinaryIO,
@@ -29,6 +30,7 @@ from typing import (
     NamedTuple,
     Optional,
     Sequence,
+    Set,
     TextIO,
     Tuple,
     Type,
@@ -37,15 +39,11 @@ from typing import (
 
 import numpy
 import tqdm
-import sklearn_crfsuite
-import sklearn.model_selection
-import sklearn.preprocessing
 
 from .._meta import sliding_window
 from ..model import Gene
 from . import features
-from .cv import LeaveOneGroupOut
-from .select import fisher_significance
+from .inference import LinearChainCRF
 
 try:
     import importlib.resources as importlib_resources
@@ -54,30 +52,89 @@ except ImportError:
 
 __all__ = ["ClusterCRF"]
 
+# the NumPy archives of models that were checked against their signature,
+# with their modification time and size when they were checked
+_verified_models: Set[Tuple[str, int, int, str]] = set()
+
+
+def _encode_strings(strings: Iterable[str]) -> numpy.ndarray:
+    # store strings as UTF-8 bytes, which takes a quarter of the space of
+    # the fixed-width UTF-32 strings of NumPy for ASCII names
+    return numpy.array([string.encode("utf-8") for string in strings], dtype=bytes)
+
+
+def _decode_strings(array: numpy.ndarray) -> List[str]:
+    return [string.decode("utf-8") for string in array.tolist()]
+
+
+# --- Process-based prediction -----------------------------------------------
+
+_worker_crf: Optional["ClusterCRF"] = None
+
+
+def _init_worker(crf: "ClusterCRF") -> None:
+    global _worker_crf
+    _worker_crf = crf
+
+
+def _predict_task(
+    task: Tuple[List[str], List[List[Dict[str, bool]]], str],
+) -> Tuple[List[str], List[numpy.ndarray]]:
+    assert _worker_crf is not None
+    contig_ids, contig_features, backend = task
+    return contig_ids, _worker_crf._sliding_maxima(contig_features, backend)
+
 
 class ClusterCRF(object):
     """A wrapper for `sklearn_crfsuite.CRF` to work with the GECCO data model.
     """
 
     _FILENAME = "model.pkl"
+    _NPZ_FILENAME = "model.npz"
+
+    # the minimum number of windows sent to a worker process at once, so
+    # that each task takes long enough to be worth sending to a process
+    _MIN_TASK_WINDOWS = {"numpy": 65536, "crfsuite": 4096}
 
     @classmethod
-    def trained(cls, model_path: Optional[str] = None) -> "ClusterCRF":
+    def trained(cls, model_path: Optional[str] = None, format: str = "npz") -> "ClusterCRF":
         """Create a new pre-trained `ClusterCRF` instance from a model path.
 
         Arguments:
             model_path (`str`, optional): The path to the model directory
                 obtained with the ``gecco train`` command. If `None` given,
                 use the embedded model.
+            format (`str`): The format of the model file to load, either
+                ``npz`` to only load the weights of the model from a
+                NumPy archive, or ``pickle`` to unpickle the complete
+                `sklearn_crfsuite.CRF` model, which is needed by the
+                ``crfsuite`` backend of `ClusterCRF.predict_probabilities`.
+                Models without a NumPy archive are always unpickled.
 
         Returns:
             `~gecco.crf.ClusterCRF`: A CRF model that can be used to perform
             predictions without training first.
 
         Raises:
-            `ValueError`: If the model data does not match its hash.
+            `ValueError`: If the model data does not match its hash, or
+                ``format`` is not a known format.
 
         """
+        if format not in {"npz", "pickle"}:
+            raise ValueError(f"invalid model format: {format!r}")
+
+        # load the weights from the NumPy archive if there is one
+        if format == "npz":
+            if model_path is not None:
+                npz_path = os.path.join(model_path, cls._NPZ_FILENAME)
+                if os.path.exists(npz_path):
+                    with open(f"{npz_path}.md5") as sig:
+                        return cls._load_npz(npz_path, sig.read().strip())
+            elif importlib_resources.is_resource(__name__, cls._NPZ_FILENAME):
+                signature = importlib_resources.read_text(__name__, f"{cls._NPZ_FILENAME}.md5").strip()
+                with importlib_resources.path(__name__, cls._NPZ_FILENAME) as npz_path:
+                    return cls._load_npz(os.fspath(npz_path), signature)
+
         # get the path to the pickled model and read its signature file
         if model_path is not None:
             pkl_file: ContextManager[BinaryIO] = open(os.path.join(model_path, cls._FILENAME), "rb")
@@ -99,6 +156,40 @@ class ClusterCRF(object):
             pkl_file.seek(0)  # type: ignore
             return pickle.load(bin)  # type: ignore
 
+    @classmethod
+    def _load_npz(cls, path: str, signature: str) -> "ClusterCRF":
+        # check the file content matches its MD5 hashsum, unless the same
+        # file was already checked by this process
+        stat = os.stat(path)
+        key = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size, signature.upper())
+        if key not in _verified_models:
+            hasher = hashlib.md5()
+            with open(path, "rb") as bin:
+                for chunk in iter(functools.partial(bin.read, io.DEFAULT_BUFFER_SIZE), b""):
+                    hasher.update(chunk)
+            if hasher.hexdigest().upper() != signature.upper():
+                raise ValueError("MD5 hash of model data does not match signature")
+            _verified_models.add(key)
+        # create a new model from the metadata and the weights, which are
+        # read into memory since members of archives cannot be memory-mapped
+        with numpy.load(path, allow_pickle=False) as data:
+            window_size, window_step = data["window"].tolist()
+            crf = cls(str(data["feature_type"]), str(data["algorithm"]), window_size, window_step)
+            if "significant_features" in data:
+                crf.significant_features = frozenset(_decode_strings(data["significant_features"]))
+            if "significance_features" in data:
+                crf.significance = dict(zip(
+                    _decode_strings(data["significance_features"]),
+                    data["significance_pvalues"].tolist(),
+                ))
+            crf._linear_chain_crf = LinearChainCRF(
+                _decode_strings(data["labels"]),
+                _decode_strings(data["attributes"]),
+                data["state_weights"],
+                data["transition_weights"],
+            )
+        return crf
+
     def __init__(
         self,
         feature_type: str = "protein",
@@ -145,6 +236,69 @@ class ClusterCRF(object):
         self.significant_features: Optional[FrozenSet[str]] = None
         self.model = None
         self._options = {"algorithm": algorithm, **kwargs}
+        self._linear_chain_crf: Optional[LinearChainCRF] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the exported weights are recreated from the model when needed,
+        # unless the model was loaded from a NumPy archive
+        state = self.__dict__.copy()
+        if state.get("model") is not None:
+            state.pop("_linear_chain_crf", None)
+        return state
+
+    def _check_fitted(self) -> None:
+        # models loaded from a NumPy archive only have the exported weights
+        if self.model is None and getattr(self, "_linear_chain_crf", None) is None:
+            from sklearn.exceptions import NotFittedError
+            raise NotFittedError("This ClusterCRF instance is not fitted yet.")
+
+    def _linear_chain(self) -> LinearChainCRF:
+        # export the weights of the model once, models unpickled from
+        # older versions may not have the attribute at all
+        if getattr(self, "_linear_chain_crf", None) is None:
+            self._linear_chain_crf = LinearChainCRF.from_crfsuite(self.model)
+        return self._linear_chain_crf  # type: ignore
+
+    def _cluster_weights(self) -> Dict[str, float]:
+        # get the state weights of the gene cluster label, rounded to 6
+        # decimal places like in the `state_features_` attribute of the
+        # `sklearn_crfsuite.CRF`, whatever the format the model came from
+        model = self._linear_chain()
+        weights = model.state_weights[:, model.labels.index("1")]
+        return {
+            name: round(float(weights[i]), 6)
+            for name, i in model.attributes.items()
+            if weights[i] != 0
+        }
+
+    def screening_features(self, count: int) -> List[str]:
+        """Get the features with the highest weights towards gene clusters.
+
+        Annotating genes only with these features gives a cheap first
+        estimate of where gene clusters may be, before annotating the
+        genes of these regions with every feature of the model.
+
+        Arguments:
+            count (`int`): The maximum number of features to return.
+
+        Returns:
+            `list` of `str`: The names of the features with a positive
+            state weight for the gene cluster label, sorted by decreasing
+            weight.
+
+        Raises:
+            `~sklearn.exceptions.NotFittedError`: When calling this method
+                on an object that has not been fitted yet.
+
+        """
+        self._check_fitted()
+        weights = [
+            (weight, name)
+            for name, weight in self._cluster_weights().items()
+            if weight > 0
+        ]
+        weights.sort(key=lambda x: (-x[0], x[1]))
+        return [name for _, name in weights[:count]]
 
     def predict_probabilities(
         self,
@@ -152,6 +306,9 @@ class ClusterCRF(object):
         *,
         pad: bool = True,
         progress: Optional[Callable[[int, int], None]] = None,
+        backend: str = "numpy",
+        cpus: int = 0,
+        pool_factory: Optional[Type[Pool]] = None,
     ) -> List[Gene]:
         """Predict how likely each given gene is part of a gene cluster.
 
@@ -168,6 +325,22 @@ class ClusterCRF(object):
                 size.
             progress (callable): A callable that accepts two `int`, the
                 current batch index and the total number of batches.
+            backend (`str`): The implementation to use for computing the
+                marginals of each window, either ``numpy`` to compute the
+                marginals of all windows together with array operations,
+                reusing the marginals of windows with the same features,
+                or ``crfsuite`` to compute them window by window with
+                the `sklearn_crfsuite.CRF` model. Both give the same
+                probabilities, up to floating-point rounding.
+            cpus (`int`): The number of worker processes to use with
+                ``pool_factory``. Give ``0`` to use all available CPUs.
+            pool_factory (`type`, optional): The callable for creating
+                pools, such as `multiprocessing.pool.Pool`, to compute the
+                marginals of the contigs in the workers of a pool. The
+                model is sent once to each worker, and contigs are sent
+                in groups of windows large enough to outweigh the cost of
+                the transfer. Give `None` to compute all marginals in the
+                current process.
 
         Returns:
             `list` of `~gecco.model.Gene`: A list of new `Gene` objects with
@@ -176,15 +349,18 @@ class ClusterCRF(object):
         Raises:
             `~sklearn.exceptions.NotFittedError`: When calling this method
                 on an object that has not been fitted yet.
+            `ValueError`: When ``backend`` is not a known backend.
 
         """
         # silence progress if no callback given, ignored
         _progress = progress or (lambda x,y: None)
-        window_index = 0
 
         # check that the model was trained
-        if self.model is None:
-            raise NotFittedError("This ClusterCRF instance is not fitted yet.")
+        self._check_fitted()
+        if backend not in {"numpy", "crfsuite"}:
+            raise ValueError(f"invalid backend: {backend!r}")
+        if backend == "crfsuite" and self.model is None:
+            raise ValueError("crfsuite backend requires a model loaded with format='pickle'")
 
         # select the feature extraction method
         if self.feature_type == "protein":
@@ -236,9 +412,15 @@ class ClusterCRF(object):
             # store features for the current contig
             contig_features[contig_id] = feats
 
-        # compute total number of windows to process
-        total = sum(len(feats) - self.window_size + 1 for feats in contig_features.values())
-        _progress(window_index, total)
+        # compute the maximum marginals over sliding windows, in parallel
+        # when a pool is given and there are enough windows to share
+        windows = sum(len(feats) - self.window_size + 1 for feats in contig_features.values())
+        processes = min(cpus or os.cpu_count() or 1, math.ceil(windows / self._MIN_TASK_WINDOWS[backend]))
+        if pool_factory is not None and processes > 1:
+            contig_maxima = self._sliding_maxima_parallel(contig_features, backend, processes, pool_factory, _progress)
+        else:
+            maxima = self._sliding_maxima(list(contig_features.values()), backend, _progress)
+            contig_maxima = dict(zip(contig_features, maxima))
 
         # predict probabilities
         predicted = []
@@ -247,23 +429,15 @@ class ClusterCRF(object):
             if contig_id not in contig_features:
                 predicted.extend(contig)
                 continue
-            feats = contig_features[contig_id]
-            # predict marginals over a sliding window, storing maximum probabilities
-            probabilities = numpy.zeros(max(len(contig), self.window_size))
-            for win in sliding_window(len(feats), self.window_size, self.window_step):
-                marginals = [p['1'] for p in self.model.predict_marginals_single(feats[win])]
-                numpy.maximum(probabilities[win], marginals, out=probabilities[win])
-                window_index += 1
-                _progress(window_index, total)
             # label genes with maximal probabilities
+            probabilities = contig_maxima[contig_id]
             predicted.extend(annotate_probabilities(contig, probabilities[deltas[contig_id]//2:][:len(contig)]))
 
         # label domains with their biosynthetic weight according to the CRF state weights
+        weights = self._cluster_weights()
         predicted = [
             gene.with_protein(gene.protein.with_domains(
-                domain.with_cluster_weight(
-                    self.model.state_features_.get((domain.name, '1'))
-                )
+                domain.with_cluster_weight(weights.get(domain.name))
                 for domain in gene.protein.domains
             ))
             for gene in predicted
@@ -273,6 +447,74 @@ class ClusterCRF(object):
         # gene cluster probabilities
         return predicted
 
+    def _sliding_maxima(
+        self,
+        contig_features: List[List[Dict[str, bool]]],
+        backend: str,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> List[numpy.ndarray]:
+        _progress = progress or (lambda x,y: None)
+        # compute the marginals of all windows at once with the NumPy backend
+        if backend == "numpy":
+            return self._linear_chain().sliding_marginals(
+                contig_features,
+                "1",
+                self.window_size,
+                self.window_step,
+                progress=_progress,
+            )
+        # predict marginals over a sliding window, storing maximum probabilities
+        window_index = 0
+        total = sum(len(feats) - self.window_size + 1 for feats in contig_features)
+        _progress(window_index, total)
+        contig_maxima = []
+        for feats in contig_features:
+            probabilities = numpy.zeros(len(feats))
+            for win in sliding_window(len(feats), self.window_size, self.window_step):
+                marginals = [p['1'] for p in self.model.predict_marginals_single(feats[win])]
+                numpy.maximum(probabilities[win], marginals, out=probabilities[win])
+                window_index += 1
+                _progress(window_index, total)
+            contig_maxima.append(probabilities)
+        return contig_maxima
+
+    def _sliding_maxima_parallel(
+        self,
+        contig_features: Dict[str, List[Dict[str, bool]]],
+        backend: str,
+        processes: int,
+        pool_factory: Type[Pool],
+        progress: Callable[[int, int], None],
+    ) -> Dict[str, numpy.ndarray]:
+        # group consecutive contigs into tasks of similar number of windows,
+        # several per worker so that workers finishing early can take more
+        total = sum(len(feats) - self.window_size + 1 for feats in contig_features.values())
+        task_windows = max(self._MIN_TASK_WINDOWS[backend], total // (processes * 4))
+        tasks = []
+        contig_ids: List[str] = []
+        task_features: List[List[Dict[str, bool]]] = []
+        windows = 0
+        for contig_id, feats in contig_features.items():
+            contig_ids.append(contig_id)
+            task_features.append(feats)
+            windows += len(feats) - self.window_size + 1
+            if windows >= task_windows:
+                tasks.append((contig_ids, task_features, backend))
+                contig_ids, task_features, windows = [], [], 0
+        if contig_ids:
+            tasks.append((contig_ids, task_features, backend))
+        # send the model once to each worker, and report progress in
+        # windows every time a task is done
+        contig_maxima = {}
+        done = 0
+        progress(done, total)
+        with pool_factory(processes, initializer=_init_worker, initargs=(self,)) as pool:
+            for task_ids, maxima in pool.imap_unordered(_predict_task, tasks):
+                contig_maxima.update(zip(task_ids, maxima))
+                done += sum(len(contig_features[contig_id]) - self.window_size + 1 for contig_id in task_ids)
+                progress(done, total)
+        return contig_maxima
+
     def fit(
         self,
         genes: Iterable[Gene],
@@ -297,6 +539,9 @@ class ClusterCRF(object):
                 Ignored if ``select`` is `False`.
 
         """
+        import sklearn_crfsuite
+        from .select import fisher_significance
+
         _cpus = os.cpu_count() if not cpus else cpus
         # select the feature extraction method
         if self.feature_type == "protein":
@@ -374,13 +619,17 @@ class ClusterCRF(object):
 
         # fit the model
         self.model = model = sklearn_crfsuite.CRF(**self._options)
+        self._linear_chain_crf = None
         model.fit(training_features, training_labels)
 
     def save(self, model_path: "os.PathLike[str]") -> None:
         """Save the `ClusterCRF` to an on-disk location.
 
         Models serialized at a given location can be later loaded from that
-        same location using the `ClusterCRF.trained` class method.
+        same location using the `ClusterCRF.trained` class method. The
+        complete model is pickled, and its weights are also exported to
+        an uncompressed NumPy archive, without the attributes pruned by
+        regularization, to be loaded without ``sklearn_crfsuite``.
 
         Arguments:
             model_path (`str`): The path to the directory where to write
@@ -391,11 +640,30 @@ class ClusterCRF(object):
         model_out = os.path.join(model_path, self._FILENAME)
         with open(model_out, "wb") as out:
             pickle.dump(self, out, protocol=4)
-        # compute a checksum for the pickled model
-        hasher = hashlib.md5()
-        with open(model_out, "rb") as out:
-            for chunk in iter(lambda: out.read(io.DEFAULT_BUFFER_SIZE), b""):
-                hasher.update(chunk)
-        # write the checksum next to the pickled file
-        with open(f"{model_out}.md5", "w") as out_hash:
-            out_hash.write(hasher.hexdigest())
+        # export the weights and the metadata of the model
+        npz_out = os.path.join(model_path, self._NPZ_FILENAME)
+        model = self._linear_chain().pruned()
+        arrays = {
+            "labels": _encode_strings(model.labels),
+            "attributes": _encode_strings(model.attributes),
+            "state_weights": model.state_weights,
+            "transition_weights": model.transition_weights,
+            "feature_type": numpy.array(self.feature_type),
+            "algorithm": numpy.array(self.algorithm),
+            "window": numpy.array([self.window_size, self.window_step]),
+        }
+        if self.significant_features is not None:
+            arrays["significant_features"] = _encode_strings(sorted(self.significant_features))
+        if self.significance is not None:
+            arrays["significance_features"] = _encode_strings(self.significance)
+            arrays["significance_pvalues"] = numpy.array(list(self.significance.values()), dtype=float)
+        with open(npz_out, "wb") as out:
+            numpy.savez(out, **arrays)
+        # compute a checksum for each file and write it next to the file
+        for path in (model_out, npz_out):
+            hasher = hashlib.md5()
+            with open(path, "rb") as out:
+                for chunk in iter(lambda: out.read(io.DEFAULT_BUFFER_SIZE), b""):
+                    hasher.update(chunk)
+            with open(f"{path}.md5", "w") as out_hash:
+                out_hash.write(hasher.hexdigest())
@@ -0,0 +1,407 @@
+"""Vectorized inference of linear-chain CRF marginals with NumPy.
+"""
+
+import collections
+import struct
+import threading
+import typing
+from typing import Callable, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy
+
+if typing.TYPE_CHECKING:
+    import sklearn_crfsuite
+
+__all__ = ["LinearChainCRF"]
+
+
+# NB: Layout of the binary model files written by CRFsuite (see
+#     `lib/crf/src/crf1d_model.c` and `lib/cqdb/src/cqdb.c` in the
+#     CRFsuite sources). Labels and attributes are stored in CQDB chunks,
+#     and features in an array of fixed-size records.
+_HEADER = struct.Struct("<4sI4s9I")
+_CHUNK = struct.Struct("<4sII")
+_CQDB_HEADER = struct.Struct("<4sIIIII")
+_CQDB_RECORD = struct.Struct("<iI")
+_FEATURE = numpy.dtype([("type", "<i4"), ("src", "<i4"), ("dst", "<i4"), ("weight", "<f8")])
+_FT_STATE = 0
+_FT_TRANS = 1
+
+
+def _read_strings(data: bytes, offset: int) -> List[str]:
+    # read the strings of a CQDB chunk in identifier order, using the
+    # backward array which stores the offset of the record of each string
+    chunk_id, _, _, _, count, backward = _CQDB_HEADER.unpack_from(data, offset)
+    if chunk_id != b"CQDB":
+        raise ValueError(f"Invalid CRFsuite model: expected CQDB chunk, found {chunk_id!r}")
+    strings = []
+    for record in struct.unpack_from(f"<{count}I", data, offset + backward):
+        _, size = _CQDB_RECORD.unpack_from(data, offset + record)
+        start = offset + record + _CQDB_RECORD.size
+        strings.append(data[start:start + size - 1].decode("utf-8"))
+    return strings
+
+
+class _MarginalsTable(typing.NamedTuple):
+    keys: numpy.ndarray
+    values: numpy.ndarray
+    stamps: numpy.ndarray
+
+
+class _MarginalsCache(object):
+    # a bounded LRU cache of window marginals, shared by all the models of
+    # a process: windows are keyed by the state scores of their items, and
+    # stored in a table of sorted keys for each set of transition weights,
+    # label and window size, so that lookups and evictions are vectorized
+
+    def __init__(self, maxsize: int, maxtables: int = 4) -> None:
+        self.maxsize = maxsize
+        self.maxtables = maxtables
+        self.lock = threading.Lock()
+        self.tick = 0
+        self.tables: "collections.OrderedDict[Hashable, _MarginalsTable]" = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return sum(len(table.keys) for table in self.tables.values())
+
+    def get(self, table_id: Hashable, keys: numpy.ndarray, out: numpy.ndarray) -> numpy.ndarray:
+        with self.lock:
+            table = self.tables.get(table_id)
+            if table is None:
+                return numpy.zeros(len(keys), dtype=bool)
+            self.tick += 1
+            self.tables.move_to_end(table_id)
+            index = numpy.searchsorted(table.keys, keys)
+            index[index == len(table.keys)] = 0
+            found = table.keys[index] == keys
+            table.stamps[index[found]] = self.tick
+            out[found] = table.values[index[found]]
+            return found
+
+    def put(self, table_id: Hashable, keys: numpy.ndarray, values: numpy.ndarray) -> None:
+        with self.lock:
+            self.tick += 1
+            table = self.tables.pop(table_id, None)
+            order = keys.argsort()
+            keys, values = keys[order], values[order]
+            stamps = numpy.full(len(keys), self.tick, dtype=numpy.int64)
+            # merge the new windows into the sorted table, which is cheaper
+            # than sorting the whole table again when adding a few windows
+            if table is not None:
+                index = numpy.searchsorted(table.keys, keys)
+                keys = numpy.insert(table.keys, index, keys)
+                values = numpy.insert(table.values, index, values, axis=0)
+                stamps = numpy.insert(table.stamps, index, stamps)
+            # evict the least recently used windows, keeping the order
+            if len(keys) > self.maxsize:
+                recent = numpy.argpartition(-stamps, self.maxsize - 1)[:self.maxsize]
+                recent.sort()
+                keys, values, stamps = keys[recent], values[recent], stamps[recent]
+            self.tables[table_id] = _MarginalsTable(keys, values, stamps)
+            while len(self.tables) > self.maxtables:
+                self.tables.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.tables.clear()
+
+
+class LinearChainCRF(object):
+    """A linear-chain CRF computing marginals with NumPy array operations.
+
+    The weights of the model are stored in dense arrays, so that the
+    marginals of many sequences of the same length can be computed at
+    once with the forward-backward algorithm.
+
+    Marginals of windows computed by `LinearChainCRF.sliding_marginals`
+    are kept in a bounded cache shared by all instances in the process,
+    so that windows with the same features are only computed once.
+
+    """
+
+    _cache = _MarginalsCache(maxsize=32768)
+
+    # the number of windows whose scores are copied at once to find
+    # the windows with the same scores in `sliding_marginals`
+    _KEY_BATCH_SIZE = 65536
+
+    @classmethod
+    def from_crfsuite(cls, model: "sklearn_crfsuite.CRF") -> "LinearChainCRF":
+        """Export the weights of a trained `sklearn_crfsuite.CRF` model.
+
+        The weights are read from the binary model file, since the
+        ``state_features_`` and ``transition_features_`` attributes of
+        the model only store weights rounded to 6 decimal places.
+
+        Arguments:
+            model (`sklearn_crfsuite.CRF`): A trained CRF model.
+
+        Raises:
+            `ValueError`: When the model file could not be parsed.
+
+        """
+        with open(model.modelfile.name, "rb") as f:
+            data = f.read()
+        # read the header and check the type of the model
+        header = _HEADER.unpack_from(data, 0)
+        magic, _, model_type, _, _, _, _, off_features, off_labels, off_attrs, _, _ = header
+        if magic != b"lCRF" or model_type != b"FOMC":
+            raise ValueError("Invalid CRFsuite model: not a linear-chain CRF model")
+        labels = _read_strings(data, off_labels)
+        attributes = _read_strings(data, off_attrs)
+        # read the features and build the weight matrices
+        chunk_id, _, count = _CHUNK.unpack_from(data, off_features)
+        if chunk_id != b"FEAT":
+            raise ValueError(f"Invalid CRFsuite model: expected FEAT chunk, found {chunk_id!r}")
+        features = numpy.frombuffer(data, dtype=_FEATURE, count=count, offset=off_features + _CHUNK.size)
+        state_weights = numpy.zeros((len(attributes), len(labels)))
+        transition_weights = numpy.zeros((len(labels), len(labels)))
+        state = features[features["type"] == _FT_STATE]
+        state_weights[state["src"], state["dst"]] = state["weight"]
+        transitions = features[features["type"] == _FT_TRANS]
+        transition_weights[transitions["src"], transitions["dst"]] = transitions["weight"]
+        return cls(labels, attributes, state_weights, transition_weights)
+
+    def __init__(
+        self,
+        labels: Sequence[str],
+        attributes: Sequence[str],
+        state_weights: numpy.ndarray,
+        transition_weights: numpy.ndarray,
+    ) -> None:
+        """Create a new linear-chain CRF from its weights.
+
+        Arguments:
+            labels (sequence of `str`): The names of the labels.
+            attributes (sequence of `str`): The names of the attributes.
+            state_weights (`numpy.ndarray`): The weights of the state
+                features, as a matrix of shape (attributes, labels).
+            transition_weights (`numpy.ndarray`): The weights of the
+                transition features, as a matrix of shape (labels, labels)
+                indexed by previous and next label.
+
+        Raises:
+            `ValueError`: When the weight matrices do not have the right
+                shape.
+
+        """
+        self.labels = list(labels)
+        self.attributes = {name: i for i, name in enumerate(attributes)}
+        self.state_weights = numpy.asarray(state_weights, dtype=numpy.float64)
+        self.transition_weights = numpy.asarray(transition_weights, dtype=numpy.float64)
+        if self.state_weights.shape != (len(self.attributes), len(self.labels)):
+            raise ValueError(f"Invalid shape for state weights: {self.state_weights.shape!r}")
+        if self.transition_weights.shape != (len(self.labels), len(self.labels)):
+            raise ValueError(f"Invalid shape for transition weights: {self.transition_weights.shape!r}")
+
+    def pruned(self) -> "LinearChainCRF":
+        """Get a copy of the model without the attributes of null weight.
+
+        Attributes with a null weight for every label, such as the ones
+        eliminated by L1 regularization, have no effect on the marginals.
+
+        Returns:
+            `LinearChainCRF`: A new model with only the attributes having
+            at least one non-zero state weight.
+
+        """
+        keep = numpy.flatnonzero(self.state_weights.any(axis=1))
+        names = list(self.attributes)
+        return type(self)(
+            self.labels,
+            [names[i] for i in keep],
+            self.state_weights[keep],
+            self.transition_weights,
+        )
+
+    def state_scores(self, features: Sequence[Mapping[str, float]]) -> numpy.ndarray:
+        """Compute the state scores of each item of a sequence.
+
+        Arguments:
+            features (sequence of `dict`): The attributes of each item
+                of the sequence, with their values. Attributes unknown
+                to the model are ignored.
+
+        Returns:
+            `numpy.ndarray`: The score of each label for each item, as a
+            matrix of shape (items, labels).
+
+        """
+        rows, columns, values = [], [], []
+        for i, item in enumerate(features):
+            for name, value in item.items():
+                column = self.attributes.get(name)
+                if column is not None:
+                    rows.append(i)
+                    columns.append(column)
+                    values.append(float(value))
+        scores = numpy.zeros((len(features), len(self.labels)))
+        weights = self.state_weights[columns] * numpy.asarray(values)[:, None]
+        numpy.add.at(scores, numpy.asarray(rows, dtype=numpy.intp), weights)
+        return scores
+
+    def marginals(self, scores: numpy.ndarray) -> numpy.ndarray:
+        """Compute the marginals of a batch of sequences of the same length.
+
+        Arguments:
+            scores (`numpy.ndarray`): The state scores of each sequence, as
+                an array of shape (sequences, items, labels).
+
+        Returns:
+            `numpy.ndarray`: The marginal probability of each label for
+            each item of each sequence, with the same shape as ``scores``.
+
+        """
+        length = scores.shape[1]
+        # use scaled forward and backward probabilities like CRFsuite, with
+        # the scores of each item shifted by their maximum to avoid overflow
+        # (a constant shift of all labels of an item cancels out in the
+        # marginals)
+        state = numpy.exp(scores - scores.max(axis=2, keepdims=True))
+        transitions = numpy.exp(self.transition_weights)
+        alpha = numpy.empty_like(state)
+        beta = numpy.empty_like(state)
+        alpha[:, 0] = state[:, 0]
+        alpha[:, 0] /= alpha[:, 0].sum(axis=1, keepdims=True)
+        for t in range(1, length):
+            numpy.matmul(alpha[:, t-1], transitions, out=alpha[:, t])
+            alpha[:, t] *= state[:, t]
+            alpha[:, t] /= alpha[:, t].sum(axis=1, keepdims=True)
+        beta[:, -1] = 1
+        for t in range(length - 2, -1, -1):
+            numpy.matmul(state[:, t+1] * beta[:, t+1], transitions.T, out=beta[:, t])
+            beta[:, t] /= beta[:, t].sum(axis=1, keepdims=True)
+        # the scaling factors of each item cancel out when normalizing
+        marginals = alpha * beta
+        marginals /= marginals.sum(axis=2, keepdims=True)
+        return marginals
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Clear the cache of window marginals shared by all instances.
+        """
+        cls._cache.clear()
+
+    def _window_marginals(
+        self,
+        state: numpy.ndarray,
+        starts: numpy.ndarray,
+        window_size: int,
+        column: int,
+    ) -> numpy.ndarray:
+        # compute the marginals of a label for the windows at the given
+        # starts, storing the messages by position in the window so that
+        # each step of the recursion works on a contiguous array
+        transitions = numpy.exp(self.transition_weights)
+        alpha = numpy.empty((window_size, len(starts), len(self.labels)))
+        beta = numpy.empty_like(alpha)
+        alpha[0] = state[starts]
+        alpha[0] /= alpha[0].sum(axis=1, keepdims=True)
+        for j in range(1, window_size):
+            numpy.matmul(alpha[j-1], transitions, out=alpha[j])
+            alpha[j] *= state[starts + j]
+            alpha[j] /= alpha[j].sum(axis=1, keepdims=True)
+        beta[-1] = 1
+        for j in range(window_size - 2, -1, -1):
+            numpy.matmul(state[starts + j + 1] * beta[j+1], transitions.T, out=beta[j])
+            beta[j] /= beta[j].sum(axis=1, keepdims=True)
+        alpha *= beta
+        return (alpha[:, :, column] / alpha.sum(axis=2)).T
+
+    def sliding_marginals(
+        self,
+        sequences: Sequence[Sequence[Mapping[str, float]]],
+        label: str,
+        window_size: int,
+        window_step: int,
+        *,
+        batch_size: int = 4096,
+        cache: bool = True,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> List[numpy.ndarray]:
+        """Compute the maximum marginals of a label over sliding windows.
+
+        The marginals of each window are computed as if each window was a
+        separate sequence, but the state scores of each item are computed
+        only once, and shared by all the windows containing that item.
+        Windows are processed in chunks of bounded size: windows of a
+        chunk with the same state scores are only computed once, and
+        their marginals are kept in a bounded cache shared by all the
+        calls in the process. The remaining windows are processed in
+        batches, advancing the forward and backward messages of all the
+        windows of a batch at the same time.
+
+        Arguments:
+            sequences (sequence of sequences of `dict`): The attributes
+                of each item of each sequence.
+            label (`str`): The label to compute the marginals of.
+            window_size (`int`): The size of the sliding window.
+            window_step (`int`): The step between consecutive windows.
+
+        Keyword Arguments:
+            batch_size (`int`): The number of windows to process at once.
+            cache (`bool`): Whether to look up and store the marginals of
+                the windows in the cache shared by all instances.
+            progress (callable, optional): A callable that accepts two
+                `int`, the number of windows processed so far and the
+                total number of windows.
+
+        Returns:
+            `list` of `numpy.ndarray`: The maximum marginal of ``label``
+            over all the windows containing each item of each sequence,
+            or zero for items not contained in any window.
+
+        """
+        _progress = progress or (lambda x,y: None)
+        column = self.labels.index(label)
+        # compute the state scores of all sequences in a single array
+        lengths = [len(sequence) for sequence in sequences]
+        offsets = numpy.zeros(len(sequences) + 1, dtype=numpy.intp)
+        numpy.cumsum(lengths, out=offsets[1:])
+        scores = numpy.concatenate([
+            self.state_scores(sequence) for sequence in sequences
+        ]) if sequences else numpy.zeros((0, len(self.labels)))
+        # find the start of every window in the concatenated sequences
+        starts = numpy.concatenate([
+            numpy.arange(offset, offset + length - window_size + 1, window_step, dtype=numpy.intp)
+            for offset, length in zip(offsets, lengths)
+        ]) if sequences else numpy.zeros(0, dtype=numpy.intp)
+        # shift the state scores of each item by their maximum (see
+        # `LinearChainCRF.marginals`), so that items with the same features
+        # always have the same scores, and exponentiate them once
+        scores -= scores.max(axis=1, keepdims=True)
+        state = numpy.exp(scores)
+        # process the windows chunk by chunk, only copying the scores of
+        # the windows of the current chunk to find the windows with the
+        # same scores, which have the same marginals
+        table_id = (window_size, column, self.transition_weights.tobytes())
+        positions = numpy.arange(window_size)
+        key_dtype = numpy.dtype((numpy.void, window_size * len(self.labels) * scores.itemsize))
+        key_batch_size = max(batch_size, self._KEY_BATCH_SIZE)
+        maxima = numpy.zeros(len(scores))
+        _progress(0, len(starts))
+        for i in range(0, len(starts), key_batch_size):
+            chunk = starts[i:i+key_batch_size]
+            windows = scores[chunk[:, None] + positions].reshape(len(chunk), window_size * len(self.labels))
+            keys = numpy.ascontiguousarray(windows).view(key_dtype).ravel()
+            keys, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+            del windows
+            # recover the marginals of known windows from the cache, and
+            # compute the marginals of the other windows batch by batch
+            unique_marginals = numpy.empty((len(keys), window_size))
+            missing = numpy.arange(len(keys))
+            if cache:
+                found = self._cache.get(table_id, keys, out=unique_marginals)
+                missing = missing[~found]
+            for j in range(0, len(missing), batch_size):
+                batch = missing[j:j+batch_size]
+                unique_marginals[batch] = self._window_marginals(state, chunk[first[batch]], window_size, column)
+            if cache and len(missing):
+                self._cache.put(table_id, keys[missing], unique_marginals[missing])
+            # keep the maximum marginal over all windows (windows starts are
+            # unique, so the items at a given window position never overlap)
+            marginals = unique_marginals[inverse.ravel()]
+            for j in range(window_size):
+                maxima[chunk + j] = numpy.maximum(maxima[chunk + j], marginals[:, j])
+            _progress(i + len(chunk), len(starts))
+        return [maxima[start:end] for start, end in zip(offsets, offsets[1:])]
@@ -9,19 +9,28 @@ import csv
 import errno
 import glob
 import gzip
+import hashlib
+import heapq
+import io
 import itertools
+import json
+import operator
 import os
 import re
+import shutil
+import sqlite3
 import subprocess
 import tempfile
 import typing
-from typing import Any, BinaryIO, Callable, Container, Dict, Optional, Iterable, Iterator, List, Mapping, Type, Sequence
+from array import array
+from multiprocessing.pool import Pool
+from typing import Any, BinaryIO, Callable, Container, Dict, Optional, Iterable, Iterator, List, Mapping, Sized, Tuple, Type, Sequence
 
 import pyhmmer
 from Bio import SeqIO
-from pyhmmer.hmmer import hmmsearch
+from pyhmmer.hmmer import hmmsearch, hmmscan
 
-from .._meta import requires, UniversalContainer
+from .._meta import requires, make_shareable, UniversalContainer
 from ..model import Gene, Domain
 from ..interpro import InterPro
 
@@ -30,7 +39,7 @@ try:
 except ImportError:
     import importlib_resources  # type: ignore
 
-__all__ = ["DomainAnnotator", "HMM", "PyHMMER", "embedded_hmms"]
+__all__ = ["DomainAnnotator", "HMM", "PyHMMER", "digitize_proteins", "embedded_hmms"]
 
 
 class HMM(typing.NamedTuple):
@@ -58,6 +67,222 @@ class HMM(typing.NamedTuple):
         return regex.sub(after, domain)
 
 
+class _IndexEntry(typing.NamedTuple):
+    """The location of a single HMM in a text HMM library.
+    """
+
+    accession: Optional[str]
+    name: str
+    offset: int
+    length: int
+
+
+def _index_path(path: str) -> str:
+    return f"{path}.idx"
+
+
+def _build_index(path: str) -> List[_IndexEntry]:
+    """Scan a text HMM library to find the byte offset of every HMM.
+    """
+    entries = []
+    offset = start = 0
+    name = accession = None
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith(b"HMMER"):
+                start = offset
+                name = accession = None
+            elif line.startswith(b"NAME "):
+                name = line[5:].strip().decode()
+            elif line.startswith(b"ACC "):
+                accession = line[4:].strip().decode()
+            elif line.startswith(b"//"):
+                if name is None:
+                    raise ValueError(f"Missing NAME line in HMM at offset {start} of {path!r}")
+                entries.append(_IndexEntry(accession, name, start, offset + len(line) - start))
+            offset += len(line)
+    return entries
+
+
+def _write_index(path: str, entries: List[_IndexEntry]) -> None:
+    """Write the index of a library next to it, atomically.
+    """
+    stat = os.stat(path)
+    folder = os.path.dirname(os.path.abspath(path))
+    # libraries in shared read-only locations are indexed in memory only
+    if not os.access(folder, os.W_OK):
+        return
+    with tempfile.NamedTemporaryFile("w", dir=folder, suffix=".tmp", delete=False) as dst:
+        try:
+            dst.write(f"#gecco-hmm-index\t2\t{stat.st_size}\t{stat.st_mtime_ns}\t{len(entries)}\n")
+            for entry in entries:
+                dst.write(f"{entry.accession or ''}\t{entry.name}\t{entry.offset}\t{entry.length}\n")
+            dst.flush()
+            make_shareable(dst.name)
+            os.replace(dst.name, _index_path(path))
+        except BaseException:
+            os.remove(dst.name)
+            raise
+
+
+def _read_index(path: str) -> Optional[List[_IndexEntry]]:
+    """Read the index of a library, or `None` if missing, outdated or invalid.
+    """
+    try:
+        with open(_index_path(path)) as src:
+            header = src.readline().rstrip("\n").split("\t")
+            stat = os.stat(path)
+            if header[:-1] != ["#gecco-hmm-index", "2", str(stat.st_size), str(stat.st_mtime_ns)]:
+                return None
+            entries = []
+            for line in src:
+                accession, name, offset, length = line.rstrip("\n").split("\t")
+                entries.append(_IndexEntry(accession or None, name, int(offset), int(length)))
+            # check the index was not truncated
+            if len(entries) != int(header[-1]):
+                return None
+            return entries
+    except (OSError, ValueError):
+        return None
+
+
+class _DomainHit(typing.NamedTuple):
+    """A domain found by HMMER, before being converted to a `Domain`.
+    """
+
+    accession: str
+    start: int
+    end: int
+    i_evalue: float
+    pvalue: float
+
+    @classmethod
+    def from_domain(cls, domain: pyhmmer.plan7.Domain) -> "_DomainHit":
+        assert domain.env_from < domain.env_to
+        assert domain.i_evalue >= 0
+        assert domain.pvalue >= 0
+        raw_acc = domain.alignment.hmm_accession or domain.alignment.hmm_name
+        return cls(
+            raw_acc.decode('utf-8'),
+            domain.alignment.target_from,
+            domain.alignment.target_to,
+            domain.i_evalue,
+            domain.pvalue,
+        )
+
+
+class _DomainCache(object):
+    """An on-disk cache of the domains found in protein sequences.
+
+    Proteins are identified by a digest of their sequence, and domains
+    are stored separately for each bitscore cutoff, so that the domains found in a
+    protein can be reused for any protein with the same sequence. The
+    cache is stored with the profiles of the HMM library it belongs to.
+
+    """
+
+    # the maximum number of digests to query at once, to stay below the
+    # maximum number of SQL variables supported by SQLite
+    _BATCH_SIZE = 500
+
+    def __init__(self, path: str) -> None:
+        self.connection = sqlite3.connect(path, timeout=60)
+        with self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS domains (
+                    bit_cutoffs TEXT NOT NULL,
+                    sequence BLOB NOT NULL,
+                    hits TEXT NOT NULL,
+                    PRIMARY KEY (bit_cutoffs, sequence)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get(self, bit_cutoffs: Optional[str], digests: Sequence[bytes]) -> Dict[bytes, List[_DomainHit]]:
+        """Get the domains of the proteins with the given digests, if cached.
+        """
+        cached = {}
+        for i in range(0, len(digests), self._BATCH_SIZE):
+            batch = digests[i:i+self._BATCH_SIZE]
+            query = "SELECT sequence, hits FROM domains WHERE bit_cutoffs = ? AND sequence IN ({})".format(
+                ", ".join(itertools.repeat("?", len(batch)))
+            )
+            for digest, hits in self.connection.execute(query, (bit_cutoffs or "", *batch)):
+                cached[digest] = [_DomainHit(*hit) for hit in json.loads(hits)]
+        return cached
+
+    def put(self, bit_cutoffs: Optional[str], items: Iterable[Tuple[bytes, List[_DomainHit]]]) -> None:
+        """Store the domains of the proteins with the given digests.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO domains VALUES (?, ?, ?)",
+                ((bit_cutoffs or "", digest, json.dumps(hits)) for digest, hits in items)
+            )
+
+
+# --- Process-based domain search --------------------------------------------
+
+# NB: Domains are sent back from the worker processes as flat arrays with
+#     the following integer and floating-point fields for each domain,
+#     together with the accession of each HMM of the shard.
+_HIT_INT_FIELDS = 4     # HMM rank, target index, start, end
+_HIT_FLOAT_FIELDS = 2   # independent E-value, p-value
+
+# NB: The sequences are stored under a key unique to each call, since
+#     workers of a thread pool share the state of the parent process,
+#     possibly with workers of concurrent calls.
+_worker_sequences: Dict[int, pyhmmer.easel.DigitalSequenceBlock] = {}
+_worker_keys = itertools.count()
+
+
+def _init_worker(key: int, sequences: List[Tuple[bytes, bytes]]) -> None:
+    alphabet = pyhmmer.easel.Alphabet.amino()
+    _worker_sequences[key] = pyhmmer.easel.DigitalSequenceBlock(alphabet, [
+        pyhmmer.easel.DigitalSequence(alphabet, name=name, sequence=sequence)
+        for name, sequence in sequences
+    ])
+
+
+def _search_shard(
+    task: Tuple[int, Sequence[int], List[pyhmmer.plan7.HMM], Optional[int], Optional[str]],
+) -> Tuple[Sequence[int], Tuple["array[int]", "array[float]"], List[str]]:
+    key, ranks, hmms, size, bit_cutoffs = task
+    sequences = _worker_sequences[key]
+    ints = array("q")
+    floats = array("d")
+    accessions = []
+    hmms_hits = hmmsearch(hmms, sequences, cpus=1, Z=size, domZ=size, bit_cutoffs=bit_cutoffs)  # type: ignore
+    for rank, hmm, hits in zip(ranks, hmms, hmms_hits):
+        accessions.append((hmm.accession or hmm.name).decode("utf-8"))
+        for hit in hits.reported:
+            target_index = int(hit.name)
+            for domain in hit.domains.reported:
+                domain_hit = _DomainHit.from_domain(domain)
+                ints.extend((rank, target_index, domain_hit.start, domain_hit.end))
+                floats.extend((domain_hit.i_evalue, domain_hit.pvalue))
+    return ranks, (ints, floats), accessions
+
+
+def _decode_shard(
+    ranks: Sequence[int],
+    columns: Tuple["array[int]", "array[float]"],
+    accessions: List[str],
+) -> List[Tuple[int, int, _DomainHit]]:
+    ints, floats = columns
+    names = dict(zip(ranks, accessions))
+    hits = []
+    for i in range(len(floats) // _HIT_FLOAT_FIELDS):
+        rank, target_index, start, end = ints[i*_HIT_INT_FIELDS:(i+1)*_HIT_INT_FIELDS]
+        i_evalue, pvalue = floats[i*_HIT_FLOAT_FIELDS:(i+1)*_HIT_FLOAT_FIELDS]
+        hits.append((rank, target_index, _DomainHit(names[rank], start, end, i_evalue, pvalue)))
+    return hits
+
+
 class DomainAnnotator(metaclass=abc.ABCMeta):
     """An abstract class for annotating genes with protein domains.
     """
@@ -95,109 +320,608 @@ class PyHMMER(DomainAnnotator):
     """A domain annotator that uses `pyhmmer`.
     """
 
+    _STRATEGIES = frozenset({"auto", "search", "scan"})
+
+    # the number of sequences per CPU below which scanning sequences
+    # against all the HMMs is faster than searching the HMMs
+    _SCAN_SEQUENCES_PER_CPU = 8
+
+    def __init__(
+        self,
+        hmm: HMM,
+        cpus: Optional[int] = None,
+        whitelist: Optional[Container[str]] = None,
+        *,
+        cache_dir: Optional[str] = None,
+        index: bool = False,
+        strategy: str = "auto",
+        block_size: Optional[int] = None,
+    ) -> None:
+        """Prepare a new HMMER annotation handler with the given ``hmms``.
+
+        Arguments:
+            hmm (str): The path to the file containing the HMMs.
+            cpus (int, optional): The number of CPUs to allocate for the
+                ``hmmsearch`` command. Give ``None`` to use the default.
+            whitelist (container of str): If given, a container containing
+                the accessions of the individual HMMs to annotate with. If
+                `None` is given, annotate with the entire file.
+
+        Keyword Arguments:
+            cache_dir (str, optional): The path to a directory where to
+                store the optimized profiles of the selected HMMs, so that
+                they can be loaded without parsing the HMM library again
+                in later runs, as well as the domains found in each protein
+                for libraries of known size, so that only new protein
+                sequences are searched. Give `None` to disable caching.
+            index (bool): Whether to use an index of the HMM library to
+                only read the HMMs in the whitelist. The index is created
+                next to the library if missing or outdated. Only supported
+                for uncompressed libraries in text format, other libraries
+                are always read entirely.
+            strategy (str): The direction of the search, either ``search``
+                to search the HMMs against the proteins (like ``hmmsearch``),
+                ``scan`` to scan the proteins against the HMMs (like
+                ``hmmscan``), or ``auto`` to select it from the number of
+                proteins and HMMs. Both give identical results.
+            block_size (int, optional): The maximum number of residues to
+                search at once. Proteins are searched in blocks of bounded
+                size, and their domains are transcribed after each block,
+                to bound the memory used for the search. Only supported for
+                libraries of known size, since E-values otherwise depend
+                on the number of proteins searched together. Give `None`
+                to search all proteins at once.
+
+        Raises:
+            ValueError: When ``strategy`` is not a known strategy, or is
+                ``scan`` for an HMM library of unknown size.
+
+        """
+        super().__init__(hmm, cpus, whitelist)
+        if strategy not in self._STRATEGIES:
+            raise ValueError(f"Invalid search strategy: {strategy!r}")
+        if strategy == "scan" and hmm.size is None:
+            raise ValueError(f"Cannot scan with {hmm.id!r} HMMs: library size is unknown")
+        self.cache_dir = cache_dir
+        self.index = index
+        self.strategy = strategy
+        self.block_size = block_size
+
+    def _library_index(self) -> Optional[List[_IndexEntry]]:
+        # only uncompressed text libraries can be indexed
+        if self.hmm.path.endswith(".gz"):
+            return None
+        with open(self.hmm.path, "rb") as f:
+            if not f.read(5) == b"HMMER":
+                return None
+        # use the existing index if valid, or (re)build it
+        entries = _read_index(self.hmm.path)
+        if entries is None:
+            entries = _build_index(self.hmm.path)
+            try:
+                _write_index(self.hmm.path, entries)
+            except OSError:
+                pass  # read-only location, use the index for this run only
+        return entries
+
+    def _load_indexed_hmms(self) -> Optional[List[pyhmmer.plan7.HMM]]:
+        entries = self._library_index()
+        if entries is None:
+            return None
+        # read the selected HMMs in a single buffer
+        selected = [
+            entry
+            for entry in entries
+            if entry.accession is None
+            or self.hmm.relabel(entry.accession) in self.whitelist
+        ]
+        if not selected:
+            return []
+        buffer = io.BytesIO()
+        with open(self.hmm.path, "rb") as f:
+            for entry in selected:
+                f.seek(entry.offset)
+                buffer.write(f.read(entry.length))
+        buffer.seek(0)
+        with pyhmmer.plan7.HMMFile(buffer) as hmm_file:
+            hmms = list(hmm_file)
+        # check the HMMs found at the indexed locations are the right ones
+        for entry, hmm in zip(selected, hmms):
+            if hmm.name.decode() != entry.name:
+                raise ValueError(f"Invalid index for {self.hmm.path!r}: found {hmm.name!r} instead of {entry.name!r}")
+        if len(hmms) != len(selected):
+            raise ValueError(f"Invalid index for {self.hmm.path!r}: expected {len(selected)} HMMs, found {len(hmms)}")
+        return hmms
+
+    def _load_hmms(self, ctx: contextlib.ExitStack) -> Iterator[pyhmmer.plan7.HMM]:
+        # only read the whitelisted HMMs if the library can be indexed
+        # and the index matches the library
+        if self.index and not isinstance(self.whitelist, UniversalContainer):
+            try:
+                hmms = self._load_indexed_hmms()
+            except ValueError:
+                hmms = None
+            if hmms is not None:
+                return iter(hmms)
+        # decompress the input if needed
+        file: BinaryIO = ctx.enter_context(open(self.hmm.path, "rb"))
+        if self.hmm.path.endswith(".gz"):
+            file = ctx.enter_context(gzip.GzipFile(fileobj=file, mode="rb"))  # type: ignore
+        # Only retain the HMMs which are in the whitelist
+        hmm_file = ctx.enter_context(pyhmmer.plan7.HMMFile(file))
+        return (
+            hmm
+            for hmm in hmm_file
+            if hmm.accession is None
+            or self.hmm.relabel(hmm.accession.decode()) in self.whitelist
+        )
+
+    def _cache_key(self) -> str:
+        # identify the library by its checksum, or by the MD5 of the file
+        # for custom libraries without a precomputed one
+        if self.hmm.md5 is not None:
+            library = self.hmm.md5
+        else:
+            file_hasher = hashlib.md5()
+            with open(self.hmm.path, "rb") as f:
+                for block in iter(lambda: f.read(io.DEFAULT_BUFFER_SIZE * 16), b""):
+                    file_hasher.update(block)
+            library = file_hasher.hexdigest()
+        # identify the selected HMMs with a hash of the whitelist
+        hasher = hashlib.md5()
+        hasher.update(f"{library}\0{self.hmm.version}\0{self.hmm.size}\0{self.hmm.relabel_with}\0{pyhmmer.__version__}\0".encode())
+        if isinstance(self.whitelist, UniversalContainer):
+            hasher.update(b"*")
+        else:
+            hasher.update("\n".join(sorted(self.whitelist)).encode())  # type: ignore
+        return hasher.hexdigest()
+
+    def _cache_folder(self, press: bool = True) -> str:
+        assert self.cache_dir is not None
+        folder = os.path.join(self.cache_dir, f"{self.hmm.id}.{self._cache_key()}")
+        os.makedirs(folder, exist_ok=True)
+        # press the selected HMMs in a temporary folder, and move it to its
+        # final location only once complete, in case of concurrent runs
+        profiles = os.path.join(folder, "profiles")
+        if press and not os.path.exists(profiles):
+            tmp = tempfile.mkdtemp(dir=folder, prefix="profiles.", suffix=".tmp")
+            try:
+                with contextlib.ExitStack() as ctx:
+                    pyhmmer.hmmer.hmmpress(self._load_hmms(ctx), os.path.join(tmp, "profiles"))
+                # `mkdtemp` creates a private folder, so make the entry
+                # readable by other users before publishing it
+                for name in os.listdir(tmp):
+                    make_shareable(os.path.join(tmp, name))
+                make_shareable(tmp)
+                os.replace(tmp, profiles)
+            except OSError:
+                if not os.path.exists(profiles):
+                    raise
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+        return folder
+
+    def _load_optimized_profiles(self, folder: str) -> List[pyhmmer.plan7.OptimizedProfile]:
+        db = os.path.join(folder, "profiles", "profiles")
+        # an empty database cannot be opened, but there is nothing to load
+        if os.stat(f"{db}.h3m").st_size == 0:
+            return []
+        with pyhmmer.plan7.HMMPressedFile(db) as pressed_file:
+            return list(pressed_file)
+
+    def prepare(self) -> None:
+        """Prepare the HMM library for annotation ahead of a call to `run`.
+
+        This presses the optimized profiles of the selected HMMs if a
+        cache directory was given, or otherwise builds the index of the
+        library if indexing is enabled, so that it can be done in the
+        background while the genes to annotate are not available yet.
+        Calling `run` without preparing the library first is supported,
+        and gives the same results.
+
+        """
+        if self.cache_dir is not None:
+            self._cache_folder()
+        elif self.index and not isinstance(self.whitelist, UniversalContainer):
+            self._library_index()
+
+    def _open_domain_cache(self, folder: str) -> Optional[_DomainCache]:
+        # without a library size, E-values depend on the other proteins
+        # given to `hmmsearch`, so the domains of a protein cannot be reused
+        if self.hmm.size is None:
+            return None
+        # the cache entry may not be writable, e.g. if created by another user
+        try:
+            return _DomainCache(os.path.join(folder, "domains.sqlite"))
+        except sqlite3.Error:
+            return None
+
+    def _select_strategy(self, sequences: int, cpus: int) -> str:
+        if self.strategy != "auto":
+            return self.strategy
+        # without a library size, E-values of `hmmsearch` depend on the
+        # number of targets, which cannot be reproduced with `hmmscan`
+        if self.hmm.size is None:
+            return "search"
+        # `hmmsearch` parallelizes over HMMs and `hmmscan` over sequences,
+        # so only scan if it can keep as many threads busy, and if there
+        # are few enough sequences for scanning to be faster
+        cpus = cpus or os.cpu_count() or 1
+        if isinstance(self.whitelist, Sized):
+            hmms = min(len(self.whitelist), self.hmm.size)
+        else:
+            hmms = self.hmm.size
+        if min(cpus, hmms) <= sequences <= cpus * self._SCAN_SEQUENCES_PER_CPU:
+            return "scan"
+        return "search"
+
+    def _search(
+        self,
+        profiles: Iterable[Any],
+        sequences: pyhmmer.easel.DigitalSequenceBlock,
+        cpus: int,
+        progress: Optional[Callable[[pyhmmer.plan7.HMM, int], None]] = None,
+        bit_cutoffs: Optional[str] = None,
+    ) -> Iterator[Tuple[int, _DomainHit]]:
+        hmms_hits = hmmsearch(
+            profiles,
+            sequences,
+            cpus=cpus,
+            callback=progress, # type: ignore
+            Z=self.hmm.size,  # type: ignore
+            domZ=self.hmm.size, # type: ignore
+            bit_cutoffs=bit_cutoffs,  # type: ignore
+        )
+        for hits in hmms_hits:
+            for hit in hits.reported:
+                target_index = int(hit.name)
+                for domain in hit.domains.reported:
+                    yield target_index, _DomainHit.from_domain(domain)
+
+    def _scan(
+        self,
+        profiles: Iterable[Any],
+        sequences: pyhmmer.easel.DigitalSequenceBlock,
+        cpus: int,
+        progress: Optional[Callable[[pyhmmer.plan7.HMM, int], None]] = None,
+        bit_cutoffs: Optional[str] = None,
+    ) -> Iterator[Tuple[int, _DomainHit]]:
+        profiles = list(profiles)
+        ranks = {profile.name: rank for rank, profile in enumerate(profiles)}
+        # collect the domains of all sequences, and sort them in the order
+        # of the HMMs they were found with, like `hmmsearch` would report
+        found = []
+        seqs_hits = hmmscan(
+            sequences,
+            profiles,
+            cpus=cpus,
+            Z=self.hmm.size,  # type: ignore
+            domZ=self.hmm.size, # type: ignore
+            bit_cutoffs=bit_cutoffs,  # type: ignore
+        )
+        for hits in seqs_hits:
+            target_index = int(hits.query_name)
+            for hit in hits.reported:
+                for domain in hit.domains.reported:
+                    found.append((ranks[hit.name], target_index, _DomainHit.from_domain(domain)))
+        found.sort(key=operator.itemgetter(0))
+        # report progress once all HMMs have been processed
+        if progress is not None:
+            for profile in profiles:
+                progress(profile, len(profiles))
+        for _, target_index, domain_hit in found:
+            yield target_index, domain_hit
+
+    def _search_sharded(
+        self,
+        profiles: Iterable[pyhmmer.plan7.HMM],
+        sequences: pyhmmer.easel.DigitalSequenceBlock,
+        cpus: int,
+        pool_factory: Type[Pool],
+        progress: Optional[Callable[[pyhmmer.plan7.HMM, int], None]] = None,
+        bit_cutoffs: Optional[str] = None,
+    ) -> Iterator[Tuple[int, _DomainHit]]:
+        hmms = list(profiles)
+        if not hmms:
+            return
+        # distribute the HMMs to the workers in a round-robin fashion, so
+        # that shards get HMMs of similar lengths
+        processes = min(cpus or os.cpu_count() or 1, len(hmms))
+        key = next(_worker_keys)
+        tasks = [
+            (key, ranks, [hmms[rank] for rank in ranks], self.hmm.size, bit_cutoffs)
+            for ranks in (range(shard, len(hmms), processes) for shard in range(processes))
+        ]
+        # send the sequences once to each worker, and only get back
+        # the domain coordinates and scores
+        sequences_data = [(esl_sq.name, bytes(esl_sq.sequence)) for esl_sq in sequences]
+        initargs = (key, sequences_data)
+        shards = []
+        try:
+            with pool_factory(processes, initializer=_init_worker, initargs=initargs) as pool:
+                for ranks, columns, accessions in pool.imap_unordered(_search_shard, tasks):
+                    shards.append(_decode_shard(ranks, columns, accessions))
+                    if progress is not None:
+                        for rank in ranks:
+                            progress(hmms[rank], len(hmms))
+        finally:
+            _worker_sequences.pop(key, None)
+        # merge the hits of all shards in the order of the HMMs, like
+        # `hmmsearch` would report them
+        for _, target_index, domain_hit in heapq.merge(*shards, key=operator.itemgetter(0)):
+            yield target_index, domain_hit
+
+    def _blocks(self, gene_index: List[Gene], targets: Iterable[int]) -> Iterator[List[int]]:
+        # without a library size, all proteins must be searched together
+        # to get the same E-values
+        if self.block_size is None or self.hmm.size is None:
+            yield list(targets)
+            return
+        block: List[int] = []
+        residues = 0
+        for i in targets:
+            length = len(gene_index[i].protein.seq)
+            if block and residues + length > self.block_size:
+                yield block
+                block = []
+                residues = 0
+            block.append(i)
+            residues += length
+        if block:
+            yield block
+
+    def _transcribe(
+        self,
+        gene_index: List[Gene],
+        copies: Dict[int, List[int]],
+        found: Dict[int, List[_DomainHit]],
+        interpro: Mapping[str, Any],
+        e_filter: Optional[float] = None,
+        p_filter: Optional[float] = None,
+    ) -> None:
+        for target_index, hits in found.items():
+            for hit in hits:
+                # skip hits that would be filtered out anyway
+                if e_filter is not None and not hit.i_evalue < e_filter:
+                    continue
+                if p_filter is not None and not hit.pvalue < p_filter:
+                    continue
+                # extract name and get InterPro metadata about hit
+                accession = self.hmm.relabel(hit.accession)
+                entry = interpro.get(accession)
+                if entry is not None:
+                    go_terms = entry.go_terms
+                    go_functions = entry.go_functions
+                else:
+                    go_terms = []
+                    go_functions = []
+
+                # add the domain to the protein domains of every gene
+                # with this protein sequence
+                for i in copies[target_index]:
+                    # extract qualifiers
+                    qualifiers: Dict[str, List[str]] = {
+                        "inference": ["protein motif"],
+                        "db_xref": ["{}:{}".format(self.hmm.id.upper(), accession)],
+                        "note": [
+                            "e-value: {}".format(hit.i_evalue),
+                            "p-value: {}".format(hit.pvalue),
+                        ],
+                    }
+                    if entry is not None:
+                        qualifiers["function"] = [entry.name]
+                        qualifiers["db_xref"].append("InterPro:{}".format(entry.accession))
+                    gene_index[i].protein.domains.append(
+                        Domain(
+                            accession,
+                            hit.start,
+                            hit.end,
+                            self.hmm.id,
+                            hit.i_evalue,
+                            hit.pvalue,
+                            go_terms=go_terms,
+                            go_functions=go_functions,
+                            qualifiers=qualifiers,
+                        )
+                    )
+
     def run(
         self,
         genes: Iterable[Gene],
         progress: Optional[Callable[[pyhmmer.plan7.HMM, int], None]] = None,
         bit_cutoffs: Optional[str] = None,
+        *,
+        e_filter: Optional[float] = None,
+        p_filter: Optional[float] = None,
+        pool_factory: Optional[Type[Pool]] = None,
     ) -> List[Gene]:
+        """Run annotation on proteins of ``genes`` and update their domains.
+
+        Arguments:
+            genes (iterable of `~gecco.model.Gene`): An iterable that yield
+                genes to annotate with ``self.hmm``.
+            progress (callable, optional): A callback called with each HMM
+                and the total number of HMMs once it has been searched.
+            bit_cutoffs (str, optional): The name of the bitscore cutoffs
+                to use to filter hits, if any.
+
+        Keyword Arguments:
+            e_filter (float, optional): The independent E-value below which
+                domains are kept. Domains with a higher E-value are never
+                created. Give `None` to keep all domains.
+            p_filter (float, optional): The p-value below which domains
+                are kept. Domains with a higher p-value are never created.
+                Give `None` to keep all domains.
+            pool_factory (`type`, optional): The callable for creating
+                pools, such as `multiprocessing.pool.Pool`, to shard the
+                HMMs across the workers of a pool. Each worker searches
+                its HMMs with a single thread, and sends back the domains
+                found as flat arrays, which are merged in HMM order. Give
+                `None` to search all HMMs with the threads of ``pyhmmer``.
+
+        Returns:
+            `list` of `~gecco.model.Gene`: The genes given in argument,
+            with their proteins updated with the domains found.
+
+        """
         # collect genes and keep them in original order
         gene_index = list(genes)
 
-        # convert proteins to Easel sequences, namind them after
-        # their location in the original input to ignore any duplicate
-        # protein identifiers
+        # with a fixed library size, the domains of a protein do not depend
+        # on the other proteins, so identical proteins only need to be
+        # searched once
+        deduplicate = self.hmm.size is not None
+
+        # reuse proteins already stored in digital form
         esl_abc = pyhmmer.easel.Alphabet.amino()
-        esl_sqs = [
-            pyhmmer.easel.TextSequence(
-                name=str(i).encode(),
-                sequence=str(gene.protein.seq)
-            ).digitize(esl_abc)
-            for i, gene in enumerate(gene_index)
-        ]
+        def digitize(gene: Gene) -> pyhmmer.easel.DigitalSequence:
+            esl_sq = gene.protein.digital_seq
+            if esl_sq is None or esl_sq.alphabet != esl_abc:
+                esl_sq = pyhmmer.easel.TextSequence(sequence=str(gene.protein.seq)).digitize(esl_abc)
+            return esl_sq
+
+        # record the genes of each search target, identified by the index
+        # of the first gene with their sequence, keeping the sequences
+        # digitized to compute their digest until they are searched
+        copies: Dict[int, List[int]] = {}
+        digests: Dict[int, bytes] = {}
+        digitized: Dict[int, pyhmmer.easel.DigitalSequence] = {}
+        targets: Dict[bytes, int] = {}
+        for i, gene in enumerate(gene_index):
+            if deduplicate:
+                esl_sq = digitize(gene)
+                digest = hashlib.sha256(esl_sq.sequence).digest()
+                target_index = targets.setdefault(digest, i)
+                if target_index != i:
+                    copies[target_index].append(i)
+                    continue
+                digests[i] = digest
+                digitized[i] = esl_sq
+            copies[i] = [i]
+        del targets
+
+        # Load InterPro metadata for the annotation, only decoding
+        # the entries of the domains that were found
+        interpro = InterPro.load_index()
 
         with contextlib.ExitStack() as ctx:
-            # decompress the input if needed
-            file: BinaryIO = ctx.enter_context(open(self.hmm.path, "rb"))
-            if self.hmm.path.endswith(".gz"):
-                file = ctx.enter_context(gzip.GzipFile(fileobj=file, mode="rb"))  # type: ignore
-            # Only retain the HMMs which are in the whitelist
-            hmm_file = ctx.enter_context(pyhmmer.plan7.HMMFile(file))
-            profiles = (
-                hmm
-                for hmm in hmm_file
-                if hmm.accession is None
-                or self.hmm.relabel(hmm.accession.decode()) in self.whitelist
-            )
-            # Run search pipeline using the filtered HMMs
-            cpus = 0 if self.cpus is None else self.cpus
-            hmms_hits = hmmsearch(
-                profiles,
-                esl_sqs,
-                cpus=cpus,
-                callback=progress, # type: ignore
-                Z=self.hmm.size,  # type: ignore
-                domZ=self.hmm.size, # type: ignore
-                bit_cutoffs=bit_cutoffs,  # type: ignore
-            )
-
-            # Load InterPro metadata for the annotation
-            interpro = InterPro.load()
-
-            # Transcribe HMMER hits to GECCO model
-            for hits in hmms_hits:
-                for hit in hits.reported:
-                    target_index = int(hit.name)
-                    for domain in hit.domains.reported:
-                        # extract name and get InterPro metadata about hit
-                        raw_acc = domain.alignment.hmm_accession or domain.alignment.hmm_name
-                        accession = self.hmm.relabel(raw_acc.decode('utf-8'))
-                        entry = interpro.by_accession.get(accession)
-
-                        # extract coordinates
-                        start = domain.alignment.target_from
-                        end = domain.alignment.target_to
-
-                        # extract qualifiers and GO terms
-                        qualifiers: Dict[str, List[str]] = {
-                            "inference": ["protein motif"],
-                            "db_xref": ["{}:{}".format(self.hmm.id.upper(), accession)],
-                            "note": [
-                                "e-value: {}".format(domain.i_evalue),
-                                "p-value: {}".format(domain.pvalue),
-                            ],
-                        }
-                        if entry is not None:
-                            qualifiers["function"] = [entry.name]
-                            qualifiers["db_xref"].append("InterPro:{}".format(entry.accession))
-                            go_terms = entry.go_terms
-                            go_functions = entry.go_functions
-                        else:
-                            go_terms = []
-                            go_functions = []
-
-                        # add the domain to the protein domains of the right gene
-                        assert domain.env_from < domain.env_to
-                        assert domain.i_evalue >= 0
-                        assert domain.pvalue >= 0
-                        gene_index[target_index].protein.domains.append(
-                            Domain(
-                                accession,
-                                start,
-                                end,
-                                self.hmm.id,
-                                domain.i_evalue,
-                                domain.pvalue,
-                                go_terms=go_terms,
-                                go_functions=go_functions,
-                                qualifiers=qualifiers,
-                            )
-                        )
+            # Reuse the domains of proteins already annotated in a previous
+            # run, and only search the remaining ones, only pressing the
+            # optimized profiles if they are searched in this process
+            folder = None if self.cache_dir is None else self._cache_folder(press=pool_factory is None)
+            cache = None if folder is None else self._open_domain_cache(folder)
+            missing: Iterable[int] = copies.keys()
+            if cache is not None:
+                ctx.callback(cache.close)
+                cached = cache.get(bit_cutoffs, list(digests.values()))
+                found = {i: cached[digest] for i, digest in digests.items() if digest in cached}
+                self._transcribe(gene_index, copies, found, interpro, e_filter, p_filter)
+                missing = [i for i in copies if i not in found]
+                for i in found:
+                    del digitized[i]
+                del cached, found
+
+            # Search the remaining proteins block by block, reporting
+            # progress only for the last block
+            profiles: Optional[Iterable[Any]] = None
+            blocks = list(self._blocks(gene_index, missing))
+            for block_index, block in enumerate(blocks):
+                if not block:
+                    continue
+                # convert proteins to Easel sequences, naming them after the
+                # index of their target, and only renaming them if needed so
+                # that proteins prepared with `digitize_proteins` are never
+                # modified and can be searched by several annotators
+                esl_sqs = pyhmmer.easel.DigitalSequenceBlock(esl_abc)
+                seen = set()
+                for i in block:
+                    esl_sq = digitized.pop(i, None)
+                    if esl_sq is None:
+                        esl_sq = digitize(gene_index[i])
+                    if id(esl_sq) in seen:
+                        esl_sq = esl_sq.copy()
+                    seen.add(id(esl_sq))
+                    name = str(i).encode()
+                    if esl_sq.name != name:
+                        esl_sq.name = name
+                    esl_sqs.append(esl_sq)
+                # Load the optimized profiles from the cache if possible,
+                # otherwise only retain the HMMs which are in the whitelist,
+                # keeping them in memory if there are several blocks
+                if profiles is None:
+                    # optimized profiles cannot be sent to other processes
+                    # and fall back to the library if the cache is unreadable
+                    if folder is not None and pool_factory is None:
+                        try:
+                            profiles = self._load_optimized_profiles(folder)
+                        except OSError:
+                            pass
+                    if profiles is None:
+                        profiles = self._load_hmms(ctx)
+                    if len(blocks) > 1:
+                        profiles = list(profiles)
+                # Run search pipeline using the filtered HMMs, in the
+                # direction that is the fastest for the given input, or
+                # sharding the HMMs across the workers of a pool
+                cpus = 0 if self.cpus is None else self.cpus
+                callback = progress if block_index == len(blocks) - 1 else None
+                if pool_factory is not None:
+                    domains = self._search_sharded(profiles, esl_sqs, cpus, pool_factory, callback, bit_cutoffs)
+                elif self._select_strategy(len(esl_sqs), cpus) == "scan":
+                    domains = self._scan(profiles, esl_sqs, cpus, callback, bit_cutoffs)
+                else:
+                    domains = self._search(profiles, esl_sqs, cpus, callback, bit_cutoffs)
+                # Record the domains of each searched protein, including the
+                # proteins without any domains so that they can be cached
+                found = {i: [] for i in block}
+                for target_index, domain_hit in domains:
+                    found[target_index].append(domain_hit)
+                if cache is not None:
+                    try:
+                        cache.put(bit_cutoffs, ((digests[i], found[i]) for i in block))
+                    except sqlite3.Error:
+                        pass  # read-only cache entry, only use it for reading
+                # Transcribe HMMER hits to GECCO model, and release them
+                self._transcribe(gene_index, copies, found, interpro, e_filter, p_filter)
+                del esl_sqs, domains, found
 
         # return the updated list of genes that was given in argument
         return gene_index
 
 
+def digitize_proteins(genes: Iterable[Gene]) -> List[Gene]:
+    """Convert the proteins of ``genes`` to digital sequences.
+
+    The returned genes can be annotated by several `PyHMMER` instances,
+    even concurrently, without converting their proteins again. Proteins
+    already in digital form are copied, so that the genes given in
+    argument are never modified.
+
+    Arguments:
+        genes (iterable of `~gecco.model.Gene`): An iterable that yield
+            the genes to convert.
+
+    Returns:
+        `list` of `~gecco.model.Gene`: The genes, with their proteins
+        stored in digital form.
+
+    """
+    esl_abc = pyhmmer.easel.Alphabet.amino()
+    digitized = []
+    for i, gene in enumerate(genes):
+        # digitize proteins that are not already, and copy the others
+        # so that every gene can be named after its index without
+        # renaming the sequences of the caller
+        esl_sq = gene.protein.digital_seq
+        if esl_sq is None or esl_sq.alphabet != esl_abc:
+            esl_sq = pyhmmer.easel.TextSequence(sequence=str(gene.protein.seq)).digitize(esl_abc)
+        else:
+            esl_sq = esl_sq.copy()
+        esl_sq.name = str(i).encode()
+        digitized.append(gene.with_protein(gene.protein.with_seq(esl_sq)))
+    return digitized
+
+
 def embedded_hmms() -> Iterator[HMM]:
     """Iterate over the embedded HMMs that are shipped with GECCO.
     """
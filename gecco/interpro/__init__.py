@@ -1,10 +1,18 @@
 """Simple data classes to expose embedded InterPro data.
 """
 
+import atexit
+import contextlib
+import functools
 import gzip
 import json
+import os
+import pathlib
+import sqlite3
+import threading
 from dataclasses import dataclass, field, fields
-from typing import Dict, List, Optional
+from types import TracebackType
+from typing import Dict, Iterator, List, Mapping, Optional, Type
 
 try:
     import importlib.resources as importlib_resources
@@ -12,7 +20,7 @@ except ImportError:
     import importlib_resources  # type: ignore
 
 
-__all__ = ["InterProEntry", "InterPro", "GeneOntologyTerm"]
+__all__ = ["InterProEntry", "InterPro", "InterProIndex", "GeneOntologyTerm"]
 
 
 
@@ -52,6 +60,134 @@ class InterProEntry:
     go_functions: List[GOTerm]
 
 
+class InterProIndex(Mapping[str, InterProEntry]):
+    """A compact index of InterPro entries by member accession.
+
+    Entries are stored in an SQLite database, and only decoded when they
+    are looked up for the first time. The database is opened on first
+    use, once in each process, since SQLite connections cannot be shared
+    with a forked process.
+
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open the index stored at the given ``path``.
+        """
+        self._uri = "{}?mode=ro&immutable=1".format(pathlib.Path(path).resolve().as_uri())
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._members: Dict[str, Optional[InterProEntry]] = {}
+        self._entries: Dict[str, InterProEntry] = {}
+        self._terms: Dict[int, GOTerm] = {}
+
+    def __enter__(self) -> "InterProIndex":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # the connection and the lock of the parent process may have been
+        # in use when the process was forked, so never reuse them
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._connection = None
+        with self._lock:
+            if self._connection is None:
+                self._connection = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+            yield self._connection
+
+    def close(self) -> None:
+        """Close the database of the index.
+
+        Looking up entries that were not decoded yet opens the database
+        again.
+
+        """
+        if self._pid == os.getpid():
+            with self._lock:
+                if self._connection is not None:
+                    self._connection.close()
+                    self._connection = None
+
+    def __getitem__(self, member: str) -> InterProEntry:
+        try:
+            entry = self._members[member]
+        except KeyError:
+            with self._connect() as connection:
+                row = connection.execute(
+                    """
+                    SELECT entries.*
+                    FROM members JOIN entries ON members.entry = entries.accession
+                    WHERE members.member = ?
+                    """,
+                    (member,)
+                ).fetchone()
+            entry = self._members[member] = None if row is None else self._decode(row)
+        if entry is None:
+            raise KeyError(member)
+        return entry
+
+    def __iter__(self) -> Iterator[str]:
+        with self._connect() as connection:
+            members = connection.execute("SELECT member FROM members").fetchall()
+        return (member for member, in members)
+
+    def __len__(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+
+    def _decode(self, row: tuple) -> InterProEntry:
+        accession, name, type, members, databases, go_terms, go_functions = row
+        # share the entry between all its members
+        entry = self._entries.get(accession)
+        if entry is None:
+            entry = self._entries[accession] = InterProEntry(
+                accession=accession,
+                members=members.split("\t"),
+                name=name,
+                databases=databases.split("\t") if databases else [],
+                type=type,
+                go_terms=self._decode_terms(go_terms),
+                go_functions=self._decode_terms(go_functions),
+            )
+        return entry
+
+    def _decode_terms(self, ids: str) -> List[GOTerm]:
+        # GO terms are stored once, and referenced by entries by their id
+        keys = [int(x) for x in ids.split(",")] if ids else []
+        missing = [key for key in keys if key not in self._terms]
+        if missing:
+            query = "SELECT * FROM go_terms WHERE id IN ({})".format(", ".join("?" for _ in missing))
+            with self._connect() as connection:
+                rows = connection.execute(query, missing).fetchall()
+            for key, accession, name, namespace in rows:
+                self._terms[key] = GOTerm(accession, name, namespace)
+        return [self._terms[key] for key in keys]
+
+
+@functools.lru_cache(maxsize=None)
+def _load_index() -> Mapping[str, InterProEntry]:
+    ctx = importlib_resources.path(__name__, "interpro.db")
+    path = ctx.__enter__()
+    atexit.register(ctx.__exit__, None, None, None)
+    # the index is only built by `setup.py update_interpro`, so fall back
+    # to the JSON metadata if it is missing
+    if not os.path.exists(path):
+        return InterPro.load().by_accession
+    index = InterProIndex(os.fspath(path))
+    atexit.register(index.close)
+    return index
+
+
 @dataclass
 class InterPro:
     """A subset of the InterPro database exposing domain metadata.
@@ -81,3 +217,92 @@ class InterPro:
                     InterProEntry(**raw_entry, go_terms=go_terms, go_functions=go_functions)
                 )
         return cls(entries)
+
+    @classmethod
+    def load_index(cls) -> Mapping[str, InterProEntry]:
+        """Load the embedded InterPro metadata as a lazy index.
+
+        Contrary to `InterPro.load`, the entries are only decoded when they
+        are looked up. The index is loaded once, and shared by all the
+        callers, including forked processes, which open the database
+        again on first use.
+
+        Returns:
+            `~collections.abc.Mapping`: A mapping of member accessions to
+            the InterPro entries they belong to.
+
+        """
+        return _load_index()
+
+    def write_index(self, path: str) -> None:
+        """Write the entries to an index that can be opened lazily.
+
+        Arguments:
+            path (`str`): The path where to write the SQLite database.
+
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        with contextlib.closing(sqlite3.connect(path)) as connection:
+            with connection:
+                connection.execute(
+                    """
+                    CREATE TABLE go_terms (
+                        id INTEGER PRIMARY KEY,
+                        accession TEXT NOT NULL,
+                        name TEXT NOT NULL,
+                        namespace TEXT NOT NULL
+                    )
+                    """
+                )
+                connection.execute(
+                    """
+                    CREATE TABLE entries (
+                        accession TEXT PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        type TEXT NOT NULL,
+                        members TEXT NOT NULL,
+                        databases TEXT NOT NULL,
+                        go_terms TEXT NOT NULL,
+                        go_functions TEXT NOT NULL
+                    ) WITHOUT ROWID
+                    """
+                )
+                connection.execute(
+                    """
+                    CREATE TABLE members (
+                        member TEXT PRIMARY KEY,
+                        entry TEXT NOT NULL
+                    ) WITHOUT ROWID
+                    """
+                )
+                # store every GO term once, and reference them by id
+                terms: Dict[GOTerm, int] = {}
+                def encode_terms(go_terms: List[GOTerm]) -> str:
+                    for term in go_terms:
+                        if term not in terms:
+                            terms[term] = len(terms)
+                            connection.execute(
+                                "INSERT INTO go_terms VALUES (?, ?, ?, ?)",
+                                (terms[term], term.accession, term.name, term.namespace),
+                            )
+                    return ",".join(str(terms[term]) for term in go_terms)
+                for entry in self.entries:
+                    connection.execute(
+                        "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            entry.accession,
+                            entry.name,
+                            entry.type,
+                            "\t".join(entry.members),
+                            "\t".join(entry.databases),
+                            encode_terms(entry.go_terms),
+                            encode_terms(entry.go_functions),
+                        )
+                    )
+                    # later entries take precedence, like in `by_accession`
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO members VALUES (?, ?)",
+                        ((member, entry.accession) for member in entry.members)
+                    )
+            connection.execute("VACUUM")
@@ -28,11 +28,18 @@ from Bio.Seq import Seq
 from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation, Reference
 from Bio.SeqRecord import SeqRecord
 
+from pyhmmer.easel import DigitalSequence
+
 from . import __version__
 from .interpro import GOTerm
 from ._base import Dumpable, Table
 from ._meta import patch_locale
 
+try:
+    from Bio.Seq import SequenceDataAbstractBaseClass
+except ImportError:  # Biopython < 1.79
+    SequenceDataAbstractBaseClass = None
+
 if typing.TYPE_CHECKING:
     from numpy.typing import NDArray
 
@@ -197,6 +204,39 @@ class Domain:
         return SeqFeature(location=loc, type="misc_feature", qualifiers=qualifiers)
 
 
+class _DigitalSequenceData(SequenceDataAbstractBaseClass or object):  # type: ignore
+    """Sequence data stored in an Easel digital sequence.
+
+    Used by `Protein` to keep a protein sequence in digital form, so that it
+    can be passed to `pyhmmer` without conversion. Residues are only decoded
+    when accessed through the `~Bio.Seq.Seq` interface.
+    """
+
+    __slots__ = ("sequence",)
+
+    def __init__(self, sequence: DigitalSequence) -> None:
+        self.sequence = sequence
+        super().__init__()
+
+    def __len__(self) -> int:
+        return len(self.sequence)
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[int, bytes]:
+        alphabet = self.sequence.alphabet
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self.sequence))
+            if step != 1:
+                return self[:][key]
+            if start >= stop:
+                return b""
+            return alphabet.decode(self.sequence.sequence[start:stop]).encode("ascii")
+        return ord(alphabet.symbols[self.sequence.sequence[key]])
+
+    def __reduce__(self) -> typing.Tuple[type, typing.Tuple[bytes]]:
+        # Easel sequences cannot be pickled, so send the decoded sequence
+        return bytes, (bytes(self),)
+
+
 @dataclass(frozen=True)
 class Protein:
     """A sequence of amino-acids translated from a gene.
@@ -204,6 +244,9 @@ class Protein:
     Attributes:
         id (`str`): The identifier of the protein.
         seq (`~Bio.Seq.Seq`): The sequence of amino-acids of this protein.
+            A `~pyhmmer.easel.DigitalSequence` can be given instead to store
+            the sequence in digital form, which is then shared with
+            `~gecco.hmmer.PyHMMER` rather than converted for every search.
         domains (`list` of `~gecco.model.Domain`): A list of domains found
             in the protein sequence.
 
@@ -213,6 +256,22 @@ class Protein:
     seq: Seq
     domains: List[Domain] = field(default_factory=list)
 
+    def __post_init__(self) -> None:
+        # wrap digital sequences so that they can be used as a `Seq`
+        if isinstance(self.seq, DigitalSequence):
+            if SequenceDataAbstractBaseClass is None:
+                seq = Seq(self.seq.textize().sequence)
+            else:
+                seq = Seq(_DigitalSequenceData(self.seq))
+            object.__setattr__(self, "seq", seq)
+
+    @property
+    def digital_seq(self) -> Optional[DigitalSequence]:
+        """`~pyhmmer.easel.DigitalSequence` or `None`: The protein sequence in digital form, if available.
+        """
+        data = getattr(self.seq, "_data", None)
+        return data.sequence if isinstance(data, _DigitalSequenceData) else None
+
     def to_seq_record(self) -> SeqRecord:
         """Convert the protein to a single record.
         """
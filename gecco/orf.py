@@ -2,25 +2,40 @@
 """
 
 import abc
+import collections
+import contextlib
+import hashlib
 import io
 import itertools
+import math
+import mmap
 import os
+import pickle
 import queue
 import tempfile
 import typing
+import urllib.parse
+import warnings
+from array import array
 from multiprocessing.pool import Pool, ThreadPool
 from multiprocessing.sharedctypes import Value
-from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Type, Union
+from typing import BinaryIO, Callable, Container, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Type, Union
 
 import Bio.SeqIO
+import pyhmmer
 import pyrodigal
 from Bio.Seq import Seq
+from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation
 from Bio.SeqRecord import SeqRecord
 
+from ._meta import make_shareable
 from .model import Gene, Protein, Strand
 
 
-__all__ = ["ORFFinder", "PyrodigalFinder"]
+__all__ = ["ORFFinder", "PyrodigalFinder", "CDSFinder", "GFFFinder"]
+
+if typing.TYPE_CHECKING:
+    _T = typing.TypeVar("_T")
 
 
 class ORFFinder(metaclass=abc.ABCMeta):
@@ -38,6 +53,116 @@ class ORFFinder(metaclass=abc.ABCMeta):
         return NotImplemented
 
 
+class _Window(typing.NamedTuple):
+    """A window of a contig in which to call genes independently.
+
+    Windows of a contig all have the same size (except the last one) and
+    are spaced regularly, so that the window where a gene is called the
+    furthest from the window edges can be found from coordinates only.
+    """
+
+    index: int
+    start: int
+    end: int
+    size: int
+    step: int
+    length: int
+
+    def _margin(self, start: int, begin: int, end: int) -> float:
+        # distance of the gene from the window edges, ignoring contig edges
+        stop = min(start + self.size, self.length)
+        left = begin - start if start > 0 else math.inf
+        right = stop - end if stop < self.length else math.inf
+        return min(left, right)
+
+    def owns(self, begin: int, end: int) -> bool:
+        """Check whether a gene found in this window should be reported.
+
+        Arguments:
+            begin (`int`): The 0-based start coordinate of the gene.
+            end (`int`): The 0-based exclusive end coordinate of the gene.
+
+        """
+        first = max(0, -((self.size - end) // self.step))
+        last = min(begin // self.step, max(0, -((self.size - self.length) // self.step)))
+        best = max(
+            range(first, last + 1),
+            key=lambda j: (self._margin(j * self.step, begin, end), -j),
+            default=self.index,
+        )
+        return best == self.index
+
+
+_Orf = Tuple[int, int, int, int, str, bool]
+
+
+def _window_orfs(orfs: pyrodigal.Genes, window: _Window) -> Iterator[_Orf]:
+    for orf in orfs:
+        begin = orf.begin + window.start
+        end = orf.end + window.start
+        # genes running off a window edge inside the contig are always
+        # reported, since the complete gene may not be found in any window
+        truncated = (
+            (orf.partial_begin and window.start > 0)
+            or (orf.partial_end and window.end < window.length)
+        )
+        if truncated or window.owns(begin - 1, end):
+            yield begin, end, orf.strand, orf.translation_table, orf.translate(), truncated
+
+
+# --- Process-based gene calling -----------------------------------------------
+
+# NB: Gene coordinates are sent back from the worker processes as a flat
+#     array with the following fields for each gene, followed by the
+#     concatenated protein translations.
+_ORF_FIELDS = 6   # begin, end, strand, translation table, truncated, protein length
+
+_worker_finder: Optional[pyrodigal.OrfFinder] = None
+_worker_file: Optional[BinaryIO] = None
+_worker_buffer: Optional[mmap.mmap] = None
+
+
+def _init_worker(orf_finder: pyrodigal.OrfFinder, path: str) -> None:
+    global _worker_finder, _worker_file, _worker_buffer
+    _worker_finder = orf_finder
+    _worker_file = open(path, "rb")
+    _worker_buffer = None
+
+
+def _find_genes_in_buffer(span: Tuple[int, _Window]) -> Tuple["array[int]", str]:
+    global _worker_buffer
+    assert _worker_finder is not None and _worker_file is not None
+
+    # map the sequence buffer again if it has grown since the last call
+    offset, window = span
+    if window.end == window.start:
+        orfs = _worker_finder.find_genes(b"")
+    else:
+        if _worker_buffer is None or len(_worker_buffer) < offset + window.end:
+            if _worker_buffer is not None:
+                _worker_buffer.close()
+            _worker_buffer = mmap.mmap(_worker_file.fileno(), 0, access=mmap.ACCESS_READ)
+        with memoryview(_worker_buffer)[offset+window.start:offset+window.end] as view:
+            orfs = _worker_finder.find_genes(view)
+
+    # only send back gene coordinates and translations
+    coordinates = array("q")
+    proteins = []
+    for begin, end, strand, table, protein, truncated in _window_orfs(orfs, window):
+        coordinates.extend((begin, end, strand, table, truncated, len(protein)))
+        proteins.append(protein)
+    return coordinates, "".join(proteins)
+
+
+def _find_genes_in_buffer_batch(
+    batch: List[Tuple[int, int, _Window]],
+) -> List[Tuple[int, int, "array[int]", str]]:
+    return [
+        (index, window.index, *_find_genes_in_buffer((offset, window)))
+        for index, offset, window in batch
+    ]
+
+
 class PyrodigalFinder(ORFFinder):
     """An `ORFFinder` that uses the Pyrodigal bindings to Prodigal.
 
@@ -53,7 +178,22 @@ class PyrodigalFinder(ORFFinder):
 
     """
 
-    def __init__(self, metagenome: bool = True, mask: bool = False, cpus: int = 0) -> None:
+    # the number of batches to create for each CPU when batching tasks
+    _BATCHES_PER_CPU = 16
+
+    def __init__(
+        self,
+        metagenome: bool = True,
+        mask: bool = False,
+        cpus: int = 0,
+        *,
+        training_info: Optional[pyrodigal.TrainingInfo] = None,
+        training_cache: Optional[str] = None,
+        window_size: Optional[int] = None,
+        window_overlap: int = 50000,
+        longest_first: bool = False,
+        digitize: bool = False,
+    ) -> None:
         """Create a new `PyrodigalFinder` instance.
 
         Arguments:
@@ -64,12 +204,60 @@ class PyrodigalFinder(ORFFinder):
             cpus (int): The number of threads to use to run Pyrodigal in
                 parallel. Pass ``0`` to use the number of CPUs on the machine.
 
+        Keyword Arguments:
+            training_info (`~pyrodigal.TrainingInfo`, optional): A training
+                info to use in single mode instead of training on the
+                input records.
+            training_cache (`str`, optional): The path to a folder where to
+                store the training info obtained in single mode, so that
+                it can be reused for inputs with the same sequence content.
+                Ignored in metagenome mode, which uses pre-trained models.
+            window_size (`int`, optional): The size of the windows in which
+                to split contigs longer than ``window_size`` nucleotides, so
+                that genes of a single contig can be called in parallel.
+                Pass `None` to always process contigs as a whole.
+            window_overlap (`int`): The length of the overlap between two
+                consecutive windows. Genes found in several windows are
+                only reported from the window where they are the furthest
+                from the edges. Genes longer than the overlap may not be
+                found complete in any window, and genes are called again
+                around them, so this should be longer than most genes
+                expected in the input.
+            longest_first (`bool`): Whether to process the longest contigs
+                (or windows) first, and to batch the shortest ones together,
+                in order to balance the load between workers. Genes are
+                still returned in the order of the input records, but only
+                once all the records have been loaded and sorted, so this
+                is disabled by default to stream the genes of large inputs.
+            digitize (`bool`): Whether to store the protein sequences in
+                digital form, so that they can be passed to
+                `~gecco.hmmer.PyHMMER` without conversion.
+
+        Note:
+            Calling genes in windows is an approximation, since Prodigal
+            will score each window independently (and in metagenome mode,
+            may select a different bin for each window). Results are
+            deterministic, but may differ slightly from calling genes in
+            the whole contig.
+
         """
         super().__init__()
+        if training_info is not None and metagenome:
+            raise ValueError("cannot use a training info in metagenome mode")
+        if window_size is not None and window_overlap >= window_size:
+            raise ValueError("Window overlap must be smaller than `window_size`")
+        if window_overlap < 0:
+            raise ValueError("Window overlap must be positive")
         self.metagenome = metagenome
         self.mask = mask
         self.cpus = cpus
-        self.orf_finder =  pyrodigal.OrfFinder(meta=metagenome, mask=mask)
+        self.training_info = training_info
+        self.training_cache = training_cache
+        self.window_size = window_size
+        self.window_overlap = window_overlap
+        self.longest_first = longest_first
+        self.digitize = digitize
+        self.orf_finder = pyrodigal.OrfFinder(training_info, meta=metagenome, mask=mask)
 
     def _train(self, records: Iterable[SeqRecord]) -> pyrodigal.TrainingInfo:
         sequences = []
@@ -79,17 +267,232 @@ class PyrodigalFinder(ORFFinder):
             sequences.append(str(record.seq))
         if len(sequences) > 1:
             sequences.append("TTAATTAATTAA")
-        return self.orf_finder.train("".join(sequences))
+        sequence = "".join(sequences)
+
+        # train directly if no cache is used
+        if self.training_cache is None:
+            return self.orf_finder.train(sequence)
 
-    def _process_record(self, record: SeqRecord) -> Tuple[SeqRecord, pyrodigal.Genes]:
-        return record, self.orf_finder.find_genes(str(record.seq))
+        # reuse the training info if the same sequences were trained on before
+        hasher = hashlib.md5(pyrodigal.__version__.encode())
+        hasher.update(sequence.encode())
+        cache_path = os.path.join(self.training_cache, f"{hasher.hexdigest()}.pkl")
+        try:
+            with open(cache_path, "rb") as src:
+                training_info: pyrodigal.TrainingInfo = pickle.load(src)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # missing, unreadable or corrupted entries are trained again
+            pass
+        else:
+            self.orf_finder = pyrodigal.OrfFinder(training_info, meta=False, mask=self.mask)
+            return training_info
+
+        # train and record the training info, writing to a temporary file
+        # first so that concurrent runs never read a partial file, and
+        # giving it the default permissions so that the cache can be shared
+        training_info = self.orf_finder.train(sequence)
+        try:
+            os.makedirs(self.training_cache, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.training_cache, delete=False) as dst:
+                try:
+                    pickle.dump(training_info, dst, protocol=4)
+                    dst.close()
+                    make_shareable(dst.name)
+                    os.replace(dst.name, cache_path)
+                except BaseException:
+                    os.remove(dst.name)
+                    raise
+        except OSError:
+            # the training info is still valid if the cache is read-only
+            warnings.warn(f"Failed to write training info to cache {self.training_cache!r}")
+        return training_info
+
+    def _windows(self, length: int) -> List[_Window]:
+        if self.window_size is None or length <= self.window_size:
+            return [_Window(0, 0, length, length, length or 1, length)]
+        windows = []
+        step = self.window_size - self.window_overlap
+        for index, start in enumerate(range(0, length, step)):
+            end = min(start + self.window_size, length)
+            windows.append(_Window(index, start, end, self.window_size, step, length))
+            if end == length:
+                break
+        return windows
+
+    def _batches(self, tasks: Iterable["_T"], cpus: int, length: Callable[["_T"], int]) -> Iterable[List["_T"]]:
+        # process tasks in the order they were given
+        if not self.longest_first:
+            return ([task] for task in tasks)
+        # sort tasks by decreasing length, and group the smallest tasks
+        # together so that each batch is worth at least a fraction of the
+        # total work, which reduces the dispatch overhead for tiny contigs
+        sorted_tasks = sorted(tasks, key=length, reverse=True)
+        target = sum(map(length, sorted_tasks)) / (cpus * self._BATCHES_PER_CPU)
+        batches = []
+        batch: List["_T"] = []
+        batch_length = 0
+        for task in sorted_tasks:
+            batch.append(task)
+            batch_length += length(task)
+            if batch_length >= target:
+                batches.append(batch)
+                batch = []
+                batch_length = 0
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _merge_windows(
+        self,
+        results: Iterable[List[Tuple[int, int, List[_Orf]]]],
+        registry: Dict[int, Tuple[SeqRecord, int]],
+    ) -> Iterator[Tuple[SeqRecord, List[_Orf]]]:
+        # buffer results until all the windows of the next record in the
+        # input order have been processed
+        pending: Dict[int, Dict[int, List[_Orf]]] = collections.defaultdict(dict)
+        next_index = 0
+        for batch in results:
+            for index, window_index, orfs in batch:
+                pending[index][window_index] = orfs
+            while next_index in pending and len(pending[next_index]) == registry[next_index][1]:
+                windows = pending.pop(next_index)
+                record, _ = registry.pop(next_index)
+                orfs = [orf for k in sorted(windows) for orf in windows[k]]
+                yield record, self._recall_truncated(record, orfs)
+                next_index += 1
+
+    def _recall_truncated(self, record: SeqRecord, orfs: List[_Orf]) -> List[_Orf]:
+        # genes truncated at a window edge are usually found complete in
+        # another window, in which case they overlap a complete gene on
+        # the same strand for most of their length
+        complete = [orf for orf in orfs if not orf[5]]
+        def covered(piece: _Orf) -> bool:
+            return any(
+                orf[2] == piece[2]
+                and 2 * (min(orf[1], piece[1]) - max(orf[0], piece[0]) + 1) >= piece[1] - piece[0] + 1
+                for orf in complete
+            )
+        pieces = sorted(orf for orf in orfs if orf[5] and not covered(orf))
+        if not pieces:
+            return complete
+        # otherwise the gene is longer than the window overlap, so call
+        # genes again in a region spanning the truncated genes
+        spans: List[List[int]] = []
+        for begin, end, *_ in pieces:
+            if spans and begin <= spans[-1][1]:
+                spans[-1][1] = max(spans[-1][1], end)
+            else:
+                spans.append([begin, end])
+        length = len(record.seq)
+        for low, high in spans:
+            # extend the region until no gene is truncated at its edges
+            padding = self.window_overlap
+            while True:
+                start = max(0, low - 1 - padding)
+                end = min(length, high + padding)
+                recalled = []
+                truncated = False
+                for orf in self.orf_finder.find_genes(str(record.seq[start:end])):
+                    begin, stop = orf.begin + start, orf.end + start
+                    if begin <= high and stop >= low:
+                        truncated |= (orf.partial_begin and start > 0) or (orf.partial_end and end < length)
+                        recalled.append((begin, stop, orf.strand, orf.translation_table, orf.translate(), False))
+                if not truncated:
+                    break
+                padding = 2 * padding + high - low + 1
+            # replace the genes in the region, and the complete genes
+            # sharing a stop codon with a gene called again
+            stops = {(orf[2], orf[1] if orf[2] > 0 else orf[0]) for orf in recalled}
+            complete = [
+                orf for orf in complete
+                if (orf[1] < low or orf[0] > high)
+                and (orf[2], orf[1] if orf[2] > 0 else orf[0]) not in stops
+            ]
+            complete.extend(recalled)
+        complete.sort(key=lambda orf: (orf[0], orf[1]))
+        return complete
+
+    def _process_windows(
+        self,
+        batch: List[Tuple[int, SeqRecord, _Window]],
+    ) -> List[Tuple[int, int, List[_Orf]]]:
+        results = []
+        for index, record, window in batch:
+            orfs = self.orf_finder.find_genes(str(record.seq[window.start:window.end]))
+            results.append((index, window.index, list(_window_orfs(orfs, window))))
+        return results
+
+    def _find_orfs_pooled(
+        self,
+        records: Iterable[SeqRecord],
+        pool: Pool,
+        cpus: int,
+    ) -> Iterator[Tuple[SeqRecord, List[_Orf]]]:
+        # records being processed, with the number of windows they were split into
+        registry: Dict[int, Tuple[SeqRecord, int]] = {}
+
+        def tasks() -> Iterator[Tuple[int, SeqRecord, _Window]]:
+            for index, record in enumerate(records):
+                windows = self._windows(len(record.seq))
+                registry[index] = (record, len(windows))
+                for window in windows:
+                    yield index, record, window
+
+        batches = self._batches(tasks(), cpus, lambda task: task[2].end - task[2].start)
+        results = pool.imap_unordered(self._process_windows, batches)
+        yield from self._merge_windows(results, registry)
+
+    def _find_orfs_shared(
+        self,
+        records: Iterable[SeqRecord],
+        pool_factory: Callable[..., Pool],
+        cpus: int,
+    ) -> Iterator[Tuple[SeqRecord, List[_Orf]]]:
+        # records being processed, with the number of windows they were split into
+        registry: Dict[int, Tuple[SeqRecord, int]] = {}
+
+        with tempfile.NamedTemporaryFile(prefix="gecco", suffix=".seq") as buffer:
+            # write contig sequences to the buffer shared with the workers,
+            # so that only their location has to be sent to the pool
+            def tasks() -> Iterator[Tuple[int, int, _Window]]:
+                offset = 0
+                for index, record in enumerate(records):
+                    data = str(record.seq).encode("ascii")
+                    buffer.write(data)
+                    buffer.flush()
+                    windows = self._windows(len(data))
+                    registry[index] = (record, len(windows))
+                    for window in windows:
+                        yield index, offset, window
+                    offset += len(data)
+
+            # decode the gene coordinates sent back by the workers
+            def decode(
+                batch: List[Tuple[int, int, "array[int]", str]]
+            ) -> List[Tuple[int, int, List[_Orf]]]:
+                results = []
+                for index, window_index, coordinates, proteins in batch:
+                    orfs = []
+                    position = 0
+                    for i in range(0, len(coordinates), _ORF_FIELDS):
+                        begin, end, strand, table, truncated, length = coordinates[i:i+_ORF_FIELDS]
+                        orfs.append((begin, end, strand, table, proteins[position:position+length], bool(truncated)))
+                        position += length
+                    results.append((index, window_index, orfs))
+                return results
+
+            initargs = (self.orf_finder, buffer.name)
+            with pool_factory(cpus, initializer=_init_worker, initargs=initargs) as pool:
+                batches = self._batches(tasks(), cpus, lambda task: task[2].end - task[2].start)
+                results = pool.imap_unordered(_find_genes_in_buffer_batch, batches)
+                yield from self._merge_windows(map(decode, results), registry)
 
     def find_genes(
         self,
         records: Iterable[SeqRecord],
         progress: Optional[Callable[[SeqRecord, int], None]] = None,
         *,
-        pool_factory: Union[Type[Pool], Callable[[Optional[int]], Pool]] = ThreadPool,
+        pool_factory: Union[Type[Pool], Callable[..., Pool]] = ThreadPool,
     ) -> Iterator[Gene]:
         """Find all genes contained in a sequence of DNA records.
 
@@ -105,7 +508,12 @@ class PyrodigalFinder(ORFFinder):
         Keyword Arguments:
             pool_factory (`type`): The callable for creating pools, defaults
                 to the `multiprocessing.pool.ThreadPool` class, but
-                `multiprocessing.pool.Pool` is also supported.
+                `multiprocessing.pool.Pool` is also supported. When given
+                anything else than a thread pool class, the pools are
+                expected to run in separate processes: contig sequences
+                are then shared with the workers through a memory-mapped
+                buffer, and only gene coordinates and translations are
+                sent back.
 
         Yields:
             `~gecco.model.Gene`: An iterator over all the genes found in
@@ -113,36 +521,242 @@ class PyrodigalFinder(ORFFinder):
 
         """
         # detect the number of CPUs
-        _cpus = self.cpus if self.cpus > 0 else os.cpu_count()
+        _cpus = self.cpus if self.cpus > 0 else (os.cpu_count() or 1)
         _progress = (lambda x,y: None) if progress is None else progress
 
         # train first if needed
-        if not self.metagenome:
+        if not self.metagenome and self.training_info is None:
             records = list(records)
             self._train(records)
 
-        # run in parallel using a pool
-        with pool_factory(_cpus) as pool:
-            for record, orfs in pool.imap(self._process_record, records):
+        # run in parallel using a pool, avoiding to copy the records
+        # to the workers if they run in separate processes
+        with contextlib.ExitStack() as ctx:
+            if not (isinstance(pool_factory, type) and issubclass(pool_factory, ThreadPool)):
+                results = self._find_orfs_shared(records, pool_factory, _cpus)
+            else:
+                pool = ctx.enter_context(pool_factory(_cpus))
+                results = self._find_orfs_pooled(records, pool, _cpus)
+            alphabet = pyhmmer.easel.Alphabet.amino()
+            for record, orfs in results:
                 _progress(record, len(orfs))
-                for j, orf in enumerate(orfs):
+                for j, (begin, end, strand, table, translation, _) in enumerate(orfs):
                     # wrap the protein into a Protein object
-                    prot_seq = Seq(orf.translate())
-                    protein = Protein(id=f"{record.id}_{j+1}", seq=prot_seq)
+                    if self.digitize:
+                        seq = pyhmmer.easel.TextSequence(sequence=translation).digitize(alphabet)
+                        protein = Protein(id=f"{record.id}_{j+1}", seq=seq)
+                    else:
+                        protein = Protein(id=f"{record.id}_{j+1}", seq=Seq(translation))
                     # wrap the gene into a Gene
                     yield Gene(
                         source=record,
-                        start=min(orf.begin, orf.end),
-                        end=max(orf.begin, orf.end),
-                        strand=Strand(orf.strand),
+                        start=min(begin, end),
+                        end=max(begin, end),
+                        strand=Strand(strand),
                         protein=protein,
                         qualifiers={
                             "inference": [f"ab initio prediction:Pyrodigal:{pyrodigal.__version__}"],
-                            "transl_table": [str(orf.translation_table)],
+                            "transl_table": [str(table)],
                         }
                     )
 
 
+# --- Lightweight INSDC reader -----------------------------------------------
+
+# characters to remove from sequence lines of GenBank and EMBL files
+_SEQUENCE_JUNK = str.maketrans("", "", "0123456789 \t\r\n")
+
+
+def _split_location(text: str) -> List[str]:
+    # split a compound location on the commas outside of parentheses
+    parts = []
+    depth = last = 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(text[last:i])
+            last = i + 1
+    parts.append(text[last:])
+    return parts
+
+
+def _parse_location_parts(text: str) -> List[Tuple[int, int, int]]:
+    if text.startswith("complement(") and text.endswith(")"):
+        parts = _parse_location_parts(text[11:-1])
+        return [(start, end, -strand) for start, end, strand in reversed(parts)]
+    for prefix in ("join(", "order("):
+        if text.startswith(prefix) and text.endswith(")"):
+            inner = text[len(prefix):-1]
+            return [
+                part
+                for sub in _split_location(inner)
+                for part in _parse_location_parts(sub)
+            ]
+    if ":" in text:
+        raise ValueError(f"Unsupported remote location: {text!r}")
+    text = text.replace("<", "").replace(">", "")
+    if ".." in text:
+        start, _, end = text.partition("..")
+        return [(int(start) - 1, int(end), 1)]
+    elif "^" in text:
+        start, _, end = text.partition("^")
+        return [(int(start), int(start), 1)]
+    else:
+        return [(int(text) - 1, int(text), 1)]
+
+
+def _parse_location(text: str) -> Union[FeatureLocation, CompoundLocation]:
+    """Parse an INSDC feature location string into a Biopython location.
+    """
+    parts = [
+        FeatureLocation(start, end, strand=strand)
+        for start, end, strand in _parse_location_parts(text.replace(" ", ""))
+    ]
+    if len(parts) == 1:
+        return parts[0]
+    return CompoundLocation(parts)
+
+
+def _parse_qualifiers(lines: List[str], keep: Container[str]) -> Dict[str, List[str]]:
+    qualifiers: Dict[str, List[str]] = {}
+    for line in lines:
+        key, _, value = line[1:].partition("=")
+        if key not in keep:
+            continue
+        if value.startswith('"'):
+            value = value[1:-1] if value.endswith('"') else value[1:]
+            value = value.replace('""', '"')
+        qualifiers.setdefault(key, []).append(value)
+    return qualifiers
+
+
+def _make_feature(
+    feature_type: str,
+    location: List[str],
+    qualifiers: List[str],
+    keep: Container[str],
+) -> SeqFeature:
+    return SeqFeature(
+        location=_parse_location("".join(location)),
+        type=feature_type,
+        qualifiers=_parse_qualifiers(qualifiers, keep),
+    )
+
+
+def _read_insdc(
+    handle: TextIO,
+    format: str,
+    feature_type: str,
+    keep: Container[str],
+) -> Iterator[SeqRecord]:
+    """Read GenBank or EMBL records, keeping only features of one type.
+
+    Only the record identifiers, the sequence, and the features of the
+    given type with the requested qualifiers are extracted. Every other
+    annotation is skipped without being parsed.
+
+    """
+    embl = format == "embl"
+    feature_prefix = "FT   " if embl else "     "
+    readline = handle.readline
+
+    name = accession = version = None
+    topology = "linear"
+    description: List[str] = []
+    sequence: List[str] = []
+    features: List[SeqFeature] = []
+
+    line = readline()
+    while line:
+        if embl:
+            tag, data = line[:2], line[5:].rstrip()
+        else:
+            tag, data = line[:12].strip(), line[12:].rstrip()
+
+        if tag == "LOCUS":
+            fields = data.split()
+            name = fields[0]
+            topology = "circular" if "circular" in fields else "linear"
+        elif tag == "ID":
+            fields = [field.strip() for field in data.split(";")]
+            name = fields[0].split()[0]
+            if len(fields) > 1 and fields[1].startswith("SV "):
+                version = f"{name}.{fields[1][3:].strip()}"
+            if len(fields) > 2 and fields[2] in ("linear", "circular"):
+                topology = fields[2]
+        elif tag in ("ACCESSION", "AC"):
+            if accession is None and data:
+                accession = data.split(";")[0].split()[0]
+        elif tag == "VERSION":
+            if data:
+                version = data.split()[0]
+        elif tag in ("DEFINITION", "DE"):
+            description.append(data)
+            line = readline()
+            while line.startswith("DE   " if embl else "            "):
+                description.append(line[5:].strip() if embl else line.strip())
+                line = readline()
+            continue
+        elif tag in ("FEATURES", "FH"):
+            # skip the feature table header
+            line = readline()
+            while line.startswith("FH"):
+                line = readline()
+            # read features, only keeping the lines of the requested type
+            location: Optional[List[str]] = None
+            qualifiers: List[str] = []
+            in_quotes = False
+            while line.startswith(feature_prefix):
+                if line[5] != " ":
+                    if location is not None:
+                        features.append(_make_feature(feature_type, location, qualifiers, keep))
+                    if line[5:21].rstrip() == feature_type:
+                        location, qualifiers, in_quotes = [line[21:].strip()], [], False
+                    else:
+                        location = None
+                elif location is not None:
+                    value = line[21:].strip()
+                    if value.startswith("/") and not in_quotes:
+                        qualifiers.append(value)
+                    elif not qualifiers:
+                        location.append(value)
+                    elif qualifiers[-1].startswith("/translation="):
+                        qualifiers[-1] += value
+                    else:
+                        qualifiers[-1] += f" {value}"
+                    in_quotes ^= value.count('"') % 2 == 1
+                line = readline()
+            if location is not None:
+                features.append(_make_feature(feature_type, location, qualifiers, keep))
+            continue
+        elif tag in ("ORIGIN", "SQ"):
+            line = readline()
+            while line and not line.startswith("//"):
+                sequence.append(line)
+                line = readline()
+            continue
+        elif line.startswith("//"):
+            if name is None:
+                raise ValueError(f"Missing {'ID' if embl else 'LOCUS'} line in record")
+            desc = " ".join(description)
+            yield SeqRecord(
+                Seq("".join(sequence).translate(_SEQUENCE_JUNK).upper()),
+                id=version or accession or name,
+                name=accession if embl and accession else name,
+                description=desc[:-1] if desc.endswith(".") else desc,
+                features=features,
+                annotations={"molecule_type": "DNA", "topology": topology},
+            )
+            name = accession = version = None
+            topology = "linear"
+            description, sequence, features = [], [], []
+
+        line = readline()
+
+
 class CDSFinder(ORFFinder):
     """An `ORFFinder` that simply extracts CDS annotations from records.
     """
@@ -157,6 +771,37 @@ class CDSFinder(ORFFinder):
         self.translation_table = translation_table
         self.locus_tag = locus_tag
 
+    def parse(self, handle: TextIO, format: str = "genbank") -> Iterator[SeqRecord]:
+        """Read annotated records from a GenBank or EMBL file.
+
+        This is a faster alternative to `Bio.SeqIO.parse` for the records
+        to pass to `CDSFinder.find_genes`: only the features of the type
+        extracted by this finder are loaded, with the qualifiers required
+        to build genes (locus tag, translation and translation table).
+        Other features, references and annotations are skipped.
+
+        Arguments:
+            handle (`io.TextIOBase`): A text file-like object containing
+                the records to read.
+            format (`str`): The format of the file, either ``genbank``
+                or ``embl``.
+
+        Yields:
+            `~Bio.SeqRecord.SeqRecord`: The records found in the file.
+
+        Raises:
+            `ValueError`: When the format is not supported, or when
+                a record could not be parsed.
+
+        """
+        format = format.lower()
+        if format == "gb":
+            format = "genbank"
+        if format not in ("genbank", "embl"):
+            raise ValueError(f"Unsupported format for annotated records: {format!r}")
+        keep = {self.locus_tag, "translation", "transl_table"}
+        return _read_insdc(handle, format, self.feature, keep)
+
     def find_genes(
         self,
         records: Iterable[SeqRecord],
@@ -196,3 +841,143 @@ class CDSFinder(ORFFinder):
                 )
                 genes_found += 1
             _progress(record, genes_found)
+
+
+class GFFFinder(ORFFinder):
+    """An `ORFFinder` that extracts genes from coordinates in a GFF3 file.
+
+    Genes are extracted from the sequences passed to `GFFFinder.find_genes`,
+    which can be given as a mapping from sequence identifiers to records
+    (such as the index returned by `Bio.SeqIO.index`) so that only the
+    sequences containing genes need to be loaded.
+
+    Attributes:
+        sequence_ids (`list` of `str`): The identifiers of the sequences
+            containing at least one gene, in the order of the GFF file.
+
+    """
+
+    def __init__(
+        self,
+        gff: Union[str, "os.PathLike[str]", TextIO],
+        feature: str = "CDS",
+        translation_table: int = 11,
+        locus_tag: str = "locus_tag",
+    ):
+        """Create a new finder from a GFF3 file.
+
+        Arguments:
+            gff (`str`, `os.PathLike` or file-like object): The path to a
+                GFF3 file, or a file-like object open in text mode.
+            feature (`str`): The type of feature to extract genes from.
+            translation_table (`int`): The translation table to use for
+                genes without a ``transl_table`` attribute.
+            locus_tag (`str`): The attribute to use for naming genes.
+                Genes without such an attribute are named after their
+                sequence.
+
+        Raises:
+            `ValueError`: When the GFF3 file could not be parsed.
+
+        """
+        self.feature = feature
+        self.translation_table = translation_table
+        self.locus_tag = locus_tag
+
+        if isinstance(gff, (str, os.PathLike)):
+            with open(gff) as f:
+                self._features = self._read_features(f)
+        else:
+            self._features = self._read_features(gff)
+        self.sequence_ids = list(self._features)
+
+    def _read_features(self, handle: TextIO) -> Dict[str, List[Tuple[Dict[str, str], List[Tuple[int, int, int, int]]]]]:
+        # group the lines of the requested type by sequence and by
+        # feature ID, since a feature can span several lines in GFF3
+        features: Dict[str, Dict[str, Tuple[Dict[str, str], List[Tuple[int, int, int, int]]]]] = {}
+        for i, line in enumerate(handle):
+            if line.startswith("##FASTA"):
+                break
+            elif line.startswith("#") or not line.strip():
+                continue
+            columns = line.rstrip("\r\n").split("\t")
+            if len(columns) != 9:
+                raise ValueError(f"Invalid GFF3 line {i+1}: expected 9 columns, found {len(columns)}")
+            seqid, _, kind, start, end, _, strand, phase, attributes = columns
+            if kind != self.feature:
+                continue
+            if strand not in ("+", "-"):
+                raise ValueError(f"Invalid GFF3 line {i+1}: unknown strand {strand!r}")
+            attrs = {
+                urllib.parse.unquote(key.strip()): urllib.parse.unquote(value.strip())
+                for key, _, value in (attr.partition("=") for attr in attributes.split(";") if attr.strip())
+            }
+            part = (int(start) - 1, int(end), 1 if strand == "+" else -1, int(phase) if phase.isdigit() else 0)
+            seq_features = features.setdefault(urllib.parse.unquote(seqid), {})
+            key = attrs.get("ID", f"line{i}")
+            seq_features.setdefault(key, (attrs, []))[1].append(part)
+        return {seqid: list(seq_features.values()) for seqid, seq_features in features.items()}
+
+    def find_genes(
+        self,
+        records: Union[Iterable[SeqRecord], typing.Mapping[str, SeqRecord]],
+        progress: Optional[Callable[[SeqRecord, int], None]] = None,
+    ) -> Iterator[Gene]:
+        """Find all genes contained in a sequence of DNA records.
+
+        Arguments:
+            records (iterable or mapping of `~Bio.SeqRecord.SeqRecord`):
+                The DNA records in which to extract genes. If given as a
+                mapping of records indexed by identifier, only the records
+                containing genes are accessed, in the order of the GFF file.
+            progress (callable, optional): A progress callback of signature
+                ``progress(record, total)`` that will be called everytime a
+                record has been processed.
+
+        Raises:
+            `ValueError`: When a sequence referenced in the GFF file cannot
+                be found in the mapping of records, or when a gene
+                identifier is found twice.
+
+        """
+        ids = set()
+        _progress = (lambda x,y: None) if progress is None else progress
+
+        if isinstance(records, typing.Mapping):
+            try:
+                records = [records[seqid] for seqid in self.sequence_ids]
+            except KeyError as err:
+                raise ValueError(f"Sequence {err.args[0]!r} not found in records") from err
+
+        for record in records:
+            genes_found = 0
+            for i, (attributes, parts) in enumerate(self._features.get(record.id, ())):
+                # sort the parts of the feature in transcription order
+                strand = parts[0][2]
+                parts = sorted(parts, reverse=strand == -1)
+                if len(parts) == 1:
+                    loc: Union[FeatureLocation, CompoundLocation] = FeatureLocation(parts[0][0], parts[0][1], strand=strand)
+                else:
+                    loc = CompoundLocation([FeatureLocation(start, end, strand=strand) for start, end, _, _ in parts])
+                # get the gene translation, skipping the bases before the first codon
+                tt = attributes.get("transl_table", self.translation_table)
+                prot_seq = loc.extract(record.seq)[parts[0][3]:].translate(table=tt)
+                # get the gene name
+                if self.locus_tag in attributes:
+                    protein = Protein(id=attributes[self.locus_tag], seq=prot_seq)
+                else:
+                    protein = Protein(id=f"{record.id}_{i+1}", seq=prot_seq)
+                # check IDs are unique
+                if protein.id in ids:
+                    raise ValueError(f"Duplicate gene identifier found in {record.id!r}: {protein.id!r}")
+                ids.add(protein.id)
+                # wrap the gene into a Gene
+                yield Gene(
+                    source=record,
+                    start=loc.start + 1,
+                    end=loc.end,
+                    strand=Strand(strand),
+                    protein=protein,
+                )
+                genes_found += 1
+            _progress(record, genes_found)
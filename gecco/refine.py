@@ -14,7 +14,7 @@ from Bio.SeqRecord import SeqRecord
 from .model import Cluster, Domain, Gene, Protein, Strand
 
 
-__all__ = ["BIO_PFAMS", "GeneGrouper", "ClusterRefiner"]
+__all__ = ["BIO_PFAMS", "GeneGrouper", "ClusterRefiner", "select_neighbourhoods"]
 
 
 # fmt: off
@@ -47,6 +47,41 @@ BIO_PFAMS = frozenset({
 
 
 
+def select_neighbourhoods(
+    genes: List[Gene],
+    threshold: float,
+    distance: int,
+) -> List[bool]:
+    """Select the genes close to a candidate gene cluster.
+
+    Arguments:
+        genes (`list` of `~gecco.model.Gene`): A list of genes with
+            probability annotations estimated by `~gecco.crf.ClusterCRF`,
+            sorted by sequence and coordinates.
+        threshold (`float`): The probability threshold to use to consider
+            a gene to be part of a candidate gene cluster.
+        distance (`int`): The number of genes to select on each side of a
+            candidate gene, on the same sequence.
+
+    Returns:
+        `list` of `bool`: A mask with `True` for every gene that is part
+        of a candidate gene cluster, or at most ``distance`` genes away
+        from one.
+
+    """
+    selected = [False] * len(genes)
+    offset = 0
+    for _, group in itertools.groupby(genes, key=operator.attrgetter("source.id")):
+        sequence = list(group)
+        for i, gene in enumerate(sequence):
+            if gene.average_probability is not None and gene.average_probability > threshold:
+                start = offset + max(0, i - distance)
+                end = offset + min(len(sequence), i + distance + 1)
+                selected[start:end] = [True] * (end - start)
+        offset += len(sequence)
+    return selected
+
+
 class GeneGrouper:
     """A callable to group genes under or over a probability threshold.
 
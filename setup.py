@@ -194,6 +194,11 @@ class update_interpro(setuptools.Command):
         with open(path, "wt") as dest:
             json.dump(entries, dest, sort_keys=True, indent=4)
 
+        # build the compact index used for lookups from the new metadata
+        from gecco.interpro import InterPro
+        self.info("building InterPro index")
+        InterPro.load().write_index(path.replace(".json", ".db"))
+
 
 class update_model(setuptools.Command):
     """A custom command to update the internal CRF model.
@@ -221,20 +226,22 @@ class update_model(setuptools.Command):
         if isinstance(rich, ImportError):
             raise RuntimeError("`rich` is required to run the `update_model` command") from rich
 
-        # Copy the file to the new in-source location and compute its hash.
-        hasher = hashlib.md5()
-        self.info("Copying the trained CRF model to the in-source location")
-        with open(os.path.join(self.model, "model.pkl"), "rb") as src:
-            with open(os.path.join("gecco", "crf", "model.pkl"), "wb") as dst:
-                read = lambda: src.read(io.DEFAULT_BUFFER_SIZE)
-                for chunk in iter(read, b""):
-                    hasher.update(chunk)
-                    dst.write(chunk)
-
-        # Write the hash to the signature file next to the model
-        self.info("Writing the MD5 signature file")
-        with open(os.path.join("gecco", "crf", "model.pkl.md5"), "w") as sig:
-            sig.write(hasher.hexdigest())
+        # Copy the pickled model and its weights archive to the new in-source
+        # location, and compute their hashes.
+        for filename in ["model.pkl", "model.npz"]:
+            hasher = hashlib.md5()
+            self.info(f"Copying the trained CRF {filename!r} to the in-source location")
+            with open(os.path.join(self.model, filename), "rb") as src:
+                with open(os.path.join("gecco", "crf", filename), "wb") as dst:
+                    read = lambda: src.read(io.DEFAULT_BUFFER_SIZE)
+                    for chunk in iter(read, b""):
+                        hasher.update(chunk)
+                        dst.write(chunk)
+
+            # Write the hash to the signature file next to the model
+            self.info("Writing the MD5 signature file")
+            with open(os.path.join("gecco", "crf", f"{filename}.md5"), "w") as sig:
+                sig.write(hasher.hexdigest())
 
         # Update the domain composition table
         self.info("Copying the RF training data to the in-source location")
@@ -1,4 +1,5 @@
 import contextlib
+import copy
 import io
 import os
 import shutil
@@ -10,10 +11,14 @@ from unittest import mock
 import Bio.SeqIO
 from Bio.Seq import Seq
 
+import gecco.cli.commands.annotate
 import gecco.cli.commands.run
-from gecco.model import ClusterTable, FeatureTable
+import gecco.hmmer
+import gecco.orf
+from gecco.model import ClusterTable, FeatureTable, GeneTable
 from gecco.types import TypeClassifier
 from gecco.cli import main
+from gecco.cli._utils import process_pool
 from gecco.cli.commands.run import Run
 
 from ._base import TestCommand
@@ -68,3 +73,168 @@ class TestRun(TestCommand, unittest.TestCase):
         filename = os.path.join(self.tmpdir, "BGC0001866.clusters.tsv") 
         clusters = ClusterTable.load(filename)
         self.assertEqual(len(clusters), 1)
+
+    def test_chunk_size(self):
+        # use several copies of the same contig, in unsorted order
+        source = Bio.SeqIO.read(os.path.join(self.folder, "data", "BGC0001866.fna"), "fasta")
+        sequence = os.path.join(self.tmpdir, "contigs.fna")
+        with open(sequence, "w") as f:
+            for seq_id in ["c", "a", "b"]:
+                f.write(f">{seq_id}\n{source.seq}\n")
+        # use a copy of a small HMM library, so that no index is written
+        # in the test data folder
+        hmm = os.path.join(self.tmpdir, "minipfam.hmm")
+        shutil.copy(os.path.join(self.folder, os.pardir, "test_hmmer", "data", "minipfam.hmm"), hmm)
+
+        # mock domain annotation with the precomputed domains of the contig
+        features = FeatureTable.load(os.path.join(self.folder, "data", "BGC0001866.features.tsv"))
+        domains = {(gene.start, gene.end): gene.protein.domains for gene in features.to_genes()}
+        def _run(self, genes, **kwargs):
+            return [
+                gene.with_protein(gene.protein.with_domains([
+                    copy.copy(domain) for domain in domains.get((gene.start, gene.end), ())
+                ]))
+                for gene in genes
+            ]
+
+        outputs = {}
+        for name, flags in [("whole", []), ("chunked", ["--chunk-size", "1"])]:
+            output = os.path.join(self.tmpdir, name)
+            argv = [
+                "-vv", "run", "--genome", sequence, "--hmm", hmm, "--output", output,
+                "--merge-gbk", "--antismash-sideload", *flags
+            ]
+            with mock.patch.object(gecco.hmmer.PyHMMER, "run", new=_run):
+                with io.StringIO() as stderr:
+                    retcode = main(argv, stream=stderr)
+                    self.assertEqual(retcode, 0, stderr.getvalue())
+            outputs[name] = output
+
+        # make sure chunking did not change the tables
+        for filename in ["contigs.genes.tsv", "contigs.features.tsv", "contigs.clusters.tsv", "contigs.sideload.json"]:
+            with open(os.path.join(outputs["whole"], filename)) as f:
+                expected = f.read()
+            with open(os.path.join(outputs["chunked"], filename)) as f:
+                self.assertMultiLineEqual(f.read(), expected, filename)
+        # make sure the merged clusters are in the same order
+        records = {
+            name: [record.id for record in Bio.SeqIO.parse(os.path.join(output, "contigs.clusters.gbk"), "genbank")]
+            for name, output in outputs.items()
+        }
+        self.assertEqual(records["chunked"], records["whole"])
+        self.assertEqual(records["whole"], ["a_cluster_1", "b_cluster_1", "c_cluster_1"])
+
+    def test_window_size(self):
+        sequence = os.path.join(self.folder, "data", "BGC0001866.fna")
+        hmm = os.path.join(self.tmpdir, "minipfam.hmm")
+        shutil.copy(os.path.join(self.folder, os.pardir, "test_hmmer", "data", "minipfam.hmm"), hmm)
+
+        # record the windows the contig is split into
+        _windows = gecco.orf.PyrodigalFinder._windows
+        windows = []
+        def _record_windows(self, length):
+            split = _windows(self, length)
+            windows.extend(split)
+            return split
+
+        argv = [
+            "-vv", "run", "--genome", sequence, "--hmm", hmm, "--output", self.tmpdir,
+            "--window-size", "10000", "--window-overlap", "3000",
+        ]
+        with mock.patch.object(gecco.orf.PyrodigalFinder, "_windows", new=_record_windows):
+            with io.StringIO() as stderr:
+                retcode = main(argv, stream=stderr)
+                self.assertEqual(retcode, 0, stderr.getvalue())
+
+        # make sure the contig was split and genes were found in every window
+        self.assertEqual(
+            [(window.start, window.end) for window in windows],
+            [(0, 10000), (7000, 17000), (14000, 24000), (21000, 31000), (28000, 33290)],
+        )
+        genes = GeneTable.load(os.path.join(self.tmpdir, "BGC0001866.genes.tsv"))
+        for window in windows:
+            self.assertTrue(any(window.start < start and end <= window.end for start, end in zip(genes.start, genes.end)))
+
+    def test_window_overlap_invalid(self):
+        sequence = os.path.join(self.folder, "data", "BGC0001866.fna")
+        argv = ["run", "--genome", sequence, "--output", self.tmpdir, "--window-size", "1000", "--window-overlap", "1000"]
+        with io.StringIO() as stderr:
+            retcode = main(argv, stream=stderr)
+            self.assertNotEqual(retcode, 0)
+            self.assertIn("--window-overlap", stderr.getvalue())
+
+    def test_orf_workers(self):
+        source = Bio.SeqIO.read(os.path.join(self.folder, "data", "BGC0001866.fna"), "fasta")
+        sequence = os.path.join(self.tmpdir, "contigs.fna")
+        with open(sequence, "w") as f:
+            for seq_id in ["c", "a", "b"]:
+                f.write(f">{seq_id}\n{source.seq}\n")
+        hmm = os.path.join(self.tmpdir, "minipfam.hmm")
+        shutil.copy(os.path.join(self.folder, os.pardir, "test_hmmer", "data", "minipfam.hmm"), hmm)
+
+        tables = {}
+        for kind in ["threads", "processes"]:
+            output = os.path.join(self.tmpdir, kind)
+            argv = [
+                "-vv", "run", "--genome", sequence, "--hmm", hmm, "--output", output,
+                "--jobs", "2", "--orf-workers", kind,
+            ]
+            pool_factory = mock.Mock(wraps=process_pool)
+            with mock.patch.object(gecco.cli.commands.annotate, "process_pool", new=pool_factory):
+                with io.StringIO() as stderr:
+                    retcode = main(argv, stream=stderr)
+                    self.assertEqual(retcode, 0, stderr.getvalue())
+            self.assertEqual(pool_factory.called, kind == "processes")
+            with open(os.path.join(output, "contigs.genes.tsv")) as f:
+                tables[kind] = f.read()
+
+        # make sure the genes are the same whatever the workers
+        self.assertMultiLineEqual(tables["processes"], tables["threads"])
+
+    def test_screen(self):
+        source = Bio.SeqIO.read(os.path.join(self.folder, "data", "BGC0001866.fna"), "fasta")
+        sequence = os.path.join(self.tmpdir, "contigs.fna")
+        with open(sequence, "w") as f:
+            for seq_id in ["c", "a", "b"]:
+                f.write(f">{seq_id}\n{source.seq}\n")
+        hmm = os.path.join(self.tmpdir, "minipfam.hmm")
+        shutil.copy(os.path.join(self.folder, os.pardir, "test_hmmer", "data", "minipfam.hmm"), hmm)
+
+        # mock domain annotation with the precomputed domains of the contig,
+        # only keeping the domains in the whitelist of the annotator
+        features = FeatureTable.load(os.path.join(self.folder, "data", "BGC0001866.features.tsv"))
+        domains = {(gene.start, gene.end): gene.protein.domains for gene in features.to_genes()}
+        whitelists = []
+        def _run(self, genes, **kwargs):
+            whitelists.append(self.whitelist)
+            return [
+                gene.with_protein(gene.protein.with_domains([
+                    copy.copy(domain)
+                    for domain in domains.get((gene.start, gene.end), ())
+                    if domain.name in self.whitelist
+                ]))
+                for gene in genes
+            ]
+
+        outputs = {}
+        for name, flags in [("full", []), ("screen", ["--screen", "10", "--screen-threshold", "0.1"])]:
+            output = os.path.join(self.tmpdir, name)
+            argv = ["-vv", "run", "--genome", sequence, "--hmm", hmm, "--output", output, *flags]
+            with mock.patch.object(gecco.hmmer.PyHMMER, "run", new=_run):
+                with io.StringIO() as stderr:
+                    retcode = main(argv, stream=stderr)
+                    self.assertEqual(retcode, 0, stderr.getvalue())
+            outputs[name] = output
+
+        # make sure the genes were screened with 10 features before being
+        # annotated with every feature
+        self.assertEqual(len(whitelists), 3)
+        self.assertEqual(len(whitelists[1]), 10)
+        self.assertEqual(whitelists[2], whitelists[0])
+        # make sure the genes of the clusters were annotated with every
+        # feature, giving the same clusters as without screening
+        for filename in ["contigs.features.tsv", "contigs.clusters.tsv"]:
+            with open(os.path.join(outputs["full"], filename)) as f:
+                expected = f.read()
+            with open(os.path.join(outputs["screen"], filename)) as f:
+                self.assertMultiLineEqual(f.read(), expected, filename)
@@ -1,15 +1,20 @@
 """Test `gecco.crf` members.
 """
 
+import hashlib
 import itertools
 import os
+import tempfile
 import unittest
 import warnings
 from unittest import mock
 
 import Bio.SeqIO
+import numpy
 from gecco.crf import ClusterCRF
 from gecco.crf.select import fisher_significance
+from gecco.model import Domain, FeatureTable, GeneTable
+from gecco.refine import ClusterRefiner, select_neighbourhoods
 
 
 class TestClusterCRF(unittest.TestCase):
@@ -73,3 +78,97 @@ class TestClusterCRF(unittest.TestCase):
         marginals = crf.predict_marginals(pred_data)
         self.assertEqual(len(marginals), 1)
         self.assertEqual(marginals.p_pred.mean(), 0.5)
+
+    def test_trained_format(self):
+        self.assertRaises(ValueError, ClusterCRF.trained, format="nope")
+        crf = ClusterCRF.trained()
+        self.assertIs(crf.model, None)
+        self.assertRaises(ValueError, crf.predict_probabilities, [], backend="crfsuite")
+        self.assertIsNot(ClusterCRF.trained(format="pickle").model, None)
+
+    def test_save_npz(self):
+        crf = ClusterCRF.trained(format="pickle")
+        with tempfile.TemporaryDirectory() as folder:
+            crf.save(folder)
+            with mock.patch("gecco.crf.hashlib.md5", wraps=hashlib.md5) as md5:
+                loaded = ClusterCRF.trained(folder)
+                ClusterCRF.trained(folder)
+            # the archive is only checked against its signature once
+            self.assertEqual(md5.call_count, 1)
+            self.assertIs(loaded.model, None)
+            self.assertEqual(loaded.feature_type, crf.feature_type)
+            self.assertEqual(loaded.window_size, crf.window_size)
+            self.assertEqual(loaded.window_step, crf.window_step)
+            self.assertEqual(loaded.significant_features, crf.significant_features)
+            self.assertEqual(loaded.significance, crf.significance)
+            self.assertEqual(loaded.screening_features(100), crf.screening_features(100))
+            expected, actual = crf._linear_chain(), loaded._linear_chain()
+            self.assertEqual(actual.labels, expected.labels)
+            self.assertEqual(actual.attributes, expected.attributes)
+            numpy.testing.assert_array_equal(actual.state_weights, expected.state_weights)
+            numpy.testing.assert_array_equal(actual.transition_weights, expected.transition_weights)
+            # a modified archive is checked again, and rejected
+            with open(os.path.join(folder, "model.npz"), "ab") as f:
+                f.write(b"\0")
+            self.assertRaises(ValueError, ClusterCRF.trained, folder)
+
+    def test_screening_features(self):
+        crf = ClusterCRF.trained(format="pickle")
+        features = crf.screening_features(10)
+        self.assertEqual(len(features), 10)
+        weights = [crf.model.state_features_[name, "1"] for name in features]
+        self.assertEqual(weights, sorted(weights, reverse=True))
+        self.assertGreater(min(weights), 0)
+        self.assertEqual(crf.screening_features(5), features[:5])
+
+    def test_screening_recall(self):
+        # load the test genomes annotated with every feature
+        folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), "test_cli", "data")
+        base = os.path.join(folder, "mibig-2.0.proG2")
+        with open(f"{base}.genes.tsv", "rb") as f:
+            genes = {gene.id: gene for gene in GeneTable.load(f).to_genes()}
+        with open(f"{base}.features.tsv", "rb") as f:
+            features = FeatureTable.load(f)
+        for i in range(len(features)):
+            if features.pvalue[i] < 1e-9:
+                genes[features.protein_id[i]].protein.domains.append(Domain(
+                    features.domain[i],
+                    features.domain_start[i],
+                    features.domain_end[i],
+                    features.hmm[i],
+                    features.i_evalue[i],
+                    features.pvalue[i],
+                ))
+
+        crf = ClusterCRF.trained()
+        refiner = ClusterRefiner(threshold=0.8, n_cds=3)
+        def cluster_genes(genes):
+            predicted = crf.predict_probabilities(genes)
+            clusters = itertools.chain.from_iterable(
+                refiner.iter_clusters(list(group))
+                for _, group in itertools.groupby(predicted, key=lambda g: g.source.id)
+            )
+            return {gene.id for cluster in clusters for gene in cluster.genes}
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            # predict clusters with every feature
+            expected = cluster_genes(genes.values())
+            # screen with the high-weight features, then use every feature
+            # for the genes close to the candidate regions
+            selected = set(crf.screening_features(400))
+            screened = crf.predict_probabilities(
+                gene.with_protein(gene.protein.with_domains([
+                    domain for domain in gene.protein.domains
+                    if domain.name in selected
+                ]))
+                for gene in genes.values()
+            )
+            mask = select_neighbourhoods(screened, 0.3, 20)
+            actual = cluster_genes(
+                genes[gene.id] if candidate else gene
+                for gene, candidate in zip(screened, mask)
+            )
+
+        self.assertLess(sum(mask), len(genes) * 0.5)
+        self.assertGreaterEqual(len(expected & actual), len(expected) * 0.95)
@@ -0,0 +1,213 @@
+"""Test `gecco.crf.inference` members.
+"""
+
+import collections
+import copy
+import itertools
+import multiprocessing.pool
+import os
+import unittest
+import warnings
+from unittest import mock
+
+import numpy
+
+from gecco.crf import ClusterCRF
+from gecco.crf.inference import LinearChainCRF
+from gecco.model import Domain, FeatureTable, GeneTable
+
+
+class TestLinearChainCRF(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.crf = ClusterCRF.trained(format="pickle")
+        cls.model = LinearChainCRF.from_crfsuite(cls.crf.model)
+
+    def test_from_crfsuite(self):
+        # `state_features_` only stores the weights with 6 decimal places
+        for (name, label), weight in self.crf.model.state_features_.items():
+            i = self.model.attributes[name]
+            j = self.model.labels.index(label)
+            self.assertAlmostEqual(self.model.state_weights[i, j], weight, places=6)
+        for (prev, next), weight in self.crf.model.transition_features_.items():
+            i = self.model.labels.index(prev)
+            j = self.model.labels.index(next)
+            self.assertAlmostEqual(self.model.transition_weights[i, j], weight, places=6)
+
+    def test_marginals_bruteforce(self):
+        model = LinearChainCRF(
+            ["0", "1"],
+            ["A", "B"],
+            numpy.array([[0.5, -1.0], [-2.0, 3.0]]),
+            numpy.array([[1.5, -0.5], [-1.0, 2.0]]),
+        )
+        features = [{"A": True}, {"B": True}, {}, {"A": True, "B": True}]
+        scores = model.state_scores(features)
+        # enumerate all label sequences to compute the exact marginals
+        expected = numpy.zeros(scores.shape)
+        for path in itertools.product(range(2), repeat=len(features)):
+            weight = sum(scores[t, y] for t, y in enumerate(path))
+            weight += sum(model.transition_weights[x, y] for x, y in zip(path, path[1:]))
+            for t, y in enumerate(path):
+                expected[t, y] += numpy.exp(weight)
+        expected /= expected.sum(axis=1, keepdims=True)
+        marginals = model.marginals(scores[None])[0]
+        numpy.testing.assert_allclose(marginals, expected, rtol=1e-12)
+
+    def test_marginals_crfsuite(self):
+        features = self.crf.screening_features(100)
+        window = [{name: True} for name in features[::5]] + [{}, {"unknown": True}]
+        expected = [p["1"] for p in self.crf.model.predict_marginals_single(window)]
+        marginals = self.model.marginals(self.model.state_scores(window)[None])[0]
+        column = self.model.labels.index("1")
+        numpy.testing.assert_allclose(marginals[:, column], expected, rtol=1e-9)
+
+    def test_pruned(self):
+        model = LinearChainCRF(
+            ["0", "1"],
+            ["A", "B", "C"],
+            numpy.array([[0.5, -1.0], [0.0, 0.0], [0.0, 3.0]]),
+            numpy.array([[1.5, -0.5], [-1.0, 2.0]]),
+        )
+        pruned = model.pruned()
+        self.assertEqual(list(pruned.attributes), ["A", "C"])
+        numpy.testing.assert_array_equal(pruned.state_weights, [[0.5, -1.0], [0.0, 3.0]])
+        features = [{"A": True}, {"B": True}, {"C": True}]
+        numpy.testing.assert_array_equal(
+            pruned.marginals(pruned.state_scores(features)[None]),
+            model.marginals(model.state_scores(features)[None]),
+        )
+
+    def test_sliding_marginals(self):
+        features = self.crf.screening_features(100)
+        sequences = [
+            [{name: True} for name in features[i::7]] + [{}]
+            for i in range(3)
+        ]
+        sequences.append(sequences[0][:3])
+        column = self.model.labels.index("1")
+        for window_size, window_step in [(5, 1), (5, 2), (1, 1)]:
+            # compute the marginals of each window independently
+            expected = []
+            for sequence in sequences:
+                scores = self.model.state_scores(sequence)
+                maxima = numpy.zeros(len(sequence))
+                for start in range(0, len(sequence) - window_size + 1, window_step):
+                    window = scores[start:start+window_size]
+                    marginals = self.model.marginals(window[None])[0, :, column]
+                    numpy.maximum(maxima[start:start+window_size], marginals, out=maxima[start:start+window_size])
+                expected.append(maxima)
+            actual = self.model.sliding_marginals(sequences, "1", window_size, window_step, batch_size=3)
+            self.assertEqual(len(actual), len(expected))
+            for a, e in zip(actual, expected):
+                numpy.testing.assert_allclose(a, e, rtol=1e-12)
+
+    def test_sliding_marginals_empty(self):
+        self.assertEqual(self.model.sliding_marginals([], "1", 5, 1), [])
+        actual = self.model.sliding_marginals([[{}, {}]], "1", 5, 1)
+        self.assertEqual(len(actual), 1)
+        numpy.testing.assert_array_equal(actual[0], [0.0, 0.0])
+
+    def test_sliding_marginals_cache(self):
+        features = self.crf.screening_features(100)
+        sequences = [[{name: True} for name in features[i::7]] + [{}] * 6 for i in range(3)]
+        total = sum(len(s) - 4 for s in sequences)
+        expected = self.model.sliding_marginals(sequences, "1", 5, 1, cache=False)
+        LinearChainCRF.clear_cache()
+        def computed(model, sequences, batch_size=4096):
+            # count the windows whose marginals are actually computed
+            with mock.patch.object(LinearChainCRF, "_window_marginals", autospec=True, side_effect=LinearChainCRF._window_marginals) as m:
+                calls = []
+                actual = model.sliding_marginals(sequences, "1", 5, 1, batch_size=batch_size, progress=lambda i, t: calls.append((i, t)))
+            self.assertEqual(calls[0], (0, total))
+            self.assertEqual(calls[-1], (total, total))
+            return actual, sum(len(call.args[2]) for call in m.call_args_list)
+        # windows with the same features are only computed once, including
+        # across chunks
+        with mock.patch.object(LinearChainCRF, "_KEY_BATCH_SIZE", 8):
+            actual, count = computed(self.model, sequences, batch_size=8)
+        self.assertLess(count, total)
+        for a, e in zip(actual, expected):
+            numpy.testing.assert_array_equal(a, e)
+        # the cache is shared with other models with the same weights
+        model = LinearChainCRF(
+            self.model.labels,
+            list(self.model.attributes),
+            self.model.state_weights,
+            self.model.transition_weights,
+        )
+        actual, count = computed(model, sequences[::-1])
+        self.assertEqual(count, 0)
+        for a, e in zip(actual, expected[::-1]):
+            numpy.testing.assert_array_equal(a, e)
+        # but not with models with different transitions
+        model.transition_weights = model.transition_weights * 2
+        _, count = computed(model, sequences)
+        self.assertGreater(count, 0)
+
+    def _load_genes(self, count):
+        folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), "test_cli", "data")
+        base = os.path.join(folder, "mibig-2.0.proG2")
+        # only use the genes of the first genomes to keep the tests short
+        with open(f"{base}.genes.tsv", "rb") as f:
+            table = GeneTable.load(f)
+        sequences = sorted(set(table.sequence_id))[:count]
+        genes = {gene.id: gene for gene in table.to_genes() if gene.source.id in sequences}
+        with open(f"{base}.features.tsv", "rb") as f:
+            features = FeatureTable.load(f)
+        for i in range(len(features)):
+            if features.protein_id[i] in genes:
+                genes[features.protein_id[i]].protein.domains.append(Domain(
+                    features.domain[i],
+                    features.domain_start[i],
+                    features.domain_end[i],
+                    features.hmm[i],
+                    features.i_evalue[i],
+                    features.pvalue[i],
+                ))
+        return list(genes.values())
+
+    def test_predict_probabilities(self):
+        genes = self._load_genes(3)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            expected = self.crf.predict_probabilities(genes, backend="crfsuite")
+            actual = self.crf.predict_probabilities(genes, backend="numpy")
+        self.assertEqual([gene.id for gene in actual], [gene.id for gene in expected])
+        numpy.testing.assert_allclose(
+            [gene.average_probability for gene in actual],
+            [gene.average_probability for gene in expected],
+            rtol=1e-9,
+        )
+
+    def test_predict_probabilities_parallel(self):
+        # use the smallest contigs, so that each contig is a separate task
+        genes = self._load_genes(6)
+        counts = collections.Counter(gene.source.id for gene in genes)
+        genes = [gene for gene in genes if counts[gene.source.id] < 1000]
+        crf = copy.copy(self.crf)
+        crf._MIN_TASK_WINDOWS = {"numpy": 200, "crfsuite": 200}
+        for backend in ["numpy", "crfsuite"]:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                expected = crf.predict_probabilities(genes, backend=backend)
+                calls = []
+                actual = crf.predict_probabilities(
+                    genes,
+                    backend=backend,
+                    cpus=2,
+                    pool_factory=multiprocessing.pool.Pool,
+                    progress=lambda i, total: calls.append((i, total)),
+                )
+            self.assertEqual([gene.id for gene in actual], [gene.id for gene in expected])
+            self.assertEqual(
+                [gene.average_probability for gene in actual],
+                [gene.average_probability for gene in expected],
+            )
+            self.assertEqual(calls[0][0], 0)
+            self.assertEqual(calls[-1][0], calls[-1][1])
+            self.assertGreater(len(calls), 2)
+
+    def test_predict_probabilities_backend(self):
+        self.assertRaises(ValueError, self.crf.predict_probabilities, [], backend="nope")
@@ -3,12 +3,17 @@
 
 import copy
 import os
+import shutil
+import stat
+import tempfile
 import unittest
+from multiprocessing.pool import Pool, ThreadPool
 from unittest import mock
 
 import Bio.SeqIO
+from pyhmmer import easel
 from gecco.model import Strand, Protein, Gene
-from gecco.hmmer import PyHMMER, HMM
+from gecco.hmmer import PyHMMER, HMM, digitize_proteins
 
 
 class TestPyHMMER(unittest.TestCase):
@@ -48,3 +53,297 @@ class TestPyHMMER(unittest.TestCase):
         self.assertEqual(pyhmmer.whitelist, {"PF10417"})
         genes = pyhmmer.run(copy.deepcopy(self.genes))
         self.assertEqual(sum(1 for gene in genes if gene.protein.domains), 1)
+
+    def test_digital_proteins(self):
+        # proteins stored in digital form should give the same domains
+        alphabet = easel.Alphabet.amino()
+        genes = [
+            gene.with_protein(Protein(
+                gene.protein.id,
+                easel.TextSequence(sequence=str(gene.protein.seq)).digitize(alphabet),
+            ))
+            for gene in self.genes
+        ]
+        self.assertIsNotNone(genes[0].protein.digital_seq)
+        self.assertEqual(genes[0].protein.seq, self.genes[0].protein.seq)
+        pyhmmer = PyHMMER(self.hmm, 1)
+        expected = pyhmmer.run(copy.deepcopy(self.genes))
+        actual = pyhmmer.run(genes)
+        self.assertEqual(
+            [[domain.name for domain in gene.protein.domains] for gene in actual],
+            [[domain.name for domain in gene.protein.domains] for gene in expected],
+        )
+
+    def test_cache_dir(self):
+        # annotating with cached profiles should give the same domains
+        expected = PyHMMER(self.hmm, 1, whitelist={"PF10417", "PF12574"}).run(copy.deepcopy(self.genes))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for _ in range(2):
+                pyhmmer = PyHMMER(self.hmm, 1, whitelist={"PF10417", "PF12574"}, cache_dir=cache_dir)
+                actual = pyhmmer.run(copy.deepcopy(self.genes))
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+                self.assertEqual(
+                    [[(d.name, d.start, d.end, d.i_evalue) for d in gene.protein.domains] for gene in actual],
+                    [[(d.name, d.start, d.end, d.i_evalue) for d in gene.protein.domains] for gene in expected],
+                )
+            # a different whitelist should use a different cache entry
+            PyHMMER(self.hmm, 1, whitelist={"PF10417"}, cache_dir=cache_dir).run(copy.deepcopy(self.genes))
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_cache_dir_shared(self):
+        # cache entries should be readable by other users, and broken ones
+        # should not prevent annotation
+        hmm = self.hmm._replace(size=None)
+        expected = PyHMMER(hmm, 1, whitelist={"PF10417", "PF12574"}).run(copy.deepcopy(self.genes))
+        mask = os.umask(0)
+        os.umask(mask)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            pyhmmer = PyHMMER(hmm, 1, whitelist={"PF10417", "PF12574"}, cache_dir=cache_dir)
+            folder = pyhmmer._cache_folder()
+            profiles = os.path.join(folder, "profiles")
+            self.assertEqual(stat.S_IMODE(os.stat(folder).st_mode), 0o777 & ~mask)
+            self.assertEqual(stat.S_IMODE(os.stat(profiles).st_mode), 0o777 & ~mask)
+            for name in os.listdir(profiles):
+                self.assertEqual(stat.S_IMODE(os.stat(os.path.join(profiles, name)).st_mode), 0o666 & ~mask)
+            os.remove(os.path.join(profiles, "profiles.h3m"))
+            actual = pyhmmer.run(copy.deepcopy(self.genes))
+            self.assertEqual(
+                [[(d.name, d.start, d.end, d.i_evalue) for d in gene.protein.domains] for gene in actual],
+                [[(d.name, d.start, d.end, d.i_evalue) for d in gene.protein.domains] for gene in expected],
+            )
+
+    def test_index(self):
+        # annotating with an indexed library should give the same domains
+        whitelist = {"PF10417", "PF12574"}
+        expected = PyHMMER(self.hmm, 1, whitelist=whitelist).run(copy.deepcopy(self.genes))
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "minipfam.hmm")
+            shutil.copy(self.hmm.path, path)
+            hmm = self.hmm._replace(path=path)
+            for _ in range(2):
+                actual = PyHMMER(hmm, 1, whitelist=whitelist, index=True).run(copy.deepcopy(self.genes))
+                self.assertTrue(os.path.exists(f"{path}.idx"))
+                self.assertEqual(
+                    [[(d.name, d.start, d.end, d.i_evalue) for d in gene.protein.domains] for gene in actual],
+                    [[(d.name, d.start, d.end, d.i_evalue) for d in gene.protein.domains] for gene in expected],
+                )
+            # an outdated index should be rebuilt
+            with open(path, "ab") as f:
+                f.write(b"\n")
+            PyHMMER(hmm, 1, whitelist=whitelist, index=True).run(copy.deepcopy(self.genes))
+            with open(f"{path}.idx") as f:
+                self.assertIn(str(os.stat(path).st_size), f.readline())
+            # the index should be readable by other users
+            mask = os.umask(0)
+            os.umask(mask)
+            self.assertEqual(stat.S_IMODE(os.stat(f"{path}.idx").st_mode), 0o666 & ~mask)
+            # a truncated or corrupted index should be ignored
+            with open(f"{path}.idx") as f:
+                lines = f.readlines()
+            for contents in (lines[:-1], lines[:-1] + [lines[-1][:5]], ["garbage\n"], lines[:1] + ["x\ty\tz\n"] * 3):
+                with open(f"{path}.idx", "w") as f:
+                    f.writelines(contents)
+                actual = PyHMMER(hmm, 1, whitelist=whitelist, index=True).run(copy.deepcopy(self.genes))
+                self.assertEqual(
+                    [[(d.name, d.start, d.end, d.i_evalue) for d in gene.protein.domains] for gene in actual],
+                    [[(d.name, d.start, d.end, d.i_evalue) for d in gene.protein.domains] for gene in expected],
+                )
+
+    def test_strategy(self):
+        # scanning the proteins should give the same domains as searching
+        search = PyHMMER(self.hmm, 1, strategy="search").run(copy.deepcopy(self.genes), bit_cutoffs="gathering")
+        scan = PyHMMER(self.hmm, 1, strategy="scan").run(copy.deepcopy(self.genes), bit_cutoffs="gathering")
+        self.assertEqual(
+            [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in scan],
+            [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in search],
+        )
+        # progress should be reported for every HMM with both strategies
+        for strategy in ("search", "scan"):
+            progress = mock.MagicMock()
+            PyHMMER(self.hmm, 1, strategy=strategy).run(copy.deepcopy(self.genes), progress=progress)
+            self.assertEqual(progress.call_count, 10)
+        # few proteins should be scanned, many proteins searched
+        pyhmmer = PyHMMER(self.hmm, 1)
+        self.assertEqual(pyhmmer._select_strategy(len(self.genes), 1), "scan")
+        self.assertEqual(pyhmmer._select_strategy(1000, 1), "search")
+        # scanning requires a library size to get the same E-values
+        hmm = self.hmm._replace(size=None)
+        self.assertEqual(PyHMMER(hmm, 1)._select_strategy(len(self.genes), 1), "search")
+        self.assertRaises(ValueError, PyHMMER, hmm, 1, strategy="scan")
+
+    def test_domain_cache(self):
+        # domains of cached proteins should be reused without searching
+        expected = PyHMMER(self.hmm, 1).run(copy.deepcopy(self.genes))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            PyHMMER(self.hmm, 1, cache_dir=cache_dir).run(copy.deepcopy(self.genes[:2]))
+            pyhmmer = PyHMMER(self.hmm, 1, cache_dir=cache_dir, strategy="search")
+            with mock.patch.object(pyhmmer, "_search", wraps=pyhmmer._search) as search:
+                actual = pyhmmer.run(copy.deepcopy(self.genes))
+                self.assertEqual(len(search.call_args[0][1]), len(self.genes) - 2)
+                actual = pyhmmer.run(copy.deepcopy(self.genes))
+                self.assertEqual(search.call_count, 1)
+            self.assertEqual(
+                [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in actual],
+                [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in expected],
+            )
+            # domains found with other bitscore cutoffs should not be reused
+            with mock.patch.object(pyhmmer, "_search", wraps=pyhmmer._search) as search:
+                pyhmmer.run(copy.deepcopy(self.genes), bit_cutoffs="gathering")
+                self.assertEqual(search.call_count, 1)
+
+    def test_deduplicate(self):
+        # identical proteins should be searched once but all annotated
+        expected = PyHMMER(self.hmm, 1).run(copy.deepcopy(self.genes))
+        genes = copy.deepcopy(self.genes) + copy.deepcopy(self.genes)
+        pyhmmer = PyHMMER(self.hmm, 1, strategy="search")
+        with mock.patch.object(pyhmmer, "_search", wraps=pyhmmer._search) as search:
+            actual = pyhmmer.run(genes)
+            self.assertEqual(len(search.call_args[0][1]), len(self.genes))
+        self.assertEqual(
+            [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in actual],
+            [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in expected * 2],
+        )
+        for gene, copied in zip(actual, actual[len(self.genes):]):
+            for domain, copied_domain in zip(gene.protein.domains, copied.protein.domains):
+                self.assertIsNot(domain, copied_domain)
+
+    def test_digitize_once(self):
+        # proteins should only be converted to digital sequences once
+        pyhmmer = PyHMMER(self.hmm, 1)
+        with mock.patch.object(easel, "TextSequence", wraps=easel.TextSequence) as text_sequence:
+            pyhmmer.run(copy.deepcopy(self.genes))
+            self.assertEqual(text_sequence.call_count, len(self.genes))
+
+    def test_digitize_proteins(self):
+        # digitized proteins should be annotated concurrently like
+        # the original proteins, without being renamed
+        whitelists = [{"PF10417"}, {"PF12574"}, None]
+        expected = [
+            PyHMMER(self.hmm, 1, whitelist=whitelist).run(copy.deepcopy(self.genes))
+            for whitelist in whitelists
+        ]
+        genes = digitize_proteins(self.genes)
+        names = [gene.protein.digital_seq.name for gene in genes]
+        self.assertEqual(names, [str(i).encode() for i in range(len(genes))])
+        with ThreadPool(len(whitelists)) as pool:
+            actual = pool.map(
+                lambda whitelist: PyHMMER(self.hmm, 1, whitelist=whitelist).run([
+                    gene.with_protein(gene.protein.with_domains([]))
+                    for gene in genes
+                ]),
+                whitelists,
+            )
+        self.assertEqual([gene.protein.digital_seq.name for gene in genes], names)
+        for expected_genes, actual_genes in zip(expected, actual):
+            self.assertEqual(
+                [[(d.name, d.start, d.end, d.i_evalue) for d in gene.protein.domains] for gene in actual_genes],
+                [[(d.name, d.start, d.end, d.i_evalue) for d in gene.protein.domains] for gene in expected_genes],
+            )
+
+    def test_digitize_proteins_copy(self):
+        # proteins already in digital form should be copied before
+        # being renamed
+        genes = digitize_proteins(self.genes)
+        for gene in genes:
+            gene.protein.digital_seq.name = b"protein"
+        digitized = digitize_proteins(genes)
+        self.assertEqual([gene.protein.digital_seq.name for gene in genes], [b"protein"] * len(genes))
+        self.assertEqual(
+            [gene.protein.digital_seq.name for gene in digitized],
+            [str(i).encode() for i in range(len(genes))],
+        )
+        for gene, copied in zip(genes, digitized):
+            self.assertIsNot(gene.protein.digital_seq, copied.protein.digital_seq)
+            self.assertEqual(gene.protein.digital_seq.sequence, copied.protein.digital_seq.sequence)
+
+    def test_block_size(self):
+        # searching proteins in blocks should give the same domains
+        expected = PyHMMER(self.hmm, 1).run(copy.deepcopy(self.genes))
+        pyhmmer = PyHMMER(self.hmm, 1, strategy="search", block_size=1)
+        progress = mock.MagicMock()
+        with mock.patch.object(pyhmmer, "_search", wraps=pyhmmer._search) as search:
+            actual = pyhmmer.run(copy.deepcopy(self.genes), progress=progress)
+            self.assertEqual(search.call_count, len(self.genes))
+        self.assertEqual(progress.call_count, 10)
+        self.assertEqual(
+            [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in actual],
+            [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in expected],
+        )
+        # without a library size, proteins should be searched together
+        pyhmmer = PyHMMER(self.hmm._replace(size=None), 1, block_size=1)
+        with mock.patch.object(pyhmmer, "_search", wraps=pyhmmer._search) as search:
+            pyhmmer.run(copy.deepcopy(self.genes))
+            self.assertEqual(search.call_count, 1)
+
+    def test_filters(self):
+        # domains failing the filters should never be created
+        genes = PyHMMER(self.hmm, 1).run(copy.deepcopy(self.genes))
+        domains = sorted(d.pvalue for gene in genes for d in gene.protein.domains)
+        p_filter = domains[len(domains) // 2]
+        e_filter = p_filter * self.hmm.size * 10
+        expected = [
+            [
+                (d.name, d.start, d.end, d.i_evalue, d.pvalue)
+                for d in gene.protein.domains
+                if d.pvalue < p_filter and d.i_evalue < e_filter
+            ]
+            for gene in genes
+        ]
+        for cache_dir in (None, tempfile.mkdtemp()):
+            for _ in range(2):
+                pyhmmer = PyHMMER(self.hmm, 1, cache_dir=cache_dir)
+                actual = pyhmmer.run(copy.deepcopy(self.genes), e_filter=e_filter, p_filter=p_filter)
+                self.assertEqual(
+                    [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in actual],
+                    expected,
+                )
+            if cache_dir is not None:
+                shutil.rmtree(cache_dir)
+
+    def test_pool_factory(self):
+        # sharding HMMs across workers should give the same domains
+        for hmm in (self.hmm, self.hmm._replace(size=None)):
+            expected = PyHMMER(hmm, 1).run(copy.deepcopy(self.genes))
+            for pool_factory in (ThreadPool, Pool):
+                progress = mock.MagicMock()
+                actual = PyHMMER(hmm, 3).run(copy.deepcopy(self.genes), progress=progress, pool_factory=pool_factory)
+                self.assertEqual(progress.call_count, 10)
+                self.assertEqual(
+                    [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in actual],
+                    [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in expected],
+                )
+
+    def test_pool_factory_cache_dir(self):
+        # sharding HMMs across workers should reuse the cached domains,
+        # without pressing profiles that the workers cannot use
+        expected = PyHMMER(self.hmm, 1).run(copy.deepcopy(self.genes))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for _ in range(2):
+                pyhmmer = PyHMMER(self.hmm, 2, cache_dir=cache_dir)
+                with mock.patch.object(pyhmmer, "_search_sharded", wraps=pyhmmer._search_sharded) as search:
+                    actual = pyhmmer.run(copy.deepcopy(self.genes), pool_factory=ThreadPool)
+                self.assertEqual(
+                    [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in actual],
+                    [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in expected],
+                )
+            # the second run should only have used the domain cache
+            search.assert_not_called()
+            folder = pyhmmer._cache_folder(press=False)
+            self.assertEqual(os.listdir(folder), ["domains.sqlite"])
+
+    def test_pool_factory_concurrent(self):
+        # concurrent calls sharding HMMs across threads should not share
+        # their sequences
+        subsets = [self.genes[:3], self.genes[3:], self.genes[1:6]] * 3
+        expected = [PyHMMER(self.hmm, 1).run(copy.deepcopy(genes)) for genes in subsets]
+        pyhmmer = PyHMMER(self.hmm, 2)
+        with ThreadPool(len(subsets)) as pool:
+            actual = pool.map(
+                lambda genes: pyhmmer.run(copy.deepcopy(genes), pool_factory=ThreadPool),
+                subsets,
+            )
+        for actual_genes, expected_genes in zip(actual, expected):
+            self.assertEqual(
+                [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in actual_genes],
+                [[(d.name, d.start, d.end, d.i_evalue, d.pvalue) for d in gene.protein.domains] for gene in expected_genes],
+            )
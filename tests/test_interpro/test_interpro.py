@@ -0,0 +1,54 @@
+"""Test `gecco.interpro` module.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from gecco.interpro import InterPro, InterProIndex
+
+
+class TestInterProIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.interpro = InterPro.load()
+
+    def test_write_index(self):
+        # the index should give the same entries as the JSON metadata
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "interpro.db")
+            self.interpro.write_index(path)
+            with InterProIndex(path) as index:
+                self.assertEqual(len(index), len(self.interpro.by_accession))
+                for member in ("PF00051", "PF10417", "cd00108"):
+                    self.assertEqual(index[member], self.interpro.by_accession[member])
+                self.assertIs(index["PF00051"], index["cd00108"])
+                self.assertIs(index.get("PF99999"), None)
+                self.assertRaises(KeyError, index.__getitem__, "PF99999")
+            self.assertIs(index._connection, None)
+
+    def test_connection_per_process(self):
+        # the database should be opened again after a fork, and after
+        # being closed
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "interpro.db")
+            self.interpro.write_index(path)
+            with InterProIndex(path) as index:
+                self.assertEqual(index["PF00051"], self.interpro.by_accession["PF00051"])
+                connection = index._connection
+                with mock.patch("os.getpid", return_value=os.getpid() + 1):
+                    self.assertEqual(index["PF10417"], self.interpro.by_accession["PF10417"])
+                    self.assertIsNot(index._connection, connection)
+                    index.close()
+                    self.assertIs(index._connection, None)
+                    self.assertEqual(len(index), len(self.interpro.by_accession))
+
+    def test_load_index(self):
+        # the embedded index should be up-to-date and loaded only once
+        index = InterPro.load_index()
+        self.assertIs(InterPro.load_index(), index)
+        self.assertEqual(set(index), set(self.interpro.by_accession))
+        for member, entry in self.interpro.by_accession.items():
+            self.assertEqual(index[member], entry)
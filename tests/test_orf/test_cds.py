@@ -1,6 +1,7 @@
 """Test `gecco.orf` module.
 """
 
+import io
 import os
 import unittest
 from unittest import mock
@@ -17,7 +18,8 @@ class TestCDSFinder(unittest.TestCase):
         # - BGC0001737.gbk downloaded from MIBiG:
         # https://mibig.secondarymetabolites.org/repository/BGC0001737/BGC0001737.gbk
         folder = os.path.dirname(os.path.abspath(__file__))
-        cls.genome = Bio.SeqIO.read(os.path.join(folder, "data", "BGC0001377.gbk"), "genbank")
+        cls.path = os.path.join(folder, "data", "BGC0001377.gbk")
+        cls.genome = Bio.SeqIO.read(cls.path, "genbank")
 
     def test_sequence_coordinates(self):
         """Test emitted genes have the protein sequence matching their coordinates.
@@ -34,3 +36,38 @@ class TestCDSFinder(unittest.TestCase):
         finder = CDSFinder()
         genes = list(finder.find_genes([self.genome], progress=progress))
         progress.assert_called_with(self.genome, 32)
+
+    def test_parse_genbank(self):
+        """Test genes extracted from parsed records match Biopython records.
+        """
+        finder = CDSFinder()
+        with open(self.path) as f:
+            records = list(finder.parse(f, "genbank"))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].id, self.genome.id)
+        self.assertEqual(records[0].description, self.genome.description)
+        self.assertEqual(records[0].seq, self.genome.seq)
+        expected = list(finder.find_genes([self.genome]))
+        actual = list(finder.find_genes(records))
+        self.assertEqual(len(actual), len(expected))
+        for gene_actual, gene_expected in zip(actual, expected):
+            self.assertEqual(gene_actual.id, gene_expected.id)
+            self.assertEqual(gene_actual.start, gene_expected.start)
+            self.assertEqual(gene_actual.end, gene_expected.end)
+            self.assertEqual(gene_actual.strand, gene_expected.strand)
+            self.assertEqual(gene_actual.protein.seq, gene_expected.protein.seq)
+
+    def test_parse_embl(self):
+        """Test records can be parsed from EMBL files.
+        """
+        buffer = io.StringIO()
+        Bio.SeqIO.write(self.genome, buffer, "embl")
+        buffer.seek(0)
+        finder = CDSFinder()
+        records = list(finder.parse(buffer, "embl"))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].id, self.genome.id)
+        self.assertEqual(records[0].seq, self.genome.seq)
+        expected = [(gene.start, gene.end, gene.strand) for gene in finder.find_genes([self.genome])]
+        actual = [(gene.start, gene.end, gene.strand) for gene in finder.find_genes(records)]
+        self.assertEqual(actual, expected)
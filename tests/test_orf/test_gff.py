@@ -0,0 +1,62 @@
+"""Test `gecco.orf.GFFFinder` objects.
+"""
+
+import copy
+import io
+import os
+import unittest
+from unittest import mock
+
+import Bio.SeqIO
+from gecco.model import Strand
+from gecco.orf import CDSFinder, GFFFinder
+
+
+class TestGFFFinder(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        folder = os.path.dirname(os.path.abspath(__file__))
+        cls.genome = Bio.SeqIO.read(os.path.join(folder, "data", "BGC0001377.gbk"), "genbank")
+        # build a GFF3 file from the CDS features of the GenBank record
+        lines = ["##gff-version 3"]
+        for i, feature in enumerate(f for f in cls.genome.features if f.type == "CDS"):
+            strand = "+" if feature.location.strand == 1 else "-"
+            start, end = feature.location.start + 1, feature.location.end
+            columns = [cls.genome.id, "test", "CDS", str(start), str(end), ".", strand, "0", f"ID=cds{i}"]
+            lines.append("\t".join(columns))
+        cls.gff = "\n".join(lines)
+
+    def test_find_genes(self):
+        """Test genes extracted from GFF3 coordinates match GenBank features.
+        """
+        # compare to genes translated from the record, like GFF3 genes are
+        record = copy.deepcopy(self.genome)
+        for feature in record.features:
+            feature.qualifiers.pop("translation", None)
+        expected = list(CDSFinder().find_genes([record]))
+        finder = GFFFinder(io.StringIO(self.gff))
+        self.assertEqual(finder.sequence_ids, [self.genome.id])
+        for records in ([self.genome], {self.genome.id: self.genome}):
+            actual = list(finder.find_genes(records))
+            self.assertEqual(len(actual), len(expected))
+            for gene_actual, gene_expected in zip(actual, expected):
+                self.assertEqual(gene_actual.id, gene_expected.id)
+                self.assertEqual(gene_actual.start, gene_expected.start)
+                self.assertEqual(gene_actual.end, gene_expected.end)
+                self.assertEqual(gene_actual.strand, gene_expected.strand)
+                self.assertEqual(gene_actual.protein.seq, gene_expected.protein.seq)
+
+    def test_missing_sequence(self):
+        """Test a sequence missing from the records mapping raises an error.
+        """
+        finder = GFFFinder(io.StringIO(self.gff))
+        self.assertRaises(ValueError, list, finder.find_genes({}))
+
+    def test_progress_callback(self):
+        """Test that the progress callback is called for each record.
+        """
+        progress = mock.MagicMock()
+        finder = GFFFinder(io.StringIO(self.gff))
+        genes = list(finder.find_genes([self.genome], progress=progress))
+        progress.assert_called_with(self.genome, 32)
@@ -1,11 +1,17 @@
 """Test `gecco.orf` module.
 """
 
+import multiprocessing.pool
 import os
+import pickle
+import stat
+import tempfile
 import unittest
+import warnings
 from unittest import mock
 
 import Bio.SeqIO
+import pyrodigal
 from gecco.model import Strand
 from gecco.orf import PyrodigalFinder
 
@@ -62,3 +68,162 @@ class TestPyrodigalFinder(unittest.TestCase):
         finder = PyrodigalFinder(cpus=1)
         genes = list(finder.find_genes([self.genome], progress=progress))
         progress.assert_called_with(self.genome, 10)
+
+    def test_process_pool(self):
+        """Test genes found with a process pool are the same as with threads.
+        """
+        records = [self.genome, self.genome[:5000]]
+        finder = PyrodigalFinder(cpus=2)
+        expected = list(finder.find_genes(records))
+        actual = list(finder.find_genes(records, pool_factory=multiprocessing.pool.Pool))
+        self.assertEqual(len(expected), len(actual))
+        for gene_expected, gene_actual in zip(expected, actual):
+            self.assertEqual(gene_expected.id, gene_actual.id)
+            self.assertEqual(gene_expected.start, gene_actual.start)
+            self.assertEqual(gene_expected.end, gene_actual.end)
+            self.assertEqual(gene_expected.strand, gene_actual.strand)
+            self.assertEqual(gene_expected.protein.seq, gene_actual.protein.seq)
+            self.assertIs(gene_expected.source, gene_actual.source)
+
+    def test_longest_first(self):
+        """Test genes are returned in input order when sorting tasks by length.
+        """
+        records = [self.genome[:3000], self.genome, self.genome[:5000], self.genome[:1000]]
+        for pool_factory in (multiprocessing.pool.ThreadPool, multiprocessing.pool.Pool):
+            expected = list(PyrodigalFinder(cpus=2, longest_first=False).find_genes(records, pool_factory=pool_factory))
+            actual = list(PyrodigalFinder(cpus=2, longest_first=True).find_genes(records, pool_factory=pool_factory))
+            self.assertEqual(
+                [(gene.source.id, gene.start, gene.end, gene.strand) for gene in expected],
+                [(gene.source.id, gene.start, gene.end, gene.strand) for gene in actual],
+            )
+            sources = [gene.source for gene in actual]
+            self.assertEqual(
+                [id(record) for record in records if any(source is record for source in sources)],
+                [id(source) for i, source in enumerate(sources) if i == 0 or source is not sources[i-1]],
+            )
+
+    def test_digitize(self):
+        """Test proteins stored in digital form have the same sequence.
+        """
+        expected = list(PyrodigalFinder(cpus=1).find_genes([self.genome]))
+        actual = list(PyrodigalFinder(cpus=1, digitize=True).find_genes([self.genome]))
+        self.assertEqual(len(actual), len(expected))
+        for gene_expected, gene_actual in zip(expected, actual):
+            self.assertIsNotNone(gene_actual.protein.digital_seq)
+            self.assertEqual(str(gene_actual.protein.seq), str(gene_expected.protein.seq))
+
+    def test_training_cache(self):
+        """Test training info is cached and reused in single mode.
+        """
+        with tempfile.TemporaryDirectory() as cache:
+            finder = PyrodigalFinder(metagenome=False, training_cache=cache)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                expected = list(finder.find_genes([self.genome]))
+            self.assertEqual(len(os.listdir(cache)), 1)
+            # training on a short sequence emits a warning, so if we get
+            # no warning here it means the training info has been reused
+            finder = PyrodigalFinder(metagenome=False, training_cache=cache)
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")
+                actual = list(finder.find_genes([self.genome]))
+            self.assertEqual(
+                [gene.protein.seq for gene in expected],
+                [gene.protein.seq for gene in actual],
+            )
+
+    def test_training_cache_shared(self):
+        """Test cached training info can be read by other users.
+        """
+        with tempfile.TemporaryDirectory() as cache:
+            finder = PyrodigalFinder(metagenome=False, training_cache=cache)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                list(finder.find_genes([self.genome]))
+            entry = os.path.join(cache, os.listdir(cache)[0])
+            mask = os.umask(0)
+            os.umask(mask)
+            self.assertEqual(stat.S_IMODE(os.stat(entry).st_mode), 0o666 & ~mask)
+
+    def test_training_cache_corrupted(self):
+        """Test corrupted training info in the cache is trained again.
+        """
+        with tempfile.TemporaryDirectory() as cache:
+            finder = PyrodigalFinder(metagenome=False, training_cache=cache)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                expected = list(finder.find_genes([self.genome]))
+            entry = os.path.join(cache, os.listdir(cache)[0])
+            for content in (b"", b"not a pickle"):
+                with open(entry, "wb") as f:
+                    f.write(content)
+                finder = PyrodigalFinder(metagenome=False, training_cache=cache)
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    actual = list(finder.find_genes([self.genome]))
+                self.assertEqual(
+                    [gene.protein.seq for gene in expected],
+                    [gene.protein.seq for gene in actual],
+                )
+                # the corrupted entry was replaced with a valid one
+                with open(entry, "rb") as f:
+                    self.assertIsInstance(pickle.load(f), pyrodigal.TrainingInfo)
+
+    def test_training_info(self):
+        """Test a pre-trained training info can be given to skip training.
+        """
+        finder = PyrodigalFinder(metagenome=False)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            expected = list(finder.find_genes([self.genome]))
+        trained = PyrodigalFinder(metagenome=False, training_info=finder.orf_finder.training_info)
+        actual = list(trained.find_genes([self.genome]))
+        self.assertEqual(
+            [gene.protein.seq for gene in expected],
+            [gene.protein.seq for gene in actual],
+        )
+
+    def test_windows(self):
+        """Test genes found in overlapping windows are reconciled in order.
+        """
+        finder = PyrodigalFinder(metagenome=False)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            expected = list(finder.find_genes([self.genome]))
+        training_info = finder.orf_finder.training_info
+        for pool_factory in (multiprocessing.pool.ThreadPool, multiprocessing.pool.Pool):
+            windowed = PyrodigalFinder(
+                metagenome=False,
+                training_info=training_info,
+                window_size=30000,
+                window_overlap=20000,
+                cpus=2,
+            )
+            actual = list(windowed.find_genes([self.genome], pool_factory=pool_factory))
+            self.assertEqual(
+                [(gene.id, gene.start, gene.end, gene.protein.seq) for gene in expected],
+                [(gene.id, gene.start, gene.end, gene.protein.seq) for gene in actual],
+            )
+
+    def test_windows_long_genes(self):
+        """Test genes longer than the window overlap are not truncated.
+        """
+        finder = PyrodigalFinder(metagenome=False)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            expected = list(finder.find_genes([self.genome]))
+        self.assertGreater(max(gene.end - gene.start for gene in expected), 5000)
+        training_info = finder.orf_finder.training_info
+        for pool_factory in (multiprocessing.pool.ThreadPool, multiprocessing.pool.Pool):
+            windowed = PyrodigalFinder(
+                metagenome=False,
+                training_info=training_info,
+                window_size=20000,
+                window_overlap=5000,
+                cpus=2,
+            )
+            actual = list(windowed.find_genes([self.genome], pool_factory=pool_factory))
+            self.assertEqual(
+                [(gene.id, gene.start, gene.end, gene.protein.seq) for gene in expected],
+                [(gene.id, gene.start, gene.end, gene.protein.seq) for gene in actual],
+            )
@@ -0,0 +1,45 @@
+"""Test `gecco.refine.select_neighbourhoods`.
+"""
+
+import unittest
+
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from gecco.model import Gene, Protein, Strand
+from gecco.refine import select_neighbourhoods
+
+
+class TestSelectNeighbourhoods(unittest.TestCase):
+
+    def _make_genes(self, seq_id, probabilities):
+        source = SeqRecord(Seq(""), id=seq_id)
+        return [
+            Gene(
+                source=source,
+                start=i,
+                end=i+1,
+                strand=Strand.Coding,
+                protein=Protein(id=f"{seq_id}_{i+1}", seq=None),
+                _probability=probability,
+            )
+            for i, probability in enumerate(probabilities)
+        ]
+
+    def test_distance(self):
+        genes = self._make_genes("seq1", [0.1, 0.1, 0.1, 0.9, 0.1, 0.1, 0.1])
+        mask = select_neighbourhoods(genes, 0.5, 2)
+        self.assertEqual(mask, [False, True, True, True, True, True, False])
+        mask = select_neighbourhoods(genes, 0.5, 0)
+        self.assertEqual(mask, [False, False, False, True, False, False, False])
+
+    def test_threshold(self):
+        genes = self._make_genes("seq1", [0.1, 0.5, 0.1, None, 0.6])
+        mask = select_neighbourhoods(genes, 0.5, 0)
+        self.assertEqual(mask, [False, False, False, False, True])
+
+    def test_sequences(self):
+        genes = self._make_genes("seq1", [0.1, 0.1, 0.9])
+        genes.extend(self._make_genes("seq2", [0.1, 0.1, 0.1]))
+        mask = select_neighbourhoods(genes, 0.5, 5)
+        self.assertEqual(mask, [True, True, True, False, False, False])